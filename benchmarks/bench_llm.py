@@ -0,0 +1,199 @@
+"""
+Replay the golden corpus through LLMClient and score the parsing per model and prompt version.
+
+Every message of benchmarks/llm_corpus.jsonl goes through get_structured_response()
+exactly as in the bot (keyword routing, ROUTER_MODEL, the extraction prompt). The
+result is scored field by field (type, amount, category, money_type, currency) against
+the expected one, next to p50/p95 latency and completion tokens per second. The prompt
+version is a hash of the prompt templates, so runs before and after a prompt tweak are
+told apart; --results appends each summary to a file and prints every run in it.
+
+    python -m benchmarks.bench_llm --models llama3.1:8b qwen2.5:7b --results bench_llm.jsonl
+    python -m benchmarks.bench_llm --fake          # against benchmarks/fake_ollama.py
+
+--from-recording turns a file written with LLM_RECORD_PATH into corpus candidates
+(the parsed answers as expected results) to be reviewed and added to the corpus.
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from database import DatabaseHandler
+from services.categories import CategoryService
+from services.intent_router import normalize
+from services.llm_client import LLMClient, PROMPT_VERSION
+from services.llm_recorder import LLMRecorder, load_records
+from services.ollama_pool import OllamaPool
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'llm_corpus.jsonl')
+FIELDS = ('type', 'amount', 'category', 'money_type', 'currency')
+
+
+class BenchTransactionService:
+    """A new group: the prompt lists the default categories."""
+
+    def __init__(self):
+        self.db = DatabaseHandler(db_name=':memory:')
+        self.categories = CategoryService(self)
+
+    def db_for(self, group_id):
+        return self.db
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[dict]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def fields_of(item: Dict[str, Any]) -> Dict[str, Any]:
+    """The scored fields of one answer, normalized the way the processors read them."""
+    fields = {'type': str(item.get('type') or '').lower()}
+    if fields['type'] == 'query':
+        return fields
+    try:
+        fields['amount'] = round(abs(float(item.get('amount'))), 2)
+    except (TypeError, ValueError):
+        fields['amount'] = None
+    fields['money_type'] = item.get('money_type')
+    fields['currency'] = str(item.get('currency') or item.get('source_currency') or 'ARS').upper()
+    if fields['type'] != 'exchange':
+        fields['category'] = normalize(str(item.get('category') or '')).strip()
+    return fields
+
+
+def as_items(result: Any) -> List[dict]:
+    if isinstance(result, dict):
+        return [result]
+    if isinstance(result, list):
+        return [item for item in result if isinstance(item, dict)]
+    return []
+
+
+def score(expected: List[dict], result: Any) -> Dict[str, List[int]]:
+    """[correct, total] per field; the answers are matched to the expected items in order."""
+    answers = [fields_of(item) for item in as_items(result)]
+    scores = defaultdict(lambda: [0, 0])
+    for position, item in enumerate(expected):
+        wanted = fields_of(item)
+        got = answers[position] if position < len(answers) else {}
+        for field in FIELDS:
+            if field in wanted:
+                scores[field][0] += int(got.get(field) == wanted[field])
+                scores[field][1] += 1
+    return dict(scores)
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(int(len(ordered) * share + 0.5) - 1, 0)] if ordered else 0.0
+
+
+def run(model: str, corpus: List[dict], hosts: List[str], router_model: Optional[str] = None) -> dict:
+    llm = LLMClient(BenchTransactionService())
+    llm.model = model
+    llm.router_model = router_model
+    # No health probes: a benchmark run is short and should only measure generate calls
+    llm.client = OllamaPool(hosts, health_interval=0)
+    llm.recorder = LLMRecorder()
+    totals = defaultdict(lambda: [0, 0])
+    latencies, exact = [], 0
+    try:
+        for entry in corpus:
+            start = time.perf_counter()
+            result = llm.get_structured_response(entry['message'], group_id=1)
+            latencies.append(time.perf_counter() - start)
+            entry_scores = score(entry['expected'], result)
+            exact += all(correct == total for correct, total in entry_scores.values())
+            for field, (correct, total) in entry_scores.items():
+                totals[field][0] += correct
+                totals[field][1] += total
+    finally:
+        llm.client.close()
+
+    records = llm.recorder.records
+    tokens = sum(record['completion_tokens'] or 0 for record in records)
+    seconds = sum(record['completion_seconds'] or 0 for record in records)
+    return {
+        'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'model': model,
+        'router_model': router_model,
+        'prompt_version': PROMPT_VERSION,
+        'messages': len(corpus),
+        'model_calls': len(records),
+        'accuracy': {field: round(totals[field][0] / totals[field][1], 4) for field in FIELDS if totals[field][1]},
+        'exact': round(exact / len(corpus), 4) if corpus else 0.0,
+        'p50': round(percentile(latencies, 0.5), 4),
+        'p95': round(percentile(latencies, 0.95), 4),
+        'tokens_per_second': round(tokens / seconds, 1) if seconds else None,
+    }
+
+
+def report(summaries: List[dict]) -> None:
+    print(f"{'model':<24} {'prompt':<9} {'n':>4} " + ' '.join(f'{field:>10}' for field in FIELDS)
+          + f" {'exact':>6} {'p50':>8} {'p95':>8} {'tok/s':>7}")
+    for summary in summaries:
+        accuracy = summary['accuracy']
+        print(
+            f"{summary['model']:<24} {summary['prompt_version']:<9} {summary['messages']:>4} "
+            + ' '.join(f"{accuracy[field]:>10.1%}" if field in accuracy else f"{'-':>10}" for field in FIELDS)
+            + f" {summary['exact']:>6.1%} {summary['p50'] * 1000:>6.0f}ms {summary['p95'] * 1000:>6.0f}ms "
+            f"{summary['tokens_per_second'] or 0:>7.1f}"
+        )
+
+
+def corpus_from_recording(path: str) -> List[dict]:
+    """Corpus candidates from recorded extraction calls, one per distinct message."""
+    candidates = {}
+    for record in load_records(path):
+        items = as_items(record.get('parsed'))
+        if items and record['message'] not in candidates:
+            candidates[record['message']] = {
+                'message': record['message'],
+                'expected': [fields_of(item) for item in items],
+            }
+    return list(candidates.values())
+
+
+def main(args) -> None:
+    if args.from_recording:
+        for candidate in corpus_from_recording(args.from_recording):
+            print(json.dumps(candidate, ensure_ascii=False))
+        return
+
+    corpus = load_corpus(args.corpus)
+    server = None
+    hosts = args.hosts or [os.getenv('OLLAMA_HOST') or 'http://localhost:11434']
+    if args.fake:
+        from benchmarks.fake_ollama import FakeOllamaServer
+        server = FakeOllamaServer(corpus, port=args.fake_port, noise=args.noise)
+        server.start_in_thread()
+        hosts = [server.url]
+    try:
+        summaries = [run(model, corpus, hosts, args.router_model) for model in args.models]
+    finally:
+        if server:
+            server.stop_thread()
+
+    if args.results:
+        with open(args.results, 'a', encoding='utf-8') as f:
+            for summary in summaries:
+                f.write(json.dumps(summary) + '\n')
+        summaries = load_records(args.results)
+    report(summaries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=[os.getenv('MODEL') or 'llama3.1:8b'])
+    parser.add_argument('--router-model', default=os.getenv('ROUTER_MODEL') or None)
+    parser.add_argument('--hosts', nargs='+', help='Ollama URLs (default: OLLAMA_HOST)')
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--results', help='append each summary here and report every run in the file')
+    parser.add_argument('--fake', action='store_true', help='run against benchmarks/fake_ollama.py')
+    parser.add_argument('--fake-port', type=int, default=11435)
+    parser.add_argument('--noise', type=float, default=0.0, help='share of wrong categories from the fake server')
+    parser.add_argument('--from-recording', metavar='PATH', help='print corpus candidates from LLM_RECORD_PATH')
+    main(parser.parse_args())
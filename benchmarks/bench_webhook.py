@@ -0,0 +1,95 @@
+"""
+Compare end-to-end update latency between polling and webhook delivery.
+
+Runs against benchmarks/fake_telegram.py, so no network or real token is needed.
+The bot under test echoes each message, which isolates the transport cost
+(Telegram → bot → sendMessage) from LLM and database time.
+
+    python -m benchmarks.bench_webhook --updates 200
+"""
+import argparse
+import asyncio
+import statistics
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+from benchmarks.fake_telegram import FakeTelegramServer
+from services.webhook_server import WebhookServer
+
+TOKEN = '123456:BENCHMARK'
+SECRET = 'benchmark-secret'
+
+
+async def echo(update: Update, context) -> None:
+    await update.message.reply_text(update.message.text)
+
+
+def build_application(server: FakeTelegramServer, webhook: bool) -> Application:
+    builder = Application.builder().token(TOKEN).base_url(server.base_url)
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
+    application.add_handler(MessageHandler(filters.TEXT, echo))
+    return application
+
+
+async def measure(server: FakeTelegramServer, count: int, label: str) -> list:
+    latencies = []
+    for i in range(count):
+        latencies.append(await server.send_update(chat_id=1, text=f'{label} {i}'))
+    return latencies
+
+
+async def bench_polling(server: FakeTelegramServer, count: int) -> list:
+    application = build_application(server, webhook=False)
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+        try:
+            return await measure(server, count, 'polling')
+        finally:
+            await application.updater.stop()
+            await application.stop()
+
+
+async def bench_webhook(server: FakeTelegramServer, count: int, port: int) -> list:
+    application = build_application(server, webhook=True)
+    webhook = WebhookServer(application, secret_token=SECRET, port=port)
+    async with application:
+        await application.start()
+        await webhook.start()
+        await application.bot.set_webhook(url=f'http://127.0.0.1:{port}/telegram', secret_token=SECRET)
+        try:
+            return await measure(server, count, 'webhook')
+        finally:
+            await application.bot.delete_webhook()
+            await webhook.stop()
+            await application.stop()
+
+
+def report(label: str, latencies: list) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    print(
+        f"{label:<8} n={len(ordered):<5} mean={statistics.mean(ordered) * 1000:7.2f}ms "
+        f"p50={statistics.median(ordered) * 1000:7.2f}ms p95={p95 * 1000:7.2f}ms "
+        f"max={ordered[-1] * 1000:7.2f}ms"
+    )
+
+
+async def main(count: int, telegram_port: int, webhook_port: int) -> None:
+    server = FakeTelegramServer(port=telegram_port)
+    await server.start()
+    try:
+        report('polling', await bench_polling(server, count))
+        report('webhook', await bench_webhook(server, count, webhook_port))
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--telegram-port', type=int, default=8081)
+    parser.add_argument('--webhook-port', type=int, default=8082)
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.telegram_port, args.webhook_port))
@@ -0,0 +1,114 @@
+"""
+Local stand-in for the Ollama API, used by benchmarks/bench_llm.py.
+
+It answers /api/generate with the expected result of the golden corpus entry whose
+message is in the prompt, after a fixed latency plus the time its completion tokens
+take at `tokens_per_second`, and reports token counts and durations the way Ollama
+does. It measures the benchmark and client overhead, not a model: with `noise` a
+share of the answers get a wrong category so the scoring can be checked too.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from aiohttp import web
+
+_MESSAGE = re.compile(r"Mensaje: '(.*)'")
+
+
+def model_answer(expected: List[dict], router: bool) -> dict:
+    """What a perfect model would answer for a corpus entry's expected result."""
+    first = expected[0]
+    if router:
+        intent = first['type'] if first['type'] in ('query', 'exchange') else \
+            ('multi' if len(expected) > 1 else 'transaction')
+        return {'intent': intent, 'query_type': 'balance', 'money_type': 'all'}
+    if first['type'] == 'query':
+        return {'type': 'query', 'query_type': 'balance', 'money_type': 'all'}
+    if first['type'] == 'exchange':
+        target = 'USD' if first['currency'] == 'ARS' else 'ARS'
+        return {'type': 'exchange', 'amount': first['amount'], 'target_amount': 0.0,
+                'source_currency': first['currency'], 'target_currency': target,
+                'money_type': first['money_type'], 'exchange_rate': 0.0}
+    return [{**item, 'description': item['category'].capitalize(), 'should_create_category': False,
+             'category_reason': ''} for item in expected]
+
+
+class FakeOllamaServer:
+    def __init__(self, corpus: List[dict], host: str = '127.0.0.1', port: int = 11435,
+                 latency: float = 0.05, tokens_per_second: float = 50.0, noise: float = 0.0, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.noise = noise
+        self._random = random.Random(seed)
+        self._expected: Dict[str, List[dict]] = {' '.join(entry['message'].split()): entry['expected']
+                                                 for entry in corpus}
+        self._runner = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post('/api/generate', self._generate)
+        app.router.add_get('/api/tags', self._tags)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    def start_in_thread(self) -> None:
+        """Serve from a background thread, for synchronous callers such as LLMClient."""
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='fake-ollama', daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.start(), self._loop).result()
+
+    def stop_thread(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def answer(self, prompt: str) -> dict:
+        found = _MESSAGE.findall(prompt)
+        expected = self._expected.get(found[-1]) if found else None
+        if not expected:
+            return {}
+        answer = model_answer(expected, router=prompt.startswith('Clasificá'))
+        if isinstance(answer, list) and self.noise and self._random.random() < self.noise:
+            answer = [{**item, 'category': 'otros'} for item in answer]
+        return answer
+
+    async def _generate(self, request: web.Request) -> web.Response:
+        start = time.perf_counter()
+        body = await request.json()
+        text = json.dumps(self.answer(body.get('prompt', '')), ensure_ascii=False)
+        prompt_tokens = len(body.get('prompt', '')) // 4
+        completion_tokens = max(len(text) // 4, 1)
+        completion_seconds = completion_tokens / self.tokens_per_second
+        await asyncio.sleep(self.latency + completion_seconds)
+        return web.json_response({
+            'model': body.get('model'),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'response': text,
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int((time.perf_counter() - start) * 1e9),
+            'load_duration': 0,
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(self.latency * 1e9),
+            'eval_count': completion_tokens,
+            'eval_duration': int(completion_seconds * 1e9),
+        })
+
+    async def _tags(self, request: web.Request) -> web.Response:
+        return web.json_response({'models': []})
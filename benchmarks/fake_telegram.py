@@ -0,0 +1,129 @@
+"""
+Local stand-in for the Telegram Bot API, used by the benchmarks.
+
+It implements just enough of the API for PTB to start (getMe, setWebhook,
+deleteWebhook, getUpdates long polling) and records every sendMessage so a
+benchmark can await the bot's reply to an injected update.
+"""
+import asyncio
+import itertools
+import time
+from aiohttp import ClientSession, web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+class FakeTelegramServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081):
+        self.host = host
+        self.port = port
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._updates = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._reply_waiters = {}
+        self._runner = None
+        self._session = None
+
+    @property
+    def base_url(self) -> str:
+        """Value for ApplicationBuilder.base_url(); PTB appends the token."""
+        return f'http://{self.host}:{self.port}/bot'
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle_method)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._session = ClientSession()
+
+    async def stop(self) -> None:
+        if self._session:
+            await self._session.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    def make_update(self, chat_id: int, text: str) -> dict:
+        update_id = next(self._update_ids)
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User'},
+                'text': text,
+            },
+        }
+
+    async def send_update(self, chat_id: int, text: str) -> float:
+        """Deliver a user message (via webhook if one is set) and return the bot's reply latency."""
+        update = self.make_update(chat_id, text)
+        reply = asyncio.get_running_loop().create_future()
+        self._reply_waiters[text] = reply
+        start = time.perf_counter()
+
+        if self.webhook_url:
+            headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret or ''}
+            async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+                response.raise_for_status()
+        else:
+            self._updates.append(update)
+            self._new_update.set()
+
+        await asyncio.wait_for(reply, timeout=30)
+        return time.perf_counter() - start
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post()) if request.can_read_body else {}
+        if request.content_type == 'application/json':
+            params = await request.json()
+
+        if method == 'getMe':
+            return self._ok(BOT_USER)
+        if method == 'setWebhook':
+            self.webhook_url = params.get('url')
+            self.webhook_secret = params.get('secret_token')
+            return self._ok(True)
+        if method == 'deleteWebhook':
+            self.webhook_url = None
+            return self._ok(True)
+        if method == 'getUpdates':
+            return self._ok(await self._get_updates(params))
+        if method == 'sendChatAction':
+            return self._ok(True)
+        if method == 'sendMessage':
+            return self._ok(self._record_message(params))
+        return self._ok(True)
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self._updates)
+
+    def _record_message(self, params: dict) -> dict:
+        text = params.get('text', '')
+        waiter = self._reply_waiters.pop(text, None)
+        if waiter and not waiter.done():
+            waiter.set_result(time.perf_counter())
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            'text': text,
+        }
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
@@ -1,20 +1,36 @@
 import os
 import json
+import asyncio
+import secrets
+import signal
 from telegram import Update
-from telegram.ext import Application, MessageHandler, filters, CommandHandler
+from telegram.ext import Application, MessageHandler, filters, CommandHandler, CallbackQueryHandler, TypeHandler
 from services.transaction_service import TransactionService
 from models.transaction import Transaction, ExchangeTransaction
 from dotenv import load_dotenv
 from utils.logger import logger
 from contextlib import asynccontextmanager
 from ollama import Client
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import matplotlib.pyplot as plt
 import io
 from telegram import InputFile
 from processors.transaction_processor import TransactionProcessor
 from processors.query_processor import QueryProcessor
-from services.llm_client import LLMClient
+from services.llm_client import LLMClient, LLMUnavailableError
+from services.inbox import Inbox
+from services.processed_updates import ProcessedUpdateStore, PENDING
+from services.model_warmer import ModelWarmer
+from services.telegram_request import InstrumentedRequest, build_request
+from services.rate_limiter import TelegramRateLimiter
+from services.outbound_sender import OutboundSender
+from services.burst_coalescer import BurstCoalescer
+from services.intent_router import INTENT_MULTI
+from services.webhook_server import WebhookServer
+from services.supervisor import ShardSupervisor, global_job_hooks
+from utils.metrics import metrics, start_metrics_server
+from utils.profiler import profiler
+import config
 
 load_dotenv()
 
@@ -41,19 +57,30 @@ class Category:
     OTROS = "otros"
     EXCHANGE = "exchange"
 
+DEFERRED_REPLY = "⏳ El modelo está demorado. Guardé tu mensaje y te respondo apenas pueda procesarlo."
+
+
 class BotHandler:
-    def __init__(self, transaction_service):
+    def __init__(self, transaction_service, worker_id: str = 'main', shard: Optional[Tuple[int, int]] = None):
         self.transaction_service = transaction_service
         self.transaction_processor = TransactionProcessor(transaction_service)
         self.query_processor = QueryProcessor(transaction_service)
         self.llm = LLMClient(transaction_service)
+        self.processed_updates = ProcessedUpdateStore(transaction_service)
+        self.inbox = Inbox(transaction_service, worker_id=worker_id, shard=shard)
+        self.sender = OutboundSender()
+        # Quick consecutive expenses from one user are merged into a single LLM call
+        self.bursts = BurstCoalescer(
+            self._process_burst, config.BURST_WINDOW_SECONDS, config.BURST_MAX_MESSAGES
+        ) if config.BURST_WINDOW_SECONDS > 0 else None
         logger.info("BotHandler initialized")
 
     @asynccontextmanager
-    async def typing_action(self, chat_id, context):
-        """Show typing action while processing."""
+    async def typing_action(self, chat_id, context, instant: bool = False):
+        """Show typing action while processing, unless the reply will be instant."""
         try:
-            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+            if not instant:
+                await context.bot.send_chat_action(chat_id=chat_id, action="typing")
             yield
         finally:
             pass
@@ -75,66 +102,287 @@ Comandos disponibles:
 /listar all - Ver todas las transacciones 📋
 /listar categoria - Ver transacciones de una categoría 📋
 /borrar ID - Borrar una transacción específica 🗑
+/buscar texto [desde] [hasta] - Buscar por descripción 🔎
 /clear - Borrar todas las transacciones ⚠️
 /renombrar vieja nueva - Renombrar una categoría 📝
+/deshacer - Deshacer el último cambio ↩️
+/saldo_al AAAA-MM-DD - Ver el saldo en una fecha 📅
+/presupuesto categoria monto - Definir un presupuesto mensual 💰
+/resumen AAAA-MM - Ver el resumen de un mes 📊
+/patrimonio MONEDA - Ver todo convertido a una moneda 🏦
+/cotizacion MONEDA valor - Cargar una cotización 💱
 """
         await update.message.reply_text(welcome_text)
 
     async def handle_message(self, update: Update, context):
         """Process all messages through LLM."""
+        if profiler.enabled:
+            async with profiler.profile(update.update_id):
+                await self._run_message_pipeline(update, context)
+        else:
+            await self._run_message_pipeline(update, context)
+
+    async def _run_message_pipeline(self, update: Update, context):
+        with metrics.timer('bot_update_seconds', handler='message'):
+            outcome = await self._handle_message(update, context)
+        if outcome != 'buffered':
+            # Buffered messages are counted when their burst is processed
+            metrics.inc('bot_updates_total', outcome=outcome)
+
+    async def _handle_message(self, update: Update, context) -> str:
+        """Run the message pipeline and return a short outcome label for metrics."""
         user_id = update.message.from_user.id
         group_id = update.message.chat.id
-        message = update.message.text
-        logger.info(f"Received message from user {user_id} in group {group_id}: {message}")
+        logger.info(f"Received message from user {user_id} in group {group_id}: {update.message.text}")
+
+        # Redelivered updates are answered before any LLM work
+        processed = self.processed_updates.get(group_id, update.update_id)
+        if processed:
+            await self._replay(update, group_id, *processed)
+            return 'duplicate'
         
-        async with self.typing_action(group_id, context):
-            data = self.llm.get_structured_response(message)
-            
+        inbox_id = self.inbox.add(update)
+        if inbox_id is None:
+            # Redelivered while still waiting in the inbox; the drain job will answer it
+            await update.message.reply_text("⏳ Tu mensaje ya está en cola, te respondo apenas pueda procesarlo.")
+            return 'duplicate'
+
+        if self.bursts:
+            key = (group_id, user_id)
+            if self.llm.is_transaction(update.message.text):
+                self.bursts.add(key, (update, context, inbox_id))
+                return 'buffered'
+            # Anything else waits for the burst before it, so replies keep the message order
+            await self.bursts.flush_now(key)
+        return await self._process(update, context, inbox_id)
+
+    async def _process(self, update: Update, context, inbox_id: int, deferred: bool = False) -> str:
+        """
+        Run the LLM and apply its result for a message stored in the inbox. When the LLM is
+        unavailable the message is left pending for drain_inbox and 'deferred' is returned.
+        """
+        user_id = update.message.from_user.id
+        group_id = update.message.chat.id
+
+        # Queries recognized by keywords never reach the model, so there is nothing to wait for
+        instant = self.llm.answers_without_model(update.message.text)
+        async with self.typing_action(group_id, context, instant):
+            try:
+                data = await self.llm.aget_structured_response(update.message.text, group_id)
+            except LLMUnavailableError as e:
+                logger.warning(f"Deferring update {update.update_id}: {e}")
+                if not deferred:
+                    await update.message.reply_text(DEFERRED_REPLY)
+                self.inbox.release(inbox_id)
+                return 'deferred'
+
             if not data:
                 await update.message.reply_text(
                     "Perdón, no pude procesar tu mensaje. ¿Podrías reformularlo?"
                 )
-                return
-            
+                self.inbox.complete(inbox_id)
+                return 'unparsed'
+
+            # Marked before writing, so a crash mid-way is never replayed as a second insert
+            self.processed_updates.record(update, PENDING)
+            outcome, result = await self._apply(update, user_id, group_id, data)
+            self.processed_updates.record(update, outcome, result)
+            self.inbox.complete(inbox_id)
+            return outcome
+
+    async def _process_burst(self, key, items) -> None:
+        """BurstCoalescer flush: the buffered messages of one user, as (update, context, inbox_id)."""
+        try:
+            if len(items) == 1:
+                update, context, inbox_id = items[0]
+                with metrics.timer('bot_update_seconds', handler='message'):
+                    outcome = await self._process(update, context, inbox_id)
+            else:
+                metrics.inc('bot_bursts_total')
+                with metrics.timer('bot_update_seconds', handler='burst'):
+                    outcome = await self._process_many(key, items)
+        except Exception as e:
+            # The messages stay in the inbox as in progress and are requeued on the next start
+            logger.error(f"Error processing burst of {len(items)} messages in chat {key[0]}: {e}")
+            outcome = 'error'
+        metrics.inc('bot_updates_total', value=len(items), outcome=outcome)
+
+    async def _process_many(self, key, items) -> str:
+        """One multi-transaction LLM call and batch insert for several messages, with a single reply."""
+        group_id, user_id = key
+        updates = [update for update, _, _ in items]
+        inbox_ids = [inbox_id for _, _, inbox_id in items]
+        last, context = updates[-1], items[-1][1]
+        message = '; '.join(update.message.text for update in updates)
+        logger.info(f"Merged {len(items)} messages from user {user_id} in group {group_id}: {message}")
+
+        async with self.typing_action(group_id, context):
             try:
-                # Handle query responses
-                if isinstance(data, dict):
-                    if data.get('type') == 'query':
-                        await self.query_processor.process_query(update, group_id, data)
-                        return
-                    # Handle single transaction
-                    elif data.get('type') in TransactionType.values():
-                        self.transaction_processor.process_transaction(user_id, group_id, data)
-                        await update.message.reply_text("✅ Transacción registrada correctamente.")
-                        return
-                
-                # Handle multiple transactions
-                if isinstance(data, list):
-                    for transaction_data in data:
-                        self.transaction_processor.process_transaction(user_id, group_id, transaction_data)
-                    
-                    await update.message.reply_text(
-                        f"✅ Registré {len(data)} {'transacción' if len(data) == 1 else 'transacciones'} correctamente."
-                    )
-                    return
-                
-                logger.error(f"Unexpected response format: {data}")
-                await update.message.reply_text(
-                    "Perdón, no entendí bien ese mensaje. ¿Podrías decirlo de otra forma?"
+                data = await self.llm.aget_structured_response(message, group_id, intent=INTENT_MULTI)
+            except LLMUnavailableError as e:
+                logger.warning(f"Deferring {len(items)} merged updates: {e}")
+                await last.message.reply_text(DEFERRED_REPLY)
+                for inbox_id in inbox_ids:
+                    self.inbox.release(inbox_id)
+                return 'deferred'
+
+            if isinstance(data, dict) and data.get('type') in TransactionType.values():
+                data = [data]
+            if not isinstance(data, list) or not data:
+                await last.message.reply_text("Perdón, no pude procesar tus mensajes. ¿Podrías reformularlos?")
+                for inbox_id in inbox_ids:
+                    self.inbox.complete(inbox_id)
+                return 'unparsed'
+
+            for update in updates:
+                self.processed_updates.record(update, PENDING)
+            try:
+                written = self.transaction_processor.process_transactions(user_id, group_id, data)
+                outcome, result = 'transaction', self._confirm(
+                    last, self._with_alerts(self._list_transactions(data), written)
                 )
-                
             except Exception as e:
-                logger.error(f"Error processing message: {e}")
-                await update.message.reply_text(
-                    "Hubo un error procesando tu mensaje. ¿Podrías intentarlo de nuevo?"
+                logger.error(f"Error processing merged messages: {e}")
+                outcome, result = 'error', await self._reply(
+                    last, "Hubo un error procesando tus mensajes. ¿Podrías intentarlo de nuevo?"
                 )
+            for update in updates:
+                self.processed_updates.record(update, outcome, result)
+            for inbox_id in inbox_ids:
+                self.inbox.complete(inbox_id)
+            return outcome
 
-def main():
-    bot_token = os.getenv('BOT_TOKEN')
-    application = Application.builder().token(bot_token).build()
-    
-    transaction_service = TransactionService()
-    bot_handler = BotHandler(transaction_service)
+    @staticmethod
+    def _list_transactions(data: list) -> str:
+        lines = [f"✅ Registré {len(data)} {'transacción' if len(data) == 1 else 'transacciones'}:"]
+        for item in data:
+            if item.get('type') == TransactionType.EXCHANGE:
+                lines.append(f"• Cambio: {item.get('amount')} {item.get('source_currency')} → "
+                             f"{item.get('target_amount')} {item.get('target_currency')}")
+            else:
+                sign = '-' if item.get('type') == TransactionType.EXPENSE else '+'
+                label = (item.get('description') or item.get('category') or 'Sin descripción').strip()
+                lines.append(f"• {label}: {sign}${abs(float(item['amount'])):,.2f} {item.get('currency', 'ARS')}")
+        return '\n'.join(lines)
+
+    async def drain_inbox(self, context) -> None:
+        """JobQueue callback: process deferred messages in order, stopping while the LLM is still down."""
+        # Messages of a worker that died mid-way come back once their lease runs out
+        self.inbox.recover(own=False)
+        batch = self.inbox.claim()
+        for position, (inbox_id, payload, attempts) in enumerate(batch):
+            try:
+                update = Update.de_json(payload, context.bot)
+                processed = self.inbox.settle_processed(inbox_id, update, self.processed_updates)
+                if processed:
+                    if processed[0] == PENDING:
+                        # Its writes may have started: warn instead of applying them again
+                        await self._replay(update, update.message.chat.id, *processed)
+                    metrics.inc('bot_updates_total', outcome='duplicate')
+                    continue
+                with metrics.timer('bot_update_seconds', handler='inbox'):
+                    outcome = await self._process(update, context, inbox_id, deferred=True)
+            except Exception as e:
+                logger.error(f"Error processing inbox message {inbox_id}: {e}")
+                self.inbox.release(inbox_id, attempts)
+                continue
+            metrics.inc('bot_updates_total', outcome=outcome)
+            if outcome == 'deferred':
+                # Keep the rest for the next run instead of hammering a model that is down
+                for leftover_id, _, _ in batch[position + 1:]:
+                    self.inbox.release(leftover_id)
+                break
+
+    async def post_init(self, application) -> None:
+        """Requeue what a previous run left half-done and schedule the inbox drain."""
+        recovered = self.inbox.recover()
+        if application.job_queue is None:
+            logger.warning('Inbox drain disabled: install "python-telegram-bot[job-queue]" to enable it')
+            return
+        application.job_queue.run_repeating(
+            self.drain_inbox,
+            interval=config.INBOX_DRAIN_INTERVAL_SECONDS,
+            first=0 if recovered or self.inbox.pending() else config.INBOX_DRAIN_INTERVAL_SECONDS,
+            name='inbox-drain',
+        )
+
+    async def _apply(self, update: Update, user_id: int, group_id: int, data) -> Tuple[str, dict]:
+        """Act on the parsed LLM response; returns (outcome, what a redelivery needs to answer)."""
+        try:
+            # Handle query responses
+            if isinstance(data, dict):
+                if data.get('type') == 'query':
+                    await self.query_processor.process_query(update, group_id, data)
+                    # Queries are re-run on redelivery so charts and balances stay current
+                    return 'query', {'query': data}
+                # Handle single transaction
+                elif data.get('type') in TransactionType.values():
+                    written = self.transaction_processor.process_transaction(user_id, group_id, data)
+                    return 'transaction', self._confirm(
+                        update, self._with_alerts("✅ Transacción registrada correctamente.", written)
+                    )
+            
+            # Handle multiple transactions
+            if isinstance(data, list):
+                written = self.transaction_processor.process_transactions(user_id, group_id, data)
+
+                return 'transaction', self._confirm(update, self._with_alerts(
+                    f"✅ Registré {len(data)} {'transacción' if len(data) == 1 else 'transacciones'} correctamente.",
+                    written
+                ))
+            
+            logger.error(f"Unexpected response format: {data}")
+            return 'unparsed', await self._reply(
+                update, "Perdón, no entendí bien ese mensaje. ¿Podrías decirlo de otra forma?"
+            )
+            
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            return 'error', await self._reply(
+                update, "Hubo un error procesando tu mensaje. ¿Podrías intentarlo de nuevo?"
+            )
+
+    def _with_alerts(self, text: str, written) -> str:
+        """Append the alerts of the budgets these transactions pushed past a threshold and of unusual expenses."""
+        alerts = []
+        # The transactions are already saved; a failed check must not report an error
+        try:
+            alerts.extend(self.transaction_service.budgets.check(written))
+        except Exception as e:
+            logger.error(f"Error checking budgets: {e}")
+        try:
+            alerts.extend(self.transaction_service.analytics.anomalies(written))
+        except Exception as e:
+            logger.error(f"Error checking for unusual expenses: {e}")
+        return '\n'.join([text, *alerts])
+
+    def _confirm(self, update: Update, text: str) -> dict:
+        """Queue a confirmation; it may be merged with others for the same chat."""
+        self.sender.confirm(update.get_bot(), update.message.chat.id, text)
+        return {'reply': text}
+
+    @staticmethod
+    async def _reply(update: Update, text: str) -> dict:
+        await update.message.reply_text(text)
+        return {'reply': text}
+
+    async def _replay(self, update: Update, group_id: int, outcome: str, result: dict) -> None:
+        """Answer a redelivered update from its recorded outcome."""
+        logger.info(f"Update {update.update_id} was already processed ({outcome}), skipping the LLM")
+        if outcome == PENDING:
+            await update.message.reply_text(
+                "⚠️ Este mensaje se estaba procesando cuando el bot se reinició. "
+                "Revisá /listar antes de volver a enviarlo."
+            )
+        elif 'query' in result:
+            await self.query_processor.process_query(update, group_id, result['query'])
+        elif 'reply' in result:
+            await update.message.reply_text(result['reply'])
+
+def register_handlers(application: Application, transaction_service, worker_id: str = 'main',
+                      shard: Optional[Tuple[int, int]] = None) -> BotHandler:
+    """Register every command and message handler on the application."""
+    bot_handler = BotHandler(transaction_service, worker_id, shard)
     from handlers.command_handler import BotCommandHandler
     command_handler = BotCommandHandler(transaction_service)
     
@@ -144,7 +392,17 @@ def main():
     application.add_handler(CommandHandler("confirmar", command_handler.confirm_clear))
     application.add_handler(CommandHandler("listar", command_handler.list_transactions))
     application.add_handler(CommandHandler("borrar", command_handler.delete_transaction))
+    application.add_handler(CommandHandler("buscar", command_handler.search))
+    application.add_handler(CallbackQueryHandler(command_handler.search_page, pattern=r'^buscar:\d+$'))
     application.add_handler(CommandHandler("renombrar", command_handler.rename_category))
+    application.add_handler(CommandHandler("saldo_al", command_handler.balance_as_of))
+    application.add_handler(CommandHandler("presupuesto", command_handler.budget))
+    application.add_handler(CommandHandler("resumen", command_handler.monthly_report))
+    application.add_handler(CommandHandler("cotizacion", command_handler.exchange_rate))
+    application.add_handler(CommandHandler("patrimonio", command_handler.net_worth))
+    application.add_handler(CommandHandler("deshacer", command_handler.undo))
+    application.add_handler(CommandHandler("stats", command_handler.stats))
+    application.add_handler(CommandHandler("perfil", command_handler.profile))
     
     # Handle all other messages through natural language
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot_handler.handle_message))
@@ -153,9 +411,147 @@ def main():
     from handlers.error_handler import error_handler
     application.add_error_handler(error_handler)
     # -------------------------------------------------------------
+    return bot_handler
+
+
+def build_application(transaction_service, use_updater: bool = True, update_queue_size: int = 0,
+                      worker_id: str = 'main', shard: Optional[Tuple[int, int]] = None) -> Application:
+    """
+    Build the PTB application; webhook and worker modes run without an Updater. A worker
+    passes its `shard` (index, worker count).
+    """
+    builder = (
+        Application.builder().token(config.BOT_TOKEN).request(build_request())
+        .rate_limiter(TelegramRateLimiter())
+    )
+    if not use_updater:
+        builder = builder.updater(None)
+    if update_queue_size:
+        builder = builder.update_queue(asyncio.Queue(maxsize=update_queue_size))
+    application = builder.build()
+    bot_handler = register_handlers(application, transaction_service, worker_id, shard)
+    # post_init runs before polling, the webhook or the worker loop start taking updates
+    hooks = [bot_handler.post_init, *global_job_hooks(transaction_service, worker_id)]
+    if config.WARMUP_ENABLED:
+        hooks.append(ModelWarmer(bot_handler.llm).post_init)
+
+    async def post_init(app: Application) -> None:
+        for hook in hooks:
+            await hook(app)
+
+    async def post_shutdown(app: Application) -> None:
+        if bot_handler.bursts:
+            await bot_handler.bursts.shutdown()
+        await bot_handler.sender.shutdown()
 
-    print("Bot is running...")
-    application.run_polling()
+    application.post_init = post_init
+    application.post_shutdown = post_shutdown
+    return application
+
+
+def build_supervisor_application(supervisor: ShardSupervisor, use_updater: bool = True,
+                                 update_queue_size: int = 0) -> Application:
+    """Build an application that only receives updates and forwards them to the worker processes."""
+    builder = (
+        Application.builder().token(config.BOT_TOKEN).request(InstrumentedRequest())
+        .post_init(supervisor.start).post_shutdown(supervisor.stop)
+    )
+    if not use_updater:
+        builder = builder.updater(None)
+    if update_queue_size:
+        builder = builder.update_queue(asyncio.Queue(maxsize=update_queue_size))
+    application = builder.build()
+    application.add_handler(TypeHandler(Update, supervisor.forward))
+    return application
+
+
+async def run_webhook(application: Application) -> None:
+    """Serve updates from the embedded webhook server until the process is interrupted."""
+    secret_token = config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    server = WebhookServer(
+        application,
+        secret_token=secret_token,
+        path=config.WEBHOOK_PATH,
+        host=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+    )
+    async with application:
+        # run_polling() calls these hooks itself; mirror that here
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(
+            url=config.WEBHOOK_URL.rstrip('/') + config.WEBHOOK_PATH,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        )
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows has no loop signal handlers; Ctrl+C still cancels asyncio.run()
+                pass
+        try:
+            await stop.wait()
+            logger.info("Stop signal received, shutting down the webhook server")
+        finally:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.remove_signal_handler(signum)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            await server.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+
+def configure_profiler() -> None:
+    profiler.configure(
+        enabled=config.PROFILE_ENABLED,
+        every_n=config.PROFILE_EVERY_N,
+        slow_threshold=config.PROFILE_SLOW_SECONDS,
+        tracemalloc_interval=config.PROFILE_TRACEMALLOC_SECONDS,
+    )
+
+
+def main():
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT, config.METRICS_HOST)
+    configure_profiler()
+
+    webhook = config.BOT_MODE == "webhook"
+    if webhook and not config.WEBHOOK_URL:
+        raise SystemExit("WEBHOOK_URL must be set when BOT_MODE=webhook")
+
+    if config.WORKERS > 0:
+        # Supervisor mode: this process only receives updates, workers own the bot logic
+        application = build_supervisor_application(
+            ShardSupervisor(config.WORKERS),
+            use_updater=not webhook,
+            update_queue_size=config.WEBHOOK_QUEUE_SIZE if webhook else 0,
+        )
+        print(f"Bot is running with {config.WORKERS} workers...")
+    else:
+        transaction_service = TransactionService()
+        application = build_application(
+            transaction_service,
+            use_updater=not webhook,
+            update_queue_size=config.WEBHOOK_QUEUE_SIZE if webhook else 0,
+        )
+        print("Bot is running...")
+
+    if webhook:
+        try:
+            asyncio.run(run_webhook(application))
+        except KeyboardInterrupt:
+            pass
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -6,4 +6,119 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 OLLAMA_HOST = os.getenv("OLLAMA_HOST")
 MODEL = os.getenv("MODEL")
-# Add further configuration variables as needed 
\ No newline at end of file
+# Small model that classifies messages the keyword router cannot; empty skips this tier
+ROUTER_MODEL = os.getenv("ROUTER_MODEL", "")
+
+# Telegram user ids allowed to run admin commands such as /stats (comma separated)
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+# Local Prometheus endpoint; leave METRICS_PORT empty to disable it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+
+# Logging: DEBUG lines are sampled (1 in N) before they reach the background writer
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_RATE = int(os.getenv("LOG_DEBUG_SAMPLE_RATE") or 10)
+
+# Opt-in profiling of live updates; dumps are written to logs/
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+PROFILE_EVERY_N = int(os.getenv("PROFILE_EVERY_N") or 100)
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS") or 0)
+PROFILE_TRACEMALLOC_SECONDS = float(os.getenv("PROFILE_TRACEMALLOC_SECONDS") or 0)
+# How updates are received: "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Public HTTPS base URL that Telegram calls (usually a reverse proxy in front of WEBHOOK_LISTEN:WEBHOOK_PORT)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Secret checked on every webhook call; a random one is generated per start when empty
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or 8080)
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE") or 1000)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS") or 40)
+# Number of worker processes; updates are routed to them by chat id (0 = single process)
+WORKERS = int(os.getenv("WORKERS") or 0)
+# Storage layout: "single" (one expenses.db), "group" (one file per group) or "bucket" (groups hashed into N files)
+DB_LAYOUT = os.getenv("DB_LAYOUT", "single").lower()
+DB_SHARD_DIR = os.getenv("DB_SHARD_DIR", "shards")
+DB_SHARD_BUCKETS = int(os.getenv("DB_SHARD_BUCKETS") or 16)
+# Maximum number of shard connections kept open (least recently used are closed first)
+DB_SHARD_CACHE_SIZE = int(os.getenv("DB_SHARD_CACHE_SIZE") or 64)
+# Storage backend: "sqlite" (uses DB_LAYOUT) or "postgres" (one shared database at POSTGRES_DSN)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+POSTGRES_DSN = os.getenv("POSTGRES_DSN", "postgresql://localhost/expenses")
+POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE") or 10)
+# /confirmar deletes groups above this many transactions in background chunks of CLEAR_CHUNK_SIZE
+CLEAR_CHUNK_THRESHOLD = int(os.getenv("CLEAR_CHUNK_THRESHOLD") or 5000)
+CLEAR_CHUNK_SIZE = int(os.getenv("CLEAR_CHUNK_SIZE") or 500)
+# A ledger balance snapshot is written every this many journaled changes per group
+LEDGER_SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY") or 200)
+# Handled update ids are kept this long to answer Telegram redeliveries without reprocessing
+PROCESSED_UPDATES_TTL_HOURS = float(os.getenv("PROCESSED_UPDATES_TTL_HOURS") or 48)
+# How long Ollama keeps a model loaded after each request (Ollama duration, e.g. "10m")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m")
+# Load the models and prime the prompt prefix before the bot starts taking updates
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Local hours "start-end" (end exclusive) during which a job keeps the models resident; empty disables it
+KEEP_ALIVE_HOURS = os.getenv("KEEP_ALIVE_HOURS", "8-24")
+KEEP_ALIVE_INTERVAL_SECONDS = int(os.getenv("KEEP_ALIVE_INTERVAL_SECONDS") or 240)
+# Ollama read timeout per request; after LLM_BREAKER_FAILURES consecutive failures the
+# circuit opens and messages go to the inbox until LLM_BREAKER_RESET_SECONDS have passed
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_TIMEOUT_SECONDS") or 60)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES") or 3)
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS") or 30)
+# Deferred messages are drained every INBOX_DRAIN_INTERVAL_SECONDS, INBOX_BATCH_SIZE at a time
+INBOX_DRAIN_INTERVAL_SECONDS = int(os.getenv("INBOX_DRAIN_INTERVAL_SECONDS") or 30)
+INBOX_BATCH_SIZE = int(os.getenv("INBOX_BATCH_SIZE") or 10)
+INBOX_MAX_ATTEMPTS = int(os.getenv("INBOX_MAX_ATTEMPTS") or 5)
+# A message claimed by a worker that has not finished it after this long is assumed
+# abandoned (the worker died) and is requeued by whichever worker drains next
+INBOX_LEASE_SECONDS = int(os.getenv("INBOX_LEASE_SECONDS") or 600)
+# Comma-separated Ollama hosts to load-balance over (defaults to OLLAMA_HOST). With
+# OLLAMA_HEDGE, a request slower than the p95 of the last ones is also sent to a second host
+# once OLLAMA_HEDGE_MIN_SAMPLES latencies are known. Ejected hosts are re-checked every
+# OLLAMA_HEALTH_INTERVAL_SECONDS (0 disables the health check)
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS", "")
+OLLAMA_HEDGE = os.getenv("OLLAMA_HEDGE", "false").lower() in ("1", "true", "yes")
+OLLAMA_HEDGE_MIN_SAMPLES = int(os.getenv("OLLAMA_HEDGE_MIN_SAMPLES") or 20)
+OLLAMA_HEALTH_INTERVAL_SECONDS = int(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS") or 30)
+# Outbound Telegram limits: messages per second overall and per private chat, and per minute
+# in groups; a 429 is retried up to TELEGRAM_MAX_RETRIES times after its retry_after
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE") or 30)
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE") or 1)
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE") or 20)
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES") or 3)
+# Bot API connection pool ("2" needs "httpx[http2]")
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE") or 256)
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT") or 10)
+TELEGRAM_HTTP_VERSION = os.getenv("TELEGRAM_HTTP_VERSION", "1.1")
+# Expenses a user sends less than BURST_WINDOW_SECONDS apart are merged into one LLM call
+# and one reply (0 disables it); a burst is flushed early at BURST_MAX_MESSAGES
+BURST_WINDOW_SECONDS = float(os.getenv("BURST_WINDOW_SECONDS") or 0)
+BURST_MAX_MESSAGES = int(os.getenv("BURST_MAX_MESSAGES") or 10)
+# Local time ("HH:MM") at which monthly reports of the groups active in the last
+# REPORT_ACTIVE_DAYS are precomputed, REPORT_CONCURRENCY at a time; empty disables it.
+# With REPORT_PUSH, the report of the month that just ended is also sent to each group
+REPORT_PRECOMPUTE_TIME = os.getenv("REPORT_PRECOMPUTE_TIME", "04:00")
+REPORT_ACTIVE_DAYS = int(os.getenv("REPORT_ACTIVE_DAYS") or 35)
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY") or 2)
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE") or 256)
+REPORT_PUSH = os.getenv("REPORT_PUSH", "false").lower() in ("1", "true", "yes")
+# Analytics: months behind "¿es normal lo que gasto?", the z-score of log amounts above which
+# an expense is flagged as unusual once its category has ANOMALY_MIN_SAMPLES expenses, and
+# groups whose expense arrays are kept in memory
+ANALYTICS_HISTORY_MONTHS = int(os.getenv("ANALYTICS_HISTORY_MONTHS") or 6)
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD") or 3.0)
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES") or 8)
+ANALYTICS_CACHE_GROUPS = int(os.getenv("ANALYTICS_CACHE_GROUPS") or 128)
+# Weekly digest, local "HH:MM" (empty disables it) on WEEKLY_DIGEST_DAY (0 = Sunday ... 6 = Saturday)
+WEEKLY_DIGEST_TIME = os.getenv("WEEKLY_DIGEST_TIME", "")
+WEEKLY_DIGEST_DAY = int(os.getenv("WEEKLY_DIGEST_DAY") or 0)
+# Record extraction calls (anonymized message, prompt version, model, raw and parsed
+# response, latency, tokens) as JSON lines for benchmarks/bench_llm.py; empty disables it
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+LLM_RECORD_SAMPLE_RATE = float(os.getenv("LLM_RECORD_SAMPLE_RATE") or 1.0)
+# Categories listed in the extraction prompt: the group's most used ones, so the prompt
+# stays the same size however many categories the group accumulates
+PROMPT_CATEGORIES = int(os.getenv("PROMPT_CATEGORIES") or 25)
+# Add further configuration variables as needed
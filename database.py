@@ -1,12 +1,36 @@
+import json
 import sqlite3
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from utils.logger import logger
+from utils.metrics import instrument_methods
+from services.repository import ExpenseRepository
 
-class DatabaseHandler:
+# Journal payload of a transaction row (with its exchange record, if any), built by SQLite itself
+TRANSACTION_PAYLOAD_SQL = '''
+    json_object(
+        'id', t.id, 'user_id', t.user_id, 'type', t.type, 'amount', t.amount,
+        'description', t.description, 'category_id', t.category_id,
+        'money_type_id', t.money_type_id, 'money_type', m.name,
+        'currency', t.currency, 'timestamp', t.timestamp,
+        'exchange', json((
+            SELECT json_object(
+                'source_currency', e.source_currency, 'target_currency', e.target_currency,
+                'exchange_rate', e.exchange_rate, 'source_amount', e.source_amount,
+                'target_amount', e.target_amount
+            )
+            FROM exchange_transactions e WHERE e.transaction_id = t.id
+        ))
+    )
+'''
+
+@instrument_methods('bot_db_query_seconds')
+class DatabaseHandler(ExpenseRepository):
     def __init__(self, db_name='expenses.db'):
         self.conn = sqlite3.connect(db_name, timeout=20)
         self.cursor = self.conn.cursor()
+        # WAL lets readers in other worker processes proceed while one process writes
+        self.cursor.execute('PRAGMA journal_mode=WAL')
         self._create_tables()
 
     def _create_tables(self):
@@ -50,8 +74,205 @@ class DatabaseHandler:
                 FOREIGN KEY (transaction_id) REFERENCES transactions(id)
             )
         ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_group_timestamp
+            ON transactions (group_id, timestamp)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_exchange_transactions_transaction
+            ON exchange_transactions (transaction_id)
+        ''')
+        # Append-only journal of every change to a group's transactions
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ledger_events'")
+        backfill = self.cursor.fetchone() is None
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                event_type TEXT NOT NULL,
+                transaction_id INTEGER,
+                payload TEXT NOT NULL,
+                undo_of INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ledger_events_group
+            ON ledger_events (group_id, id)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ledger_events_group_created
+            ON ledger_events (group_id, created_at)
+        ''')
+        if backfill:
+            self._backfill_ledger()
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS balance_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                last_event_id INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_balance_snapshots_group
+            ON balance_snapshots (group_id, last_event_id)
+        ''')
+        # Updates already handled, so Telegram redeliveries are answered from here
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS processed_updates (
+                update_id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER,
+                outcome TEXT NOT NULL,
+                result TEXT,
+                processed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_processed_updates_processed_at
+            ON processed_updates (processed_at)
+        ''')
+        # Free-text messages waiting for the LLM; rows are deleted once handled
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS inbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                update_id INTEGER NOT NULL UNIQUE,
+                chat_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                claimed_at DATETIME,
+                shard_key INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Inboxes created before claims carried an owner and a lease, or a shard key
+        self.cursor.execute('PRAGMA table_info(inbox)')
+        columns = {row[1] for row in self.cursor.fetchall()}
+        if 'owner' not in columns:
+            self.cursor.execute('ALTER TABLE inbox ADD COLUMN owner TEXT')
+            self.cursor.execute('ALTER TABLE inbox ADD COLUMN claimed_at DATETIME')
+        if 'shard_key' not in columns:
+            self.cursor.execute('ALTER TABLE inbox ADD COLUMN shard_key INTEGER')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inbox_status
+            ON inbox (status, id)
+        ''')
+        # Monthly budget per category and currency
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS budgets (
+                group_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                currency TEXT NOT NULL DEFAULT 'ARS',
+                amount REAL NOT NULL,
+                PRIMARY KEY (group_id, category_id, currency)
+            )
+        ''')
+        # Month-to-date spending per category, kept in step with every insert and delete
+        # so budget checks never re-sum the month
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'category_month_totals'"
+        )
+        backfill = self.cursor.fetchone() is None
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_month_totals (
+                group_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                currency TEXT NOT NULL,
+                month TEXT NOT NULL,
+                spent REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_id, category_id, currency, month)
+            )
+        ''')
+        if backfill:
+            self._count_spending(1, '1 = 1', ())
+        # How often each group uses each category: the group's vocabulary, most used first in prompts
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'group_categories'"
+        )
+        backfill = self.cursor.fetchone() is None
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS group_categories (
+                group_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_id, category_id)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_group_categories_uses
+            ON group_categories (group_id, uses DESC)
+        ''')
+        if backfill:
+            self._backfill_category_uses()
+        # Rates typed with /cotizacion, used alongside the ones implied by recorded exchanges
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS manual_exchange_rates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                source_currency TEXT NOT NULL,
+                target_currency TEXT NOT NULL,
+                rate REAL NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_manual_exchange_rates_group
+            ON manual_exchange_rates (group_id, timestamp)
+        ''')
+        self._create_search_index()
         self.conn.commit()
 
+    def _create_search_index(self):
+        """
+        Contentless FTS5 index of the descriptions, kept in sync by triggers. The group is
+        indexed as a token of its own column ('g123', 'gn123' for negative ids), so the
+        group filter is part of the full-text match instead of a scan of every match.
+        """
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'")
+        backfill = self.cursor.fetchone() is None
+        try:
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+                    description, grp, content='', tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite was built without FTS5, /buscar will scan descriptions: {e}")
+            self.has_search_index = False
+            return
+        self.has_search_index = True
+        group_token = "'g' || replace(CAST({}.group_id AS TEXT), '-', 'n')"
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+                INSERT INTO transactions_fts (rowid, description, grp)
+                VALUES (new.id, COALESCE(new.description, ''), {group_token.format('new')});
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, description, grp)
+                VALUES ('delete', old.id, COALESCE(old.description, ''), {group_token.format('old')});
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description, group_id
+            ON transactions BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, description, grp)
+                VALUES ('delete', old.id, COALESCE(old.description, ''), {group_token.format('old')});
+                INSERT INTO transactions_fts (rowid, description, grp)
+                VALUES (new.id, COALESCE(new.description, ''), {group_token.format('new')});
+            END
+        ''')
+        if backfill:
+            self.cursor.execute(f'''
+                INSERT INTO transactions_fts (rowid, description, grp)
+                SELECT id, COALESCE(description, ''), {group_token.format('transactions')} FROM transactions
+            ''')
+
     def add_transaction(self, user_id, group_id, transaction_type, amount, description=None, category_id=None, money_type_id=None, currency='ARS'):
         self.cursor.execute('''
             INSERT INTO transactions (
@@ -63,7 +284,95 @@ class DatabaseHandler:
             user_id, group_id, transaction_type, amount, description, 
             category_id, money_type_id, currency
         ))
+        transaction_id = self.cursor.lastrowid
+        # Same write transaction as the insert, so the journal and counters never miss a row
+        self._journal_transaction(group_id, 'insert', transaction_id)
+        self._count_spending(1, 'id = ?', (transaction_id,))
+        self._count_category_uses(1, 'id = ?', (transaction_id,))
         self.conn.commit()
+        return transaction_id
+
+    def add_transactions(self, rows: List[tuple]) -> List[int]:
+        """Insert several transactions (add_transaction's arguments, in order) in one commit."""
+        ids = []
+        try:
+            for row in rows:
+                self.cursor.execute('''
+                    INSERT INTO transactions (
+                        user_id, group_id, type, amount, description,
+                        category_id, money_type_id, currency
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', row)
+                ids.append(self.cursor.lastrowid)
+                self._journal_transaction(row[1], 'insert', self.cursor.lastrowid)
+            if ids:
+                self._count_spending(1, f"id IN ({', '.join('?' * len(ids))})", tuple(ids))
+                self._count_category_uses(1, f"id IN ({', '.join('?' * len(ids))})", tuple(ids))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return ids
+
+    def _count_spending(self, sign: int, where: str, params: tuple) -> None:
+        """Add (sign=1) or remove (sign=-1) the expenses matching `where` from the month-to-date counters."""
+        self.cursor.execute(f'''
+            INSERT INTO category_month_totals (group_id, category_id, currency, month, spent)
+            SELECT group_id, category_id, currency, strftime('%Y-%m', timestamp), -SUM(amount) * ?
+            FROM transactions
+            WHERE type = 'expense' AND category_id IS NOT NULL AND {where}
+            GROUP BY group_id, category_id, currency, strftime('%Y-%m', timestamp)
+            ON CONFLICT (group_id, category_id, currency, month) DO UPDATE SET spent = spent + excluded.spent
+        ''', (sign, *params))
+
+    def _count_category_uses(self, sign: int, where: str, params: tuple) -> None:
+        """Add (sign=1) or remove (sign=-1) the transactions matching `where` from the groups' category use counts."""
+        self.cursor.execute(f'''
+            INSERT INTO group_categories (group_id, category_id, uses)
+            SELECT group_id, category_id, COUNT(*) * ?
+            FROM transactions
+            WHERE category_id IS NOT NULL AND {where}
+            GROUP BY group_id, category_id
+            ON CONFLICT (group_id, category_id) DO UPDATE SET uses = uses + excluded.uses
+        ''', (sign, *params))
+
+    def _backfill_ledger(self) -> None:
+        """Seed a new journal with one insert event per existing transaction, recorded at its timestamp."""
+        self.cursor.execute(f'''
+            INSERT INTO ledger_events (group_id, event_type, transaction_id, payload, created_at)
+            SELECT t.group_id, 'insert', t.id, {TRANSACTION_PAYLOAD_SQL}, t.timestamp
+            FROM transactions t
+            LEFT JOIN money_types m ON t.money_type_id = m.id
+            ORDER BY t.timestamp, t.id
+        ''')
+        if self.cursor.rowcount > 0:
+            logger.info(f"Seeded the ledger with {self.cursor.rowcount} existing transactions")
+
+    def _backfill_category_uses(self) -> None:
+        """Rebuild the use counts from every transaction; categories that only have a budget get 0 uses."""
+        self.cursor.execute('DELETE FROM group_categories')
+        self._count_category_uses(1, '1 = 1', ())
+        self.cursor.execute('''
+            INSERT OR IGNORE INTO group_categories (group_id, category_id)
+            SELECT DISTINCT group_id, category_id FROM budgets
+        ''')
+
+    def _journal_transaction(self, group_id, event_type, transaction_id, undo_of=None):
+        """Append an insert/delete event carrying the current row; call before deleting the row."""
+        self.cursor.execute(f'''
+            INSERT INTO ledger_events (group_id, event_type, transaction_id, payload, undo_of)
+            SELECT ?, ?, t.id, {TRANSACTION_PAYLOAD_SQL}, ?
+            FROM transactions t
+            LEFT JOIN money_types m ON t.money_type_id = m.id
+            WHERE t.id = ? AND t.group_id = ?
+        ''', (group_id, event_type, undo_of, transaction_id, group_id))
+
+    def _journal_event(self, group_id, event_type, payload, transaction_id=None, undo_of=None):
+        self.cursor.execute('''
+            INSERT INTO ledger_events (group_id, event_type, transaction_id, payload, undo_of)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (group_id, event_type, transaction_id, json.dumps(payload), undo_of))
         return self.cursor.lastrowid
 
     def add_exchange_transaction(self, transaction_id, source_currency, target_currency, exchange_rate, source_amount, target_amount):
@@ -80,6 +389,19 @@ class DatabaseHandler:
                 transaction_id, source_currency, target_currency, 
                 exchange_rate, source_amount, target_amount
             ))
+            self.cursor.execute('''
+                INSERT INTO ledger_events (group_id, event_type, transaction_id, payload)
+                SELECT t.group_id, 'exchange', t.id, json_object(
+                    'source_currency', ?, 'target_currency', ?, 'exchange_rate', ?,
+                    'source_amount', ?, 'target_amount', ?, 'money_type', m.name
+                )
+                FROM transactions t
+                LEFT JOIN money_types m ON t.money_type_id = m.id
+                WHERE t.id = ?
+            ''', (
+                source_currency, target_currency, exchange_rate,
+                source_amount, target_amount, transaction_id
+            ))
             
             self.cursor.execute('COMMIT')
             logger.info(f"Added exchange transaction record: {source_amount} {source_currency} → {target_amount} {target_currency}")
@@ -128,27 +450,28 @@ class DatabaseHandler:
         ''', (user_id, category_id))
         return self.cursor.fetchall()
 
-    def clear_transactions(self, group_id: int) -> None:
+    def clear_transactions(self, group_id: int, journal: bool = True) -> None:
         """Clear all transactions and reset IDs."""
         try:
             # Start a transaction
             self.cursor.execute('BEGIN TRANSACTION')
             
-            # Get all transaction IDs for this group
+            # Delete exchange transactions of the group without loading their ids into Python
             self.cursor.execute('''
-                SELECT id FROM transactions WHERE group_id = ?
+                DELETE FROM exchange_transactions
+                WHERE transaction_id IN (SELECT id FROM transactions WHERE group_id = ?)
             ''', (group_id,))
-            transaction_ids = [row[0] for row in self.cursor.fetchall()]
-            
-            if transaction_ids:
-                # Delete exchange transactions using IN clause
-                self.cursor.execute('''
-                    DELETE FROM exchange_transactions 
-                    WHERE transaction_id IN ({})
-                '''.format(','.join('?' * len(transaction_ids))), transaction_ids)
             
             # Delete transactions
             self.cursor.execute('DELETE FROM transactions WHERE group_id = ?', (group_id,))
+            deleted = self.cursor.rowcount
+            self.cursor.execute('DELETE FROM category_month_totals WHERE group_id = ?', (group_id,))
+            # The group keeps its vocabulary; only the counts start over
+            self.cursor.execute('UPDATE group_categories SET uses = 0 WHERE group_id = ?', (group_id,))
+            
+            # A clear is journaled as one event rather than one per row
+            if journal:
+                self._journal_event(group_id, 'clear', {'count': deleted})
             
             # Reset sequences
             self.cursor.execute('UPDATE sqlite_sequence SET seq = 0 WHERE name = "transactions"')
@@ -156,13 +479,60 @@ class DatabaseHandler:
             
             # Commit transaction
             self.cursor.execute('COMMIT')
-            logger.info(f"Cleared {len(transaction_ids)} transactions and their exchange records for group {group_id}")
+            logger.info(f"Cleared {deleted} transactions and their exchange records for group {group_id}")
             
         except Exception as e:
             self.cursor.execute('ROLLBACK')
             logger.error(f"Error clearing transactions: {e}")
             raise
 
+    def delete_transactions_chunk(self, group_id: int, chunk_size: int) -> int:
+        """
+        Delete up to chunk_size of the group's oldest transactions in one short write transaction.
+        Returns how many were deleted (0 once the group is empty).
+        """
+        try:
+            self.cursor.execute('BEGIN TRANSACTION')
+            self.cursor.execute('''
+                DELETE FROM exchange_transactions
+                WHERE transaction_id IN (
+                    SELECT id FROM transactions WHERE group_id = ? ORDER BY id LIMIT ?
+                )
+            ''', (group_id, chunk_size))
+            self._count_spending(
+                -1, 'id IN (SELECT id FROM transactions WHERE group_id = ? ORDER BY id LIMIT ?)',
+                (group_id, chunk_size)
+            )
+            self._count_category_uses(
+                -1, 'id IN (SELECT id FROM transactions WHERE group_id = ? ORDER BY id LIMIT ?)',
+                (group_id, chunk_size)
+            )
+            self.cursor.execute('''
+                DELETE FROM transactions
+                WHERE id IN (
+                    SELECT id FROM transactions WHERE group_id = ? ORDER BY id LIMIT ?
+                )
+            ''', (group_id, chunk_size))
+            deleted = self.cursor.rowcount
+            self.cursor.execute('COMMIT')
+            return deleted
+        except Exception as e:
+            self.cursor.execute('ROLLBACK')
+            logger.error(f"Error deleting transactions chunk: {e}")
+            raise
+
+    def count_transactions(self, group_id: int, category: Optional[str] = None) -> int:
+        """Count the group's transactions (optionally of one category) using the group index."""
+        if category:
+            self.cursor.execute('''
+                SELECT COUNT(*) FROM transactions t
+                JOIN categories c ON t.category_id = c.id
+                WHERE t.group_id = ? AND c.name = ?
+            ''', (group_id, category))
+        else:
+            self.cursor.execute('SELECT COUNT(*) FROM transactions WHERE group_id = ?', (group_id,))
+        return self.cursor.fetchone()[0]
+
     def close(self):
         self.conn.close()
 
@@ -217,6 +587,23 @@ class DatabaseHandler:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
+    def get_group_categories(self, group_id: int, limit: Optional[int] = None) -> List[Tuple[int, str, int]]:
+        self.cursor.execute('''
+            SELECT c.id, c.name, g.uses
+            FROM group_categories g
+            JOIN categories c ON c.id = g.category_id
+            WHERE g.group_id = ?
+            ORDER BY g.uses DESC, c.name
+            LIMIT ?
+        ''', (group_id, -1 if limit is None else limit))
+        return self.cursor.fetchall()
+
+    def add_group_category(self, group_id: int, category_id: int) -> None:
+        self.cursor.execute(
+            'INSERT OR IGNORE INTO group_categories (group_id, category_id) VALUES (?, ?)', (group_id, category_id)
+        )
+        self.conn.commit()
+
     def get_money_type_name(self, money_type_id: int) -> str:
         """Get money type name by ID."""
         self.cursor.execute('SELECT name FROM money_types WHERE id = ?', (money_type_id,))
@@ -283,7 +670,44 @@ class DatabaseHandler:
         self.cursor.execute(query, params)
         return self.cursor.fetchall()
 
-    def delete_transaction(self, transaction_id: int, group_id: int) -> bool:
+    def search_transactions(self, group_id: int, terms: List[str], since: Optional[str] = None,
+                            until: Optional[str] = None, limit: int = 10, offset: int = 0) -> List[tuple]:
+        """Transactions whose description has every term (as a word prefix), best match first."""
+        if not terms:
+            return []
+        if self.has_search_index:
+            group_token = f"g{str(group_id).replace('-', 'n')}"
+            words = ' AND '.join(f'"{term}"*' for term in terms)
+            match = f'grp : {group_token} AND description : ({words})'
+            query = '''
+                SELECT t.id, t.type, t.amount, t.description, c.name, t.timestamp
+                FROM transactions_fts f
+                JOIN transactions t ON t.id = f.rowid
+                LEFT JOIN categories c ON t.category_id = c.id
+                WHERE transactions_fts MATCH ?
+            '''
+            params = [match]
+            order = 'bm25(transactions_fts, 1.0, 0.0), t.timestamp DESC'
+        else:
+            query = '''
+                SELECT t.id, t.type, t.amount, t.description, c.name, t.timestamp
+                FROM transactions t
+                LEFT JOIN categories c ON t.category_id = c.id
+                WHERE t.group_id = ?
+            ''' + ' AND t.description LIKE ?' * len(terms)
+            params = [group_id] + [f'%{term}%' for term in terms]
+            order = 't.timestamp DESC'
+        if since:
+            query += ' AND t.timestamp >= ?'
+            params.append(since)
+        if until:
+            query += ' AND t.timestamp <= ?'
+            params.append(until)
+        query += f' ORDER BY {order} LIMIT ? OFFSET ?'
+        self.cursor.execute(query, params + [limit, offset])
+        return self.cursor.fetchall()
+
+    def delete_transaction(self, transaction_id: int, group_id: int, undo_of: Optional[int] = None) -> bool:
         """Delete a specific transaction. Returns True if successful."""
         try:
             # First check if transaction exists and belongs to the group
@@ -294,6 +718,11 @@ class DatabaseHandler:
             if not self.cursor.fetchone():
                 return False
             
+            # Journal the full row (and exchange record) first so the delete can be undone
+            self._journal_transaction(group_id, 'delete', transaction_id, undo_of)
+            self._count_spending(-1, 'id = ?', (transaction_id,))
+            self._count_category_uses(-1, 'id = ?', (transaction_id,))
+            
             # Delete related exchange transaction if exists
             self.cursor.execute(
                 'DELETE FROM exchange_transactions WHERE transaction_id = ?',
@@ -308,96 +737,149 @@ class DatabaseHandler:
             self.conn.commit()
             return True
         except Exception as e:
+            self.conn.rollback()
             logger.error(f"Error deleting transaction: {e}")
-            return False 
+            return False
 
-    def rename_category(self, old_name: str, new_name: str) -> bool:
-        """Rename a category. Returns True if successful."""
+    def restore_transaction(self, group_id: int, payload: dict, undo_of: Optional[int] = None) -> int:
+        """Re-insert a journaled transaction (and its exchange record), keeping its id when still free."""
         try:
-            # Check if old category exists
-            self.cursor.execute('SELECT id FROM categories WHERE name = ?', (old_name,))
-            if not self.cursor.fetchone():
+            self.cursor.execute('SELECT 1 FROM transactions WHERE id = ?', (payload['id'],))
+            transaction_id = None if self.cursor.fetchone() else payload['id']
+            self.cursor.execute('''
+                INSERT INTO transactions (
+                    id, user_id, group_id, type, amount, description,
+                    category_id, money_type_id, currency, timestamp
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                transaction_id, payload['user_id'], group_id, payload['type'], payload['amount'],
+                payload['description'], payload['category_id'], payload['money_type_id'],
+                payload['currency'], payload['timestamp']
+            ))
+            transaction_id = self.cursor.lastrowid
+            exchange = payload.get('exchange')
+            if exchange:
+                self.cursor.execute('''
+                    INSERT INTO exchange_transactions (
+                        transaction_id, source_currency, target_currency,
+                        exchange_rate, source_amount, target_amount
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    transaction_id, exchange['source_currency'], exchange['target_currency'],
+                    exchange['exchange_rate'], exchange['source_amount'], exchange['target_amount']
+                ))
+            # The restored row is journaled with its exchange, so one event replays both
+            self._journal_transaction(group_id, 'insert', transaction_id, undo_of)
+            self._count_spending(1, 'id = ?', (transaction_id,))
+            self._count_category_uses(1, 'id = ?', (transaction_id,))
+            self.conn.commit()
+            return transaction_id
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Error restoring transaction: {e}")
+            raise
+
+    def _group_category_id(self, group_id: int, name: str) -> Optional[int]:
+        self.cursor.execute('''
+            SELECT c.id FROM group_categories g
+            JOIN categories c ON c.id = g.category_id
+            WHERE g.group_id = ? AND c.name = ?
+        ''', (group_id, name))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def rename_category(self, old_name: str, new_name: str, group_id: int,
+                        undo_of: Optional[int] = None) -> Tuple[bool, str]:
+        """
+        Rename a category for one group: its transactions, budgets and counters move to the
+        category called new_name (created if needed), while other groups keep the old name.
+        """
+        try:
+            old_id = self._group_category_id(group_id, old_name)
+            if old_id is None:
                 return False, "La categoría original no existe"
-            
-            # Check if new name already exists
-            self.cursor.execute('SELECT id FROM categories WHERE name = ?', (new_name,))
-            if self.cursor.fetchone():
+            if self._group_category_id(group_id, new_name) is not None:
                 return False, "Ya existe una categoría con ese nombre"
-            
-            # Rename the category
-            self.cursor.execute(
-                'UPDATE categories SET name = ? WHERE name = ?',
-                (new_name, old_name)
-            )
+
+            self.cursor.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (new_name,))
+            self.cursor.execute('SELECT id FROM categories WHERE name = ?', (new_name,))
+            new_id = self.cursor.fetchone()[0]
+            for table in ('transactions', 'budgets', 'category_month_totals', 'group_categories'):
+                self.cursor.execute(
+                    f'UPDATE {table} SET category_id = ? WHERE group_id = ? AND category_id = ?',
+                    (new_id, group_id, old_id)
+                )
+            self._journal_event(group_id, 'rename', {
+                'old': old_name, 'new': new_name, 'old_id': old_id, 'new_id': new_id,
+            }, undo_of=undo_of)
             self.conn.commit()
             return True, f"Categoría renombrada de '{old_name}' a '{new_name}'"
         except Exception as e:
+            self.conn.rollback()
             logger.error(f"Error renaming category: {e}")
-            return False, "Error al renombrar la categoría" 
+            return False, "Error al renombrar la categoría"
 
-    def get_balance_by_money_type_and_currency(self, group_id: int, money_type_id: int, currency: str) -> float:
-        """Get balance for a specific money type and currency."""
+    def get_balance_by_money_type_and_currency(self, group_id: int, money_type_id: Optional[int], currency: str) -> float:
+        """Get balance for a specific money type and currency (all money types if money_type_id is None)."""
         try:
-            if currency == 'USD':
-                # Get all USD transactions (both regular and exchanges)
-                self.cursor.execute('''
-                    SELECT id, type, amount, description 
-                    FROM transactions 
-                    WHERE group_id = ? AND currency = 'USD'
-                    ORDER BY timestamp
-                ''', (group_id,))
-                transactions = self.cursor.fetchall()
-                logger.info("=== USD Transactions ===")
-                for tx in transactions:
-                    logger.info(f"ID: {tx[0]}, Type: {tx[1]}, Amount: {tx[2]}, Desc: {tx[3]}")
-
-                # Calculate USD balance:
-                # 1. Get all regular USD transactions (incomes and expenses)
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0)
-                    FROM transactions
-                    WHERE group_id = ? 
-                    AND currency = 'USD'
-                    AND NOT EXISTS (
-                        SELECT 1 FROM exchange_transactions e 
-                        WHERE e.transaction_id = transactions.id
-                    )
-                ''', (group_id,))
-                regular_balance = self.cursor.fetchone()[0] or 0.0
-                logger.info(f"Regular USD Balance: {regular_balance}")
-
-                # 2. Get all USD amounts that were exchanged to ARS
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(e.source_amount), 0)
-                    FROM exchange_transactions e
-                    JOIN transactions t ON e.transaction_id = t.id
-                    WHERE t.group_id = ? 
-                    AND e.source_currency = 'USD'
-                ''', (group_id,))
-                exchanged_amount = self.cursor.fetchone()[0] or 0.0
-                logger.info(f"USD Exchanged Amount: {exchanged_amount}")
-
-                # Final balance is regular transactions minus exchanged amounts
-                final_balance = regular_balance - exchanged_amount
-                logger.info(f"Final USD Balance: {final_balance}")
-
-                return final_balance
-            else:
-                # For ARS, calculate balance properly
-                self.cursor.execute('''
-                    SELECT COALESCE(SUM(amount), 0)  -- amount is already signed (-ve for expenses)
-                    FROM transactions
-                    WHERE group_id = ? 
-                    AND money_type_id = ? 
-                    AND currency = ?
-                ''', (group_id, money_type_id, currency))
-                balance = self.cursor.fetchone()[0] or 0.0
-                logger.info(f"ARS Balance for money_type {money_type_id}: {balance}")
-                return balance
-
+            balances = self.get_balances(group_id).get(currency, {})
+            if money_type_id is None:
+                return sum(balances.values())
+            return balances.get(self.get_money_type_name(money_type_id), 0.0)
         except Exception as e:
             logger.error(f"Error getting balance by money type and currency: {e}")
-            return 0.0 
+            return 0.0
+
+    def get_balances(self, group_id: int, until: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Get the balance of every (currency, money_type) pair in one grouped query.
+        Exchanges are stored as an income in the target currency, so their source
+        amount is netted out of the source currency under the same money type.
+        With `until`, only transactions dated at or before it count.
+        """
+        dated = ' AND timestamp <= ?' if until else ''
+        params = (group_id, until, group_id, until) if until else (group_id, group_id)
+        self.cursor.execute(f'''
+            SELECT b.currency, m.name, SUM(b.amount)
+            FROM (
+                SELECT currency, money_type_id, amount  -- amount is already signed (-ve for expenses)
+                FROM transactions
+                WHERE group_id = ?{dated}
+                UNION ALL
+                SELECT e.source_currency, t.money_type_id, -e.source_amount
+                FROM exchange_transactions e
+                JOIN transactions t ON e.transaction_id = t.id
+                WHERE t.group_id = ?{dated.replace('timestamp', 't.timestamp')}
+            ) b
+            LEFT JOIN money_types m ON b.money_type_id = m.id
+            GROUP BY b.currency, b.money_type_id
+            ORDER BY b.currency
+        ''', params)
+        balances: Dict[str, Dict[str, float]] = {}
+        for currency, money_type, amount in self.cursor.fetchall():
+            currency_balances = balances.setdefault(currency, {})
+            key = money_type or "cash"
+            currency_balances[key] = currency_balances.get(key, 0.0) + (amount or 0.0)
+        return balances
+
+    def get_expenses_by_currency_and_category(self, group_id: int) -> Dict[str, List[Tuple[str, float]]]:
+        """Get total expenses by category for every currency the group has used."""
+        self.cursor.execute('''
+            SELECT t.currency, c.name, ABS(SUM(t.amount)) as total
+            FROM transactions t
+            JOIN categories c ON t.category_id = c.id
+            WHERE t.group_id = ?
+            AND t.type = 'expense'
+            GROUP BY t.currency, c.name
+            HAVING total > 0
+            ORDER BY t.currency, total DESC
+        ''', (group_id,))
+        expenses: Dict[str, List[Tuple[str, float]]] = {}
+        for currency, category, total in self.cursor.fetchall():
+            expenses.setdefault(currency, []).append((category, total))
+        return expenses
 
     def get_expenses_by_category(self, group_id: int, currency: str) -> List[Tuple[str, float]]:
         """Get total expenses by category for a specific currency."""
@@ -412,4 +894,243 @@ class DatabaseHandler:
             HAVING total > 0
             ORDER BY total DESC
         ''', (group_id, currency))
-        return self.cursor.fetchall() 
\ No newline at end of file
+        return self.cursor.fetchall()
+
+    def record_ledger_event(self, group_id: int, event_type: str, payload: dict,
+                            transaction_id: Optional[int] = None) -> int:
+        """Append a standalone event to the group's journal."""
+        event_id = self._journal_event(group_id, event_type, payload, transaction_id)
+        self.conn.commit()
+        return event_id
+
+    def get_ledger_events(self, group_id: int, after_id: int = 0, until_id: Optional[int] = None,
+                          limit: Optional[int] = None, newest_first: bool = False) -> List[tuple]:
+        """(id, event_type, transaction_id, payload, undo_of, created_at) rows of the group's journal."""
+        query = '''
+            SELECT id, event_type, transaction_id, payload, undo_of, created_at
+            FROM ledger_events
+            WHERE group_id = ? AND id > ?
+        '''
+        params = [group_id, after_id]
+        if until_id is not None:
+            query += ' AND id <= ?'
+            params.append(until_id)
+        query += ' ORDER BY id DESC' if newest_first else ' ORDER BY id'
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        self.cursor.execute(query, params)
+        return [
+            (event_id, event_type, transaction_id, json.loads(payload), undo_of, created_at)
+            for event_id, event_type, transaction_id, payload, undo_of, created_at in self.cursor.fetchall()
+        ]
+
+    def last_ledger_event_id(self, group_id: int, until: Optional[str] = None) -> int:
+        """Id of the group's newest event (recorded at or before `until`), 0 if there is none."""
+        if until is None:
+            self.cursor.execute('SELECT MAX(id) FROM ledger_events WHERE group_id = ?', (group_id,))
+        else:
+            self.cursor.execute(
+                'SELECT MAX(id) FROM ledger_events WHERE group_id = ? AND created_at <= ?',
+                (group_id, until)
+            )
+        return self.cursor.fetchone()[0] or 0
+
+    def last_dated_event_id(self, group_id: int, until: str) -> int:
+        """Id of the group's newest event that changed a transaction dated at or before `until`, or cleared it."""
+        self.cursor.execute('''
+            SELECT MAX(l.id)
+            FROM ledger_events l
+            LEFT JOIN transactions t ON l.event_type = 'exchange' AND t.id = l.transaction_id
+            WHERE l.group_id = ?
+            AND (l.event_type = 'clear' OR json_extract(l.payload, '$.timestamp') <= ? OR t.timestamp <= ?)
+        ''', (group_id, until, until))
+        return self.cursor.fetchone()[0] or 0
+
+    def get_latest_snapshot(self, group_id: int, until_id: Optional[int] = None) -> Optional[Tuple[int, dict]]:
+        """(last_event_id, state) of the newest snapshot covering no event after until_id."""
+        query = 'SELECT last_event_id, state FROM balance_snapshots WHERE group_id = ?'
+        params = [group_id]
+        if until_id is not None:
+            query += ' AND last_event_id <= ?'
+            params.append(until_id)
+        self.cursor.execute(query + ' ORDER BY last_event_id DESC LIMIT 1', params)
+        row = self.cursor.fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def save_snapshot(self, group_id: int, last_event_id: int, state: dict) -> None:
+        self.cursor.execute('''
+            INSERT INTO balance_snapshots (group_id, last_event_id, state)
+            VALUES (?, ?, ?)
+        ''', (group_id, last_event_id, json.dumps(state)))
+        self.conn.commit()
+
+    def set_budget(self, group_id: int, category_id: int, amount: float, currency: str = 'ARS') -> None:
+        if amount > 0:
+            self.cursor.execute('''
+                INSERT INTO budgets (group_id, category_id, currency, amount) VALUES (?, ?, ?, ?)
+                ON CONFLICT (group_id, category_id, currency) DO UPDATE SET amount = excluded.amount
+            ''', (group_id, category_id, currency, amount))
+        else:
+            self.cursor.execute(
+                'DELETE FROM budgets WHERE group_id = ? AND category_id = ? AND currency = ?',
+                (group_id, category_id, currency)
+            )
+        self.conn.commit()
+
+    def get_budgets(self, group_id: int) -> List[Tuple[str, str, float, float]]:
+        self.cursor.execute('''
+            SELECT c.name, b.currency, b.amount, COALESCE(m.spent, 0)
+            FROM budgets b
+            JOIN categories c ON c.id = b.category_id
+            LEFT JOIN category_month_totals m
+                ON m.group_id = b.group_id AND m.category_id = b.category_id
+                AND m.currency = b.currency AND m.month = strftime('%Y-%m', 'now')
+            WHERE b.group_id = ?
+            ORDER BY c.name, b.currency
+        ''', (group_id,))
+        return self.cursor.fetchall()
+
+    def get_budget_status(self, group_id: int, category_id: int, currency: str) -> Optional[Tuple[float, float]]:
+        self.cursor.execute('''
+            SELECT b.amount, COALESCE(m.spent, 0)
+            FROM budgets b
+            LEFT JOIN category_month_totals m
+                ON m.group_id = b.group_id AND m.category_id = b.category_id
+                AND m.currency = b.currency AND m.month = strftime('%Y-%m', 'now')
+            WHERE b.group_id = ? AND b.category_id = ? AND b.currency = ?
+        ''', (group_id, category_id, currency))
+        return self.cursor.fetchone()
+
+    def get_month_expenses(self, group_id: int, month: str) -> Dict[str, List[Tuple[str, float]]]:
+        self.cursor.execute('''
+            SELECT m.currency, c.name, m.spent
+            FROM category_month_totals m
+            JOIN categories c ON c.id = m.category_id
+            WHERE m.group_id = ? AND m.month = ? AND m.spent > 0
+            ORDER BY m.currency, m.spent DESC
+        ''', (group_id, month))
+        expenses: Dict[str, List[Tuple[str, float]]] = {}
+        for currency, category, spent in self.cursor.fetchall():
+            expenses.setdefault(currency, []).append((category, spent))
+        return expenses
+
+    def get_expense_history(self, group_id: int) -> List[Tuple[int, str, float, Optional[int], str]]:
+        self.cursor.execute('''
+            SELECT id, timestamp, -amount, category_id, currency
+            FROM transactions
+            WHERE group_id = ? AND type = 'expense'
+            ORDER BY timestamp, id
+        ''', (group_id,))
+        return self.cursor.fetchall()
+
+    def get_active_groups(self, since: str) -> List[int]:
+        self.cursor.execute(
+            'SELECT DISTINCT group_id FROM ledger_events WHERE created_at >= ? ORDER BY group_id', (since,)
+        )
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_category_month_totals(self, group_id: int) -> List[Tuple[str, str, str, float]]:
+        self.cursor.execute('''
+            SELECT m.month, m.currency, c.name, m.spent
+            FROM category_month_totals m
+            JOIN categories c ON c.id = m.category_id
+            WHERE m.group_id = ? AND m.spent > 0
+            ORDER BY m.month, m.currency
+        ''', (group_id,))
+        return self.cursor.fetchall()
+
+    def add_exchange_rate(self, group_id: int, source_currency: str, target_currency: str, rate: float) -> None:
+        self.cursor.execute(
+            'INSERT INTO manual_exchange_rates (group_id, source_currency, target_currency, rate) VALUES (?, ?, ?, ?)',
+            (group_id, source_currency, target_currency, rate)
+        )
+        self.conn.commit()
+
+    def get_exchange_rates(self, group_id: int) -> List[Tuple[str, str, str, float]]:
+        # The stored exchange_rate is rounded to 2 decimals, useless for ARS -> USD; use the amounts
+        self.cursor.execute('''
+            SELECT t.timestamp, e.source_currency, e.target_currency, e.target_amount / e.source_amount
+            FROM exchange_transactions e
+            JOIN transactions t ON e.transaction_id = t.id
+            WHERE t.group_id = ? AND e.source_amount > 0 AND e.target_amount > 0
+            UNION ALL
+            SELECT timestamp, source_currency, target_currency, rate
+            FROM manual_exchange_rates
+            WHERE group_id = ? AND rate > 0
+            ORDER BY 1
+        ''', (group_id, group_id))
+        return self.cursor.fetchall()
+
+    def get_processed_update(self, update_id: int) -> Optional[Tuple[str, dict]]:
+        """(outcome, result) recorded for an update, or None if it was never handled."""
+        self.cursor.execute('SELECT outcome, result FROM processed_updates WHERE update_id = ?', (update_id,))
+        row = self.cursor.fetchone()
+        return (row[0], json.loads(row[1]) if row[1] else {}) if row else None
+
+    def record_processed_update(self, update_id: int, chat_id: int, message_id: Optional[int],
+                                outcome: str, result: Optional[dict] = None) -> None:
+        self.cursor.execute('''
+            INSERT INTO processed_updates (update_id, chat_id, message_id, outcome, result)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (update_id) DO UPDATE SET outcome = excluded.outcome, result = excluded.result
+        ''', (update_id, chat_id, message_id, outcome, json.dumps(result) if result is not None else None))
+        self.conn.commit()
+
+    def prune_processed_updates(self, older_than: str) -> int:
+        """Forget updates handled before older_than ('YYYY-MM-DD HH:MM:SS'); returns how many."""
+        self.cursor.execute('DELETE FROM processed_updates WHERE processed_at < ?', (older_than,))
+        self.conn.commit()
+        return self.cursor.rowcount
+
+    def add_inbox_message(self, update_id: int, chat_id: int, payload: dict, status: str = 'pending',
+                          owner: Optional[str] = None, shard_key: Optional[int] = None) -> Optional[int]:
+        """Queue a message; returns None when the update is already in the inbox."""
+        self.cursor.execute('''
+            INSERT OR IGNORE INTO inbox (update_id, chat_id, payload, status, owner, claimed_at, shard_key)
+            VALUES (?, ?, ?, ?, ?, CASE WHEN ? = 'processing' THEN CURRENT_TIMESTAMP END, ?)
+        ''', (update_id, chat_id, json.dumps(payload), status, owner, status, shard_key))
+        self.conn.commit()
+        return self.cursor.lastrowid if self.cursor.rowcount else None
+
+    def claim_inbox_messages(self, limit: int, owner: Optional[str] = None,
+                             shard: Optional[Tuple[int, int]] = None) -> List[Tuple[int, dict, int]]:
+        """Mark up to limit pending messages as processing; returns (id, payload, attempts), oldest first."""
+        shard_filter, params = '', ()
+        if shard:
+            # Only the chats routed to this worker, so one chat is never drained by two workers
+            index, worker_count = shard
+            shard_filter, params = 'AND COALESCE(shard_key, 0) % ? = ?', (worker_count, index)
+        self.cursor.execute(f'''
+            UPDATE inbox SET status = 'processing', attempts = attempts + 1,
+                owner = ?, claimed_at = CURRENT_TIMESTAMP
+            WHERE id IN (SELECT id FROM inbox WHERE status = 'pending' {shard_filter} ORDER BY id LIMIT ?)
+            RETURNING id, payload, attempts
+        ''', (owner, *params, limit))
+        rows = self.cursor.fetchall()
+        self.conn.commit()
+        return sorted((inbox_id, json.loads(payload), attempts) for inbox_id, payload, attempts in rows)
+
+    def set_inbox_status(self, inbox_id: int, status: str) -> None:
+        self.cursor.execute(
+            'UPDATE inbox SET status = ?, owner = NULL, claimed_at = NULL WHERE id = ?', (status, inbox_id)
+        )
+        self.conn.commit()
+
+    def complete_inbox_message(self, inbox_id: int) -> None:
+        self.cursor.execute('DELETE FROM inbox WHERE id = ?', (inbox_id,))
+        self.conn.commit()
+
+    def requeue_inbox_messages(self, claimed_before: str, owner: Optional[str] = None) -> int:
+        """Return 'processing' messages of `owner`, or claimed before claimed_before, to 'pending'."""
+        self.cursor.execute('''
+            UPDATE inbox SET status = 'pending', owner = NULL, claimed_at = NULL
+            WHERE status = 'processing'
+            AND (owner = ? OR claimed_at IS NULL OR claimed_at < ?)
+        ''', (owner, claimed_before))
+        self.conn.commit()
+        return self.cursor.rowcount
+
+    def count_inbox_messages(self, status: str = 'pending') -> int:
+        self.cursor.execute('SELECT COUNT(*) FROM inbox WHERE status = ?', (status,))
+        return self.cursor.fetchone()[0]
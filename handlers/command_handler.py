@@ -1,6 +1,31 @@
 import io
+import time
+import functools
+from collections import OrderedDict
+from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import config
+from processors.query_processor import QueryProcessor, DEFAULT_CURRENCY
+from services.budgets import format_amount
+from services.exchange_rates import parse_currency
+from services.search import MAX_SAVED_SEARCHES, PAGE_SIZE, parse_search_args
+from services.reports import current_month, parse_month
 from utils.logger import logger
+from utils.metrics import metrics
+from utils.profiler import profiler
+
+
+def admin_only(func):
+    """Reject the command unless the sender is listed in ADMIN_USER_IDS."""
+    @functools.wraps(func)
+    async def wrapper(self, update, context):
+        if update.message.from_user.id not in config.ADMIN_USER_IDS:
+            await update.message.reply_text("❌ Este comando es solo para administradores.")
+            return
+        return await func(self, update, context)
+    return wrapper
+
 
 class BotCommandHandler:
     def __init__(self, transaction_service):
@@ -8,8 +33,7 @@ class BotCommandHandler:
 
     async def clear_database(self, update, context):
         group_id = update.message.chat.id
-        transactions = self.transaction_service.db.get_latest_transactions(group_id, limit=None)
-        count = len(transactions)
+        count = self.transaction_service.db_for(group_id).count_transactions(group_id)
         logger.info(f"User requested to clear {count} transactions for group {group_id}")
         await update.message.reply_text(
             f"⚠️ ¿Estás seguro de que querés borrar TODAS las transacciones ({count} en total)?\n"
@@ -25,18 +49,42 @@ class BotCommandHandler:
     async def confirm_clear(self, update, context):
         if context.user_data.get('clear_pending', False):
             group_id = update.message.chat.id
-            self.transaction_service.db.clear_transactions(group_id)
+            context.user_data['clear_pending'] = False
+            count = self.transaction_service.db_for(group_id).count_transactions(group_id)
+
+            if count > config.CLEAR_CHUNK_THRESHOLD and not self.transaction_service.clear_is_instant():
+                progress = await update.message.reply_text(f"🗑 Borrando {count} transacciones... 0%")
+                context.application.create_task(
+                    self._clear_in_background(group_id, count, progress),
+                    update=update
+                )
+                return
+
+            self.transaction_service.clear_group(group_id)
             logger.info(f"Cleared transactions for group {group_id}")
             await update.message.reply_text(
                 "✅ Se borraron todas las transacciones.\n"
                 "Los próximos registros comenzarán desde el ID 1."
             )
-            context.user_data['clear_pending'] = False
         else:
             await update.message.reply_text("No hay ninguna operación de borrado pendiente.")
 
+    async def _clear_in_background(self, group_id: int, total: int, progress) -> None:
+        """Delete a large group in chunks, editing the progress message every few seconds."""
+        last_edit = time.monotonic()
+        async for deleted in self.transaction_service.clear_group_in_chunks(group_id, config.CLEAR_CHUNK_SIZE):
+            if time.monotonic() - last_edit >= 3:
+                last_edit = time.monotonic()
+                await progress.edit_text(f"🗑 Borrando {total} transacciones... {min(deleted * 100 // total, 99)}%")
+        logger.info(f"Cleared transactions for group {group_id} in background")
+        await progress.edit_text(
+            f"✅ Se borraron las {total} transacciones.\n"
+            "Los próximos registros comenzarán desde el ID 1."
+        )
+
     async def list_transactions(self, update, context):
         group_id = update.message.chat.id
+        db = self.transaction_service.db_for(group_id)
         show_all = False
         category = None
 
@@ -46,14 +94,15 @@ class BotCommandHandler:
                 show_all = True
             else:
                 category = context.args[0].lower()
-                if category not in self.transaction_service.db.get_all_categories():
-                    categories = ", ".join(self.transaction_service.db.get_all_categories())
+                vocabulary = self.transaction_service.categories.vocabulary(group_id)
+                if category not in vocabulary:
+                    categories = ", ".join(vocabulary)
                     await update.message.reply_text(
                         f"❌ Categoría no válida. Las categorías disponibles son:\n{categories}"
                     )
                     return
 
-        transactions = self.transaction_service.db.get_latest_transactions(
+        transactions = db.get_latest_transactions(
             group_id,
             limit=None if show_all else 10,
             category=category
@@ -94,6 +143,57 @@ class BotCommandHandler:
         message += "/listar comida - Muestra solo transacciones de comida"
         await update.message.reply_text(message)
 
+    async def search(self, update, context):
+        """Ranked full-text search over descriptions: /buscar texto [desde] [hasta]."""
+        terms, since, until = parse_search_args(context.args)
+        if not terms:
+            await update.message.reply_text(
+                "❌ Uso: /buscar texto [desde] [hasta]\n"
+                "Ejemplos: /buscar farmacia, /buscar farmacia 2024-03, /buscar nafta 2024-01-01 2024-03-31"
+            )
+            return
+
+        text, markup = self._search_page(update.message.chat.id, terms, since, until, 0)
+        message = await update.message.reply_text(text, reply_markup=markup)
+        if markup:
+            searches = context.chat_data.setdefault('searches', OrderedDict())
+            searches[message.message_id] = (terms, since, until)
+            while len(searches) > MAX_SAVED_SEARCHES:
+                searches.popitem(last=False)
+
+    async def search_page(self, update, context):
+        """Pager buttons of /buscar; the search is remembered by the id of the message it edits."""
+        query = update.callback_query
+        search = context.chat_data.get('searches', {}).get(query.message.message_id)
+        if search is None:
+            await query.answer("La búsqueda expiró, volvé a usar /buscar.")
+            return
+        await query.answer()
+        page = int(query.data.split(':')[1])
+        text, markup = self._search_page(query.message.chat.id, *search, page)
+        await query.edit_message_text(text, reply_markup=markup)
+
+    def _search_page(self, group_id: int, terms, since, until, page: int):
+        rows = self.transaction_service.db_for(group_id).search_transactions(
+            group_id, terms, since, until, limit=PAGE_SIZE + 1, offset=page * PAGE_SIZE
+        )
+        searched = ' '.join(terms)
+        if not rows:
+            return f"🔎 No encontré transacciones con '{searched}'.", None
+
+        lines = [f"🔎 Resultados para '{searched}' (página {page + 1}):\n",
+                 "ID | Fecha | Monto | Categoría | Descripción", "-" * 50]
+        for tx_id, tx_type, amount, description, category, timestamp in rows[:PAGE_SIZE]:
+            sign = '-' if tx_type == 'expense' else '+'
+            lines.append(f"{tx_id} | {timestamp.split()[0]} | {sign}${abs(amount):.2f} | {category} | {description}")
+
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("◀️ Anterior", callback_data=f"buscar:{page - 1}"))
+        if len(rows) > PAGE_SIZE:
+            buttons.append(InlineKeyboardButton("Siguiente ▶️", callback_data=f"buscar:{page + 1}"))
+        return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
     async def delete_transaction(self, update, context):
         if not context.args:
             await update.message.reply_text(
@@ -112,7 +212,7 @@ class BotCommandHandler:
             return
 
         group_id = update.message.chat.id
-        if self.transaction_service.db.delete_transaction(transaction_id, group_id):
+        if self.transaction_service.delete_transaction(group_id, transaction_id):
             await update.message.reply_text(f"✅ Transacción {transaction_id} borrada correctamente.")
             logger.info(f"Deleted transaction {transaction_id} for group {group_id}")
         else:
@@ -121,8 +221,9 @@ class BotCommandHandler:
             )
 
     async def rename_category(self, update, context):
+        group_id = update.message.chat.id
         if len(context.args) < 2:
-            categories = self.transaction_service.db.get_all_categories()
+            categories = self.transaction_service.categories.vocabulary(group_id)
             categories_list = "\n".join(f"- {cat}" for cat in categories)
             await update.message.reply_text(
                 "❌ Tenés que especificar la categoría original y el nuevo nombre.\n\n"
@@ -136,9 +237,171 @@ class BotCommandHandler:
         old_name = context.args[0].lower()
         new_name = context.args[1].lower()
 
-        success, message = self.transaction_service.db.rename_category(old_name, new_name)
+        success, message = self.transaction_service.rename_category(group_id, old_name, new_name)
         if success:
             logger.info(f"Category renamed from '{old_name}' to '{new_name}'")
             await update.message.reply_text(f"✅ {message}")
         else:
-            await update.message.reply_text(f"❌ {message}") 
\ No newline at end of file
+            await update.message.reply_text(f"❌ {message}")
+
+    async def balance_as_of(self, update, context):
+        """Balance at the end of a past day, rebuilt from the ledger: /saldo_al AAAA-MM-DD."""
+        try:
+            day = datetime.strptime(context.args[0], "%Y-%m-%d") if context.args else None
+        except ValueError:
+            day = None
+        if day is None:
+            await update.message.reply_text("❌ Uso: /saldo_al AAAA-MM-DD\nEjemplo: /saldo_al 2024-05-31")
+            return
+
+        group_id = update.message.chat.id
+        # The journal stores UTC timestamps, like the transactions table
+        balances = self.transaction_service.ledger.balance_as_of(group_id, day + timedelta(days=1, seconds=-1))
+        if not balances:
+            await update.message.reply_text(f"No hay movimientos registrados hasta el {day:%d/%m/%Y}.")
+            return
+        await update.message.reply_text(
+            f"📅 Saldo al {day:%d/%m/%Y}:\n\n{QueryProcessor.format_balances(balances)}"
+        )
+
+    async def monthly_report(self, update, context):
+        """Summary and chart of a month (the current one by default): /resumen [AAAA-MM]."""
+        month = parse_month(context.args[0]) if context.args else current_month()
+        if month is None:
+            await update.message.reply_text("❌ Uso: /resumen [AAAA-MM]\nEjemplo: /resumen 2024-05")
+            return
+
+        text, chart = await self.transaction_service.reports.get(update.message.chat.id, month)
+        await update.message.reply_text(text)
+        if chart:
+            await update.message.reply_photo(chart)
+
+    async def exchange_rate(self, update, context):
+        """Show the latest known rates, or type one: /cotizacion MONEDA valor (in pesos)."""
+        group_id = update.message.chat.id
+        rates = self.transaction_service.rates
+        if not context.args:
+            latest = rates.index(group_id).latest()
+            if not latest:
+                await update.message.reply_text(
+                    "Todavía no hay cotizaciones. Registrá un cambio de divisas o cargá una con "
+                    "/cotizacion MONEDA valor\nEjemplo: /cotizacion USD 1250"
+                )
+                return
+            lines = ["💱 Últimas cotizaciones:\n"]
+            lines.extend(f"• 1 {currency} = ${rate:,.2f} ARS (desde {since[:10]})" for currency, rate, since in latest)
+            await update.message.reply_text("\n".join(lines))
+            return
+
+        try:
+            currency = parse_currency(context.args[0])
+            rate = float(context.args[1].replace(',', '.'))
+        except (IndexError, ValueError):
+            currency, rate = None, 0
+        if currency is None or currency == DEFAULT_CURRENCY or rate <= 0:
+            await update.message.reply_text("❌ Uso: /cotizacion MONEDA valor\nEjemplo: /cotizacion USD 1250")
+            return
+        rates.set_rate(group_id, currency, rate)
+        await update.message.reply_text(f"✅ Cotización registrada: 1 {currency} = ${rate:,.2f} ARS.")
+
+    async def net_worth(self, update, context):
+        """Every balance and category total converted to one currency: /patrimonio [MONEDA]."""
+        currency = parse_currency(context.args[0]) if context.args else DEFAULT_CURRENCY
+        if currency is None:
+            await update.message.reply_text("❌ Uso: /patrimonio [MONEDA]\nEjemplo: /patrimonio USD")
+            return
+        result = self.transaction_service.rates.net_worth(update.message.chat.id, currency)
+        await update.message.reply_text(QueryProcessor.format_net_worth(result))
+
+    async def budget(self, update, context):
+        """List the group's monthly budgets, or set one: /presupuesto categoria monto [moneda]."""
+        group_id = update.message.chat.id
+        if not context.args:
+            budgets = self.transaction_service.budgets.list(group_id)
+            if not budgets:
+                await update.message.reply_text(
+                    "No hay presupuestos definidos.\n\n"
+                    "Uso: /presupuesto categoria monto [moneda]\n"
+                    "Ejemplo: /presupuesto comida 150000"
+                )
+                return
+            lines = ["💰 Presupuestos de este mes:\n"]
+            for category, currency, amount, spent in budgets:
+                lines.append(f"• {category}: {format_amount(spent, currency)} de "
+                             f"{format_amount(amount, currency)} ({spent / amount:.0%})")
+            await update.message.reply_text("\n".join(lines))
+            return
+
+        try:
+            category = context.args[0].lower()
+            amount = float(context.args[1].replace(',', '.'))
+            currency = context.args[2].upper() if len(context.args) > 2 else 'ARS'
+        except (IndexError, ValueError):
+            await update.message.reply_text(
+                "❌ Uso: /presupuesto categoria monto [moneda]\nEjemplo: /presupuesto comida 150000"
+            )
+            return
+
+        self.transaction_service.budgets.set(group_id, category, amount, currency)
+        if amount <= 0:
+            await update.message.reply_text(f"✅ Presupuesto de {category} eliminado.")
+        else:
+            await update.message.reply_text(
+                f"✅ Presupuesto mensual de {category}: {format_amount(amount, currency)}.\n"
+                "Te aviso al llegar al 80% y al 100%."
+            )
+
+    async def undo(self, update, context):
+        """Revert the group's last insert, delete or rename."""
+        group_id = update.message.chat.id
+        success, message = self.transaction_service.undo_last(group_id)
+        await update.message.reply_text(f"{'↩️' if success else '❌'} {message}")
+
+    @admin_only
+    async def stats(self, update, context):
+        """Show per-stage latency and counters collected since startup."""
+        lines = ["📈 Métricas desde el inicio (p50 / p95 / n)\n"]
+        for name, series in sorted(metrics.summary().items()):
+            lines.append(f"{name}:")
+            for labels, stats in sorted(series.items(), key=lambda item: -item[1]['count']):
+                lines.append(
+                    f"  {labels}: {stats['p50'] * 1000:.0f}ms / {stats['p95'] * 1000:.0f}ms / {stats['count']}"
+                )
+        for name, series in sorted(metrics.counters().items()):
+            lines.append(f"{name}:")
+            for labels, value in sorted(series.items()):
+                lines.append(f"  {labels}: {value:g}")
+        if len(lines) == 1:
+            lines.append("Todavía no hay datos.")
+        # Telegram rejects messages longer than 4096 characters
+        await update.message.reply_text("\n".join(lines)[:4000])
+
+    @admin_only
+    async def profile(self, update, context):
+        """Toggle the live-update profiler: /perfil on [cada_n] [umbral_seg] [memoria_seg] | off."""
+        if not context.args:
+            await update.message.reply_text(
+                f"🔬 Profiler {profiler.status()}.\n\n"
+                "Uso: /perfil on [cada_n] [umbral_seg] [memoria_seg] | /perfil off"
+            )
+            return
+
+        action = context.args[0].lower()
+        if action == "off":
+            profiler.disable()
+            await update.message.reply_text("🔬 Profiler desactivado.")
+            return
+        if action != "on":
+            await update.message.reply_text("❌ Uso: /perfil on [cada_n] [umbral_seg] [memoria_seg] | /perfil off")
+            return
+
+        try:
+            every_n = int(context.args[1]) if len(context.args) > 1 else profiler.every_n or 100
+            slow_threshold = float(context.args[2]) if len(context.args) > 2 else profiler.slow_threshold
+            tracemalloc_interval = float(context.args[3]) if len(context.args) > 3 else profiler.tracemalloc_interval
+        except ValueError:
+            await update.message.reply_text("❌ Los parámetros deben ser números.")
+            return
+
+        profiler.configure(True, every_n, slow_threshold, tracemalloc_interval)
+        await update.message.reply_text(f"🔬 Profiler {profiler.status()}. Los resultados se guardan en logs/.")
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import sys
+from database import DatabaseHandler
+from services.shard_router import LAYOUT_GROUP, LAYOUT_BUCKET, shard_file_name
+
+TRANSACTION_COLUMNS = (
+    'id, user_id, group_id, type, amount, description, '
+    'category_id, money_type_id, currency, timestamp'
+)
+EXCHANGE_COLUMNS = (
+    'id, transaction_id, source_currency, target_currency, '
+    'exchange_rate, source_amount, target_amount'
+)
+LEDGER_COLUMNS = 'id, group_id, event_type, transaction_id, payload, undo_of, created_at'
+SNAPSHOT_COLUMNS = 'id, group_id, last_event_id, state, created_at'
+BUDGET_COLUMNS = 'group_id, category_id, currency, amount'
+RATE_COLUMNS = 'id, group_id, source_currency, target_currency, rate, timestamp'
+
+
+def migrate(db_path='expenses.db', layout=LAYOUT_GROUP, shard_dir='shards', buckets=16):
+    """
+    Split a single expenses.db into per-group (or per-bucket) shard files.
+    Row ids (and each group's ledger) are preserved, and every shard gets a full copy of
+    categories and money types.
+    The source database is left untouched.
+    """
+    if layout not in (LAYOUT_GROUP, LAYOUT_BUCKET):
+        print(f"Nothing to do for layout '{layout}'")
+        return
+
+    source = sqlite3.connect(db_path)
+    group_ids = [row[0] for row in source.execute('SELECT DISTINCT group_id FROM transactions')]
+    # Databases created before the ledger or budgets existed have no such tables to copy
+    ledger_tables = [
+        (table, columns)
+        for table, columns in (
+            ('ledger_events', LEDGER_COLUMNS), ('balance_snapshots', SNAPSHOT_COLUMNS), ('budgets', BUDGET_COLUMNS),
+            ('manual_exchange_rates', RATE_COLUMNS)
+        )
+        if source.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    ]
+    source.close()
+
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = {}
+    for group_id in group_ids:
+        shards.setdefault(shard_file_name(layout, group_id, buckets), []).append(group_id)
+
+    for file_name, shard_groups in shards.items():
+        path = os.path.join(shard_dir, file_name)
+        if os.path.exists(path):
+            print(f"Skipping {path}: file already exists")
+            continue
+
+        # DatabaseHandler creates the schema, then the rows are copied with ATTACH
+        shard = DatabaseHandler(path)
+        cursor = shard.cursor
+        try:
+            cursor.execute('ATTACH DATABASE ? AS src', (db_path,))
+            cursor.execute('BEGIN TRANSACTION')
+            cursor.execute('INSERT INTO categories (id, name) SELECT id, name FROM src.categories')
+            cursor.execute('INSERT INTO money_types (id, name) SELECT id, name FROM src.money_types')
+            placeholders = ','.join('?' * len(shard_groups))
+            cursor.execute(f'''
+                INSERT INTO transactions ({TRANSACTION_COLUMNS})
+                SELECT {TRANSACTION_COLUMNS} FROM src.transactions
+                WHERE group_id IN ({placeholders})
+            ''', shard_groups)
+            cursor.execute(f'''
+                INSERT INTO exchange_transactions ({EXCHANGE_COLUMNS})
+                SELECT {', '.join('e.' + col.strip() for col in EXCHANGE_COLUMNS.split(','))}
+                FROM src.exchange_transactions e
+                JOIN src.transactions t ON e.transaction_id = t.id
+                WHERE t.group_id IN ({placeholders})
+            ''', shard_groups)
+            for table, columns in ledger_tables:
+                cursor.execute(f'''
+                    INSERT INTO {table} ({columns})
+                    SELECT {columns} FROM src.{table}
+                    WHERE group_id IN ({placeholders})
+                ''', shard_groups)
+            # The month-to-date counters and category use counts are rebuilt from the copied rows
+            shard._count_spending(1, '1 = 1', ())
+            shard._backfill_category_uses()
+            cursor.execute('COMMIT')
+            cursor.execute('DETACH DATABASE src')
+            print(f"Wrote {path} for groups {shard_groups}")
+        except Exception as e:
+            cursor.execute('ROLLBACK')
+            shard.close()
+            os.remove(path)
+            print(f"Error migrating {path}: {e}")
+            raise
+        shard.close()
+
+    print(f"Migration completed successfully: {len(group_ids)} groups in {len(shards)} files")
+
+
+if __name__ == '__main__':
+    import config
+    migrate(
+        db_path=sys.argv[1] if len(sys.argv) > 1 else 'expenses.db',
+        layout=config.DB_LAYOUT if config.DB_LAYOUT != 'single' else LAYOUT_GROUP,
+        shard_dir=config.DB_SHARD_DIR,
+        buckets=config.DB_SHARD_BUCKETS,
+    )
@@ -1,95 +1,121 @@
 import io
-import matplotlib.pyplot as plt
-from typing import Dict, Any, Optional
+import math
+from matplotlib.figure import Figure
+from typing import Dict, Any, List, Optional, Tuple
 from utils.logger import logger
+from utils.metrics import metrics
+
+DEFAULT_CURRENCY = 'ARS'
+
+MONEY_TYPE_LABELS = {
+    'cash': '💵 Efectivo',
+    'bank': '🏦 Banco',
+}
+
 
 class QueryProcessor:
     def __init__(self, transaction_service):
         self.transaction_service = transaction_service
 
-    def get_money_type_id(self, money_type: Optional[str]) -> int:
-        """
-        Helper method to get (or create) the money type ID.
-        Defaults to "cash" if no money_type is provided.
-        """
-        if not money_type:
-            return self.transaction_service.db.get_or_create_money_type("cash")
-        return self.transaction_service.db.get_or_create_money_type(money_type)
-
     async def process_query(self, update, group_id: int, query_data: Dict[str, Any]) -> None:
         """
         Process query responses.
-        Handles balance queries and summary queries (with a pie chart) based on the 
-        'query_type' and 'money_type' fields in query_data.
+        Handles balance queries and summary queries (with a pie chart) based on the
+        'query_type' field in query_data.
         """
         try:
-            # Get balances by currency
-            ars_balances = self._get_balances_by_currency(group_id, 'ARS')
-            usd_balance = self.transaction_service.db.get_balance_by_money_type_and_currency(group_id, None, 'USD')
-
-            if query_data.get('query_type') == 'summary':
-                # Get expenses by category for ARS
-                ars_expenses = self.transaction_service.db.get_expenses_by_category(group_id, 'ARS')
-                
-                # Create pie chart
-                if ars_expenses:
-                    plt.figure(figsize=(10, 8))
-                    labels = [f"{cat} (${amount:,.2f})" for cat, amount in ars_expenses]
-                    values = [amount for _, amount in ars_expenses]
-                    
-                    plt.pie(values, labels=labels, autopct='%1.1f%%')
-                    plt.title('Distribución de Gastos por Categoría (ARS)')
-                    
-                    # Save plot to bytes buffer
-                    buf = io.BytesIO()
-                    plt.savefig(buf, format='png', bbox_inches='tight')
-                    buf.seek(0)
-                    plt.close()
-
-                # Create summary text
-                summary = (
-                    "📊 Resumen de tus finanzas:\n\n"
-                    "💵 Efectivo ARS: ${:,.2f}\n"
-                    "🏦 Banco ARS: ${:,.2f}\n"
-                    "💰 Total ARS: ${:,.2f}\n\n"
-                    "💰 Total USD: ${:,.2f}\n"
-                ).format(
-                    ars_balances['cash'],
-                    ars_balances['bank'],
-                    ars_balances['total'],
-                    usd_balance
-                )
-
-                # Send text and chart
-                await update.message.reply_text(summary)
-                if ars_expenses:
-                    await update.message.reply_photo(buf)
-                
-            else:
-                # Show simple balance without chart
-                await update.message.reply_text(
-                    f"Tus saldos:\n"
-                    f"💵 Efectivo ARS: ${ars_balances['cash']:,.2f}\n"
-                    f"🏦 Banco ARS: ${ars_balances['bank']:,.2f}\n"
-                    f"💰 Total ARS: ${ars_balances['total']:,.2f}\n\n"
-                    f"💰 Total USD: ${usd_balance:,.2f}"
-                )
+            text, chart = self.build_reply(group_id, query_data)
+            await update.message.reply_text(text)
+            if chart:
+                await update.message.reply_photo(chart)
         except Exception as e:
             logger.error(f"Error handling query: {e}")
             await update.message.reply_text(
                 "Perdón, hubo un error procesando tu consulta. ¿Podés intentarlo de nuevo?"
             )
 
-    def _get_balances_by_currency(self, group_id: int, currency: str) -> dict:
-        """Get balances for ARS currency."""
-        cash_balance = self.transaction_service.db.get_balance_by_money_type_and_currency(
-            group_id, self.get_money_type_id("cash"), currency
-        )
-        bank_balance = self.transaction_service.db.get_balance_by_money_type_and_currency(
-            group_id, self.get_money_type_id("bank"), currency
+    def build_reply(self, group_id: int, query_data: Dict[str, Any]) -> Tuple[str, Optional[io.BytesIO]]:
+        """Build the reply text (and chart for summaries) for a query."""
+        db = self.transaction_service.db_for(group_id)
+        balances = db.get_balances(group_id)
+        balances.setdefault(DEFAULT_CURRENCY, {})
+
+        if query_data.get('query_type') == 'net_worth':
+            currency = query_data.get('currency') or DEFAULT_CURRENCY
+            return self.format_net_worth(self.transaction_service.rates.net_worth(group_id, currency)), None
+
+        if query_data.get('query_type') == 'trend':
+            return self.transaction_service.analytics.trend_report(
+                group_id, query_data.get('currency') or DEFAULT_CURRENCY), None
+
+        if query_data.get('query_type') == 'typical':
+            return self.transaction_service.analytics.typical_report(
+                group_id, query_data.get('currency') or DEFAULT_CURRENCY), None
+
+        if query_data.get('query_type') == 'summary':
+            expenses = db.get_expenses_by_currency_and_category(group_id)
+            chart = self.render_expenses_chart(expenses) if expenses else None
+            return "📊 Resumen de tus finanzas:\n\n" + self.format_balances(balances), chart
+
+        # Show simple balance without chart
+        return "Tus saldos:\n" + self.format_balances(balances), None
+
+    @staticmethod
+    def format_balances(balances: Dict[str, Dict[str, float]]) -> str:
+        """Render one block per currency with a line per money type and the total."""
+        blocks = []
+        currencies = sorted(balances, key=lambda cur: (cur != DEFAULT_CURRENCY, cur))
+        for currency in currencies:
+            by_money_type = balances[currency]
+            lines = [
+                f"{MONEY_TYPE_LABELS.get(money_type, '💳 ' + money_type.capitalize())} {currency}: ${amount:,.2f}"
+                for money_type, amount in sorted(by_money_type.items())
+            ]
+            lines.append(f"💰 Total {currency}: ${sum(by_money_type.values()):,.2f}")
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
+
+    @staticmethod
+    def format_net_worth(result: Dict[str, Any]) -> str:
+        """Render ExchangeRateService.net_worth(): totals per money type, then expenses per category."""
+        currency = result['currency']
+        lines = [f"🏦 Patrimonio total en {currency}:"]
+        lines.extend(
+            f"{MONEY_TYPE_LABELS.get(money_type, '💳 ' + money_type.capitalize())}: ${amount:,.2f}"
+            for money_type, amount in sorted(result['by_money_type'])
         )
-        return {
-            'cash': cash_balance,
-            'bank': bank_balance,
-            'total': cash_balance + bank_balance
-        } 
\ No newline at end of file
+        lines.append(f"💰 Total: ${result['total']:,.2f} {currency}")
+        if result['categories']:
+            lines.append(f"\nGastos por categoría en {currency} (al tipo de cambio de cada mes):")
+            lines.extend(f"• {category}: ${amount:,.2f}" for category, amount in result['categories'])
+        if result['missing']:
+            lines.append(f"\n⚠️ Sin cotización para {', '.join(result['missing'])}: no se incluyó. "
+                         "Podés cargarla con /cotizacion MONEDA valor.")
+        return "\n".join(lines)
+
+    @staticmethod
+    def render_expenses_chart(expenses: Dict[str, List[Tuple[str, float]]]) -> io.BytesIO:
+        """
+        Render one expenses pie per currency into a single PNG.
+        Uses a standalone Figure rather than pyplot's global state, so it is safe off the event loop.
+        """
+        with metrics.timer('bot_chart_render_seconds'):
+            currencies = sorted(expenses, key=lambda cur: (cur != DEFAULT_CURRENCY, cur))
+            columns = min(len(currencies), 2)
+            rows = math.ceil(len(currencies) / columns)
+            fig = Figure(figsize=(10 * columns, 8 * rows))
+            axes = fig.subplots(rows, columns, squeeze=False)
+
+            for ax, currency in zip(axes.flat, currencies):
+                labels = [f"{cat} (${amount:,.2f})" for cat, amount in expenses[currency]]
+                values = [amount for _, amount in expenses[currency]]
+                ax.pie(values, labels=labels, autopct='%1.1f%%')
+                ax.set_title(f'Distribución de Gastos por Categoría ({currency})')
+            for ax in list(axes.flat)[len(currencies):]:
+                ax.axis('off')
+
+            # Save plot to bytes buffer
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', bbox_inches='tight')
+            buf.seek(0)
+            return buf
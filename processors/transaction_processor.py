@@ -1,4 +1,5 @@
 import logging
+from typing import List
 from models.transaction import Transaction, ExchangeTransaction
 from utils.logger import logger
 
@@ -9,11 +10,23 @@ class TransactionProcessor:
     def __init__(self, transaction_service):
         self.transaction_service = transaction_service
 
-    def process_transaction(self, user_id: int, group_id: int, transaction_data: dict) -> None:
+    def process_transaction(self, user_id: int, group_id: int, transaction_data: dict) -> List[Transaction]:
+        """Returns the expenses and incomes written, so callers can check budgets."""
         if transaction_data['type'] == "exchange":
             self._process_exchange_transaction(user_id, group_id, transaction_data)
-        else:
-            self._process_regular_transaction(user_id, group_id, transaction_data)
+            return []
+        return [self._process_regular_transaction(user_id, group_id, transaction_data)]
+
+    def process_transactions(self, user_id: int, group_id: int, items: list) -> List[Transaction]:
+        """Process several parsed transactions; expenses and incomes are inserted in one batch."""
+        regular = []
+        for transaction_data in items:
+            if transaction_data['type'] == "exchange":
+                self._process_exchange_transaction(user_id, group_id, transaction_data)
+            else:
+                regular.append(self._build_transaction(user_id, group_id, transaction_data))
+        self.transaction_service.add_transactions(regular)
+        return regular
 
     def _process_exchange_transaction(self, user_id: int, group_id: int, data: dict) -> None:
         try:
@@ -34,8 +47,8 @@ class TransactionProcessor:
                 transaction_type="income",  # Always income since we're receiving the target currency
                 amount=target_amount,
                 description=f"Exchange: {source_amount} {data['source_currency']} → {target_amount} {data['target_currency']}",
-                category_id=self._get_category_id("exchange"),
-                money_type_id=self._get_money_type_id(data.get('money_type', "cash")),
+                category_id=self._get_category_id(group_id, "exchange"),
+                money_type_id=self._get_money_type_id(group_id, data.get('money_type', "cash")),
                 currency=data['target_currency']
             )
             transaction_id = self.transaction_service.add_transaction(transaction)
@@ -50,14 +63,27 @@ class TransactionProcessor:
                 source_amount=source_amount,
                 target_amount=target_amount
             )
-            self.transaction_service.add_exchange_transaction(exchange_transaction)
+            self.transaction_service.add_exchange_transaction(exchange_transaction, group_id)
             logger.info(f"Created exchange record linking transaction {transaction_id}")
 
         except Exception as e:
             logger.error(f"Error processing exchange transaction: {e}")
             raise
 
-    def _process_regular_transaction(self, user_id: int, group_id: int, data: dict) -> None:
+    def _process_regular_transaction(self, user_id: int, group_id: int, data: dict) -> Transaction:
+        transaction = self._build_transaction(user_id, group_id, data)
+        self.transaction_service.add_transaction(transaction)
+
+        # Log the mappings for verification; the name lookups cost two queries, so only when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            db = self.transaction_service.db_for(group_id)
+            category_name = db.get_category_name(transaction.category_id)
+            money_type_name = db.get_money_type_name(transaction.money_type_id)
+            logger.debug(f"Transaction saved with category: {transaction.category_id} ({category_name}), "
+                         f"money_type: {transaction.money_type_id} ({money_type_name})")
+        return transaction
+
+    def _build_transaction(self, user_id: int, group_id: int, data: dict) -> Transaction:
         is_expense = data['type'] == "expense"
         currency = data.get('currency', 'ARS')  # Default to ARS if not specified
 
@@ -72,9 +98,9 @@ class TransactionProcessor:
             category_reason = data.get('category_reason', 'New category needed')
             logger.info(f"Creating new category '{category_name}'. Reason: {category_reason}")
 
-        category_id = self._get_category_id(data.get('category'))
-        money_type_id = self._get_money_type_id(data.get('money_type', "cash"))
-        transaction = Transaction(
+        category_id = self._get_category_id(group_id, data.get('category'))
+        money_type_id = self._get_money_type_id(group_id, data.get('money_type', "cash"))
+        return Transaction(
             user_id=user_id,
             group_id=group_id,
             transaction_type=data['type'],
@@ -84,13 +110,6 @@ class TransactionProcessor:
             money_type_id=money_type_id,
             currency=currency
         )
-        self.transaction_service.add_transaction(transaction)
-
-        # Log the mappings for verification
-        category_name = self.transaction_service.db.get_category_name(category_id)
-        money_type_name = self.transaction_service.db.get_money_type_name(money_type_id)
-        logger.info(f"Transaction saved with category: {category_id} ({category_name}), "
-                    f"money_type: {money_type_id} ({money_type_name})")
 
     def _format_exchange_description(self, data: dict) -> str:
         return (
@@ -98,12 +117,12 @@ class TransactionProcessor:
             f"{data['target_amount']} {data['target_currency']}"
         )
 
-    def _get_category_id(self, category_name: str) -> int:
+    def _get_category_id(self, group_id: int, category_name: str) -> int:
         if not category_name:
-            return self._get_category_id("otros")
-        return self.transaction_service.db.get_or_create_category(category_name)
+            return self._get_category_id(group_id, "otros")
+        return self.transaction_service.categories.resolve(group_id, category_name)
 
-    def _get_money_type_id(self, money_type: str) -> int:
+    def _get_money_type_id(self, group_id: int, money_type: str) -> int:
         if not money_type:
-            return self._get_money_type_id("cash")
-        return self.transaction_service.db.get_or_create_money_type(money_type) 
\ No newline at end of file
+            return self._get_money_type_id(group_id, "cash")
+        return self.transaction_service.db_for(group_id).get_or_create_money_type(money_type)
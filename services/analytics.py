@@ -0,0 +1,339 @@
+from calendar import monthrange
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import config
+from processors.query_processor import DEFAULT_CURRENCY
+from services.reports import parse_time
+from utils.logger import logger
+from utils.metrics import metrics
+
+# New ledger events replayed onto a cached group before reloading it is cheaper
+MAX_REPLAYED_EVENTS = 500
+# Months of monthly totals behind the rolling average
+ROLLING_MONTHS = 3
+# Weeks the weekly digest compares against
+DIGEST_WEEKS = 8
+
+
+class ExpenseColumns:
+    """A group's expenses as parallel NumPy arrays, as of ledger event `event_id`."""
+
+    def __init__(self, rows: List[tuple], event_id: int):
+        self.event_id = event_id
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.times = np.array([row[1] for row in rows], dtype='datetime64[s]')
+        self.amounts = np.array([row[2] for row in rows], dtype=float)
+        self.categories = np.array([-1 if row[3] is None else row[3] for row in rows], dtype=np.int64)
+        self.currencies = np.array([row[4] for row in rows], dtype=str)
+
+    def append(self, rows: List[tuple], event_id: int) -> 'ExpenseColumns':
+        added = ExpenseColumns(rows, event_id)
+        for name in ('ids', 'times', 'amounts', 'categories'):
+            setattr(added, name, np.concatenate([getattr(self, name), getattr(added, name)]))
+        added.currencies = np.concatenate([self.currencies, added.currencies]).astype(str)
+        return added
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def log_stats(categories: np.ndarray, amounts: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-category count, mean and standard deviation of log amounts; categories are codes < size."""
+    logs = np.log1p(amounts)
+    counts = np.bincount(categories, minlength=size).astype(float)
+    divisor = np.maximum(counts, 1)
+    means = np.bincount(categories, weights=logs, minlength=size) / divisor
+    variances = np.bincount(categories, weights=logs ** 2, minlength=size) / divisor - means ** 2
+    return counts, means, np.sqrt(np.maximum(variances, 0))
+
+
+def month_index(times: np.ndarray) -> np.ndarray:
+    """Months since 1970-01 for each timestamp."""
+    return times.astype('datetime64[M]').astype(np.int64)
+
+
+class AnalyticsService:
+    """
+    Spending trends, typical amounts and anomalies computed with NumPy.
+
+    A group's expenses are loaded once into arrays and kept in an LRU. Before each use the
+    group's newest ledger event is compared with the one the arrays were built at: new
+    inserts are appended from the journal, anything else (a delete, rename or clear)
+    reloads the group. Every statistic is then a few bincounts over those arrays.
+    """
+
+    def __init__(self, transaction_service, history_months: int = config.ANALYTICS_HISTORY_MONTHS,
+                 z_threshold: float = config.ANOMALY_Z_THRESHOLD, min_samples: int = config.ANOMALY_MIN_SAMPLES,
+                 cache_size: int = config.ANALYTICS_CACHE_GROUPS):
+        self.transaction_service = transaction_service
+        self.history_months = max(history_months, 1)
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.cache_size = max(cache_size, 1)
+        self._cache: "OrderedDict[int, ExpenseColumns]" = OrderedDict()
+
+    def columns(self, group_id: int) -> ExpenseColumns:
+        db = self.transaction_service.db_for(group_id)
+        last_id = db.last_ledger_event_id(group_id)
+        columns = self._cache.get(group_id)
+        if columns is not None and columns.event_id != last_id:
+            columns = self._catch_up(db, group_id, columns, last_id)
+        if columns is None:
+            columns = ExpenseColumns(db.get_expense_history(group_id), last_id)
+            metrics.inc('bot_analytics_loads_total')
+        self._cache[group_id] = columns
+        self._cache.move_to_end(group_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return columns
+
+    @staticmethod
+    def _catch_up(db, group_id: int, columns: ExpenseColumns, last_id: int) -> Optional[ExpenseColumns]:
+        """Append the expenses inserted since the arrays were built, or None if they must be reloaded."""
+        if last_id < columns.event_id:
+            # The group's file was dropped and its journal started over
+            return None
+        events = db.get_ledger_events(group_id, after_id=columns.event_id, until_id=last_id,
+                                      limit=MAX_REPLAYED_EVENTS + 1)
+        if len(events) > MAX_REPLAYED_EVENTS:
+            return None
+        rows = []
+        for _, event_type, transaction_id, payload, _, _ in events:
+            if event_type == 'insert':
+                if payload.get('type') == 'expense':
+                    rows.append((transaction_id, payload['timestamp'], -payload['amount'],
+                                 payload.get('category_id'), payload.get('currency') or DEFAULT_CURRENCY))
+            elif event_type != 'exchange':
+                return None
+        return columns.append(rows, last_id)
+
+    def forget(self, group_id: int) -> None:
+        self._cache.pop(group_id, None)
+
+    # Anomalies
+
+    def anomalies(self, transactions) -> List[str]:
+        """
+        Alerts for just-written expenses far above what the group usually spends in their
+        category: a z-score over the log amounts of the category's earlier expenses.
+        """
+        expenses = [t for t in transactions if t.type == 'expense']
+        if not expenses:
+            return []
+        group_id = expenses[0].group_id
+        columns = self.columns(group_id)
+        # The new expenses are the newest rows; the statistics must not include them
+        history = max(len(columns) - len(expenses), 0)
+        flagged = self._score(
+            columns.categories[:history], columns.currencies[:history], columns.amounts[:history],
+            np.array([-1 if t.category_id is None else t.category_id for t in expenses], dtype=np.int64),
+            np.array([t.currency for t in expenses], dtype=str),
+            np.array([-t.amount for t in expenses], dtype=float),
+        )
+        db = self.transaction_service.db_for(group_id)
+        alerts = []
+        for position, typical in flagged:
+            expense = expenses[position]
+            category = db.get_category_name(expense.category_id) or 'sin categoría'
+            logger.info(f"Unusual expense in group {group_id}: {-expense.amount} {expense.currency} in '{category}'")
+            metrics.inc('bot_anomalies_total')
+            alerts.append(f"🧐 ${-expense.amount:,.2f} {expense.currency} en {category} es mucho más de lo habitual "
+                          f"(normalmente ronda ${typical:,.2f}).")
+        return alerts
+
+    def _score(self, categories, currencies, amounts, new_categories, new_currencies, new_amounts
+               ) -> List[Tuple[int, float]]:
+        """(position, typical amount) of every new expense whose z-score passes the threshold."""
+        if not len(categories) or not len(new_amounts):
+            return []
+        # One code per (category, currency) pair, shared by the history and the new expenses
+        pairs = np.char.add(np.char.add(categories.astype(str), ':'), currencies)
+        new_pairs = np.char.add(np.char.add(new_categories.astype(str), ':'), new_currencies)
+        names, codes = np.unique(pairs, return_inverse=True)
+        counts, means, stds = log_stats(codes, amounts, len(names))
+
+        positions = np.searchsorted(names, new_pairs)
+        known = (positions < len(names)) & (names[np.minimum(positions, len(names) - 1)] == new_pairs)
+        positions = np.where(known, positions, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (np.log1p(new_amounts) - means[positions]) / stds[positions]
+        flagged = known & (counts[positions] >= self.min_samples) & (stds[positions] > 0) & (z > self.z_threshold)
+        return [(int(i), float(np.expm1(means[positions[i]]))) for i in np.flatnonzero(flagged)]
+
+    # Trends
+
+    def month_comparison(self, group_id: int, currency: str = DEFAULT_CURRENCY,
+                         now: Optional[datetime] = None) -> Optional[dict]:
+        """
+        This month so far against the average of the previous ANALYTICS_HISTORY_MONTHS, per
+        category. The average is prorated to the share of the month that has passed.
+        """
+        now = now or datetime.now(timezone.utc)
+        columns = self.columns(group_id)
+        mask = columns.currencies == currency
+        if not mask.any():
+            return None
+        current = (now.year - 1970) * 12 + now.month - 1
+        offsets = current - month_index(columns.times[mask])
+        amounts = columns.amounts[mask]
+        category_ids, codes = np.unique(columns.categories[mask], return_inverse=True)
+        size, months = len(category_ids), self.history_months
+
+        # totals[c, j]: spending in category c, j + 1 months ago
+        window = (offsets >= 1) & (offsets <= months)
+        totals = np.bincount(codes[window] * months + offsets[window] - 1, weights=amounts[window],
+                             minlength=size * months).reshape(size, months)
+        # Months before the group's first expense are missing, not zero spending
+        observed = int(min(months, offsets.max()))
+        this_month = np.bincount(codes[offsets == 0], weights=amounts[offsets == 0], minlength=size)
+        elapsed = (now.day - 1 + (now.hour * 60 + now.minute) / 1440) / monthrange(now.year, now.month)[1]
+        average = totals[:, :observed].mean(axis=1) if observed else np.zeros(size)
+        expected = average * elapsed
+
+        # Monthly totals of up to 12 full months, oldest first, for the rolling average
+        recent = (offsets >= 1) & (offsets <= 12)
+        monthly = np.bincount(12 - offsets[recent], weights=amounts[recent], minlength=12)[-min(12, offsets.max()):] \
+            if offsets.max() else np.array([])
+        rolling = np.convolve(monthly, np.ones(ROLLING_MONTHS) / ROLLING_MONTHS, mode='valid') \
+            if len(monthly) >= ROLLING_MONTHS else np.array([])
+
+        order = np.argsort(-(this_month - expected))
+        return {
+            'currency': currency,
+            'observed_months': observed,
+            'spent': float(this_month.sum()),
+            'expected': float(expected.sum()),
+            'categories': [
+                (int(category_ids[i]), float(this_month[i]), float(expected[i]))
+                for i in order if this_month[i] or expected[i]
+            ],
+            'rolling': rolling.tolist(),
+        }
+
+    def category_percentiles(self, group_id: int, currency: str = DEFAULT_CURRENCY
+                             ) -> List[Tuple[int, int, float, float, float]]:
+        """(category_id, count, p25, p50, p90) of single expenses per category, most frequent first."""
+        columns = self.columns(group_id)
+        mask = columns.currencies == currency
+        categories, amounts = columns.categories[mask], columns.amounts[mask]
+        if not len(amounts):
+            return []
+        order = np.lexsort((amounts, categories))
+        categories, amounts = categories[order], amounts[order]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(categories)) + 1])
+        result = []
+        for segment, start in zip(np.split(amounts, starts[1:]), starts):
+            p25, p50, p90 = np.percentile(segment, [25, 50, 90])
+            result.append((int(categories[start]), len(segment), float(p25), float(p50), float(p90)))
+        return sorted(result, key=lambda row: -row[1])
+
+    # Replies
+
+    def _category_name(self, group_id: int, category_id: int) -> str:
+        if category_id < 0:
+            return 'sin categoría'
+        return self.transaction_service.db_for(group_id).get_category_name(category_id) or 'sin categoría'
+
+    def trend_report(self, group_id: int, currency: str = DEFAULT_CURRENCY) -> str:
+        comparison = self.month_comparison(group_id, currency)
+        if comparison is None or not comparison['observed_months']:
+            return f"Todavía no hay meses anteriores en {currency} para comparar."
+        spent, expected = comparison['spent'], comparison['expected']
+        change = (spent / expected - 1) if expected else 0.0
+        verdict = ("📈 Vas gastando más de lo normal" if change > 0.1 else
+                   "📉 Vas gastando menos de lo normal" if change < -0.1 else "👌 Vas gastando lo normal")
+        lines = [
+            f"{verdict} este mes ({currency}).",
+            f"Llevás ${spent:,.2f}; a esta altura del mes solés llevar ${expected:,.2f} "
+            f"(promedio de {comparison['observed_months']} meses).\n",
+        ]
+        for category_id, category_spent, category_expected in comparison['categories'][:8]:
+            name = self._category_name(group_id, category_id)
+            if category_expected:
+                lines.append(f"• {name}: ${category_spent:,.2f} ({category_spent / category_expected - 1:+.0%})")
+            else:
+                lines.append(f"• {name}: ${category_spent:,.2f} (nuevo)")
+        rolling = comparison['rolling']
+        if rolling:
+            lines.append(f"\nPromedio móvil de {ROLLING_MONTHS} meses: ${rolling[-1]:,.2f}")
+            if len(rolling) > ROLLING_MONTHS and rolling[-1 - ROLLING_MONTHS]:
+                lines[-1] += f" ({rolling[-1] / rolling[-1 - ROLLING_MONTHS] - 1:+.0%} contra {ROLLING_MONTHS} meses atrás)"
+        return "\n".join(lines)
+
+    def typical_report(self, group_id: int, currency: str = DEFAULT_CURRENCY) -> str:
+        rows = self.category_percentiles(group_id, currency)
+        if not rows:
+            return f"No hay gastos en {currency} todavía."
+        lines = [f"📐 Gasto típico por categoría ({currency}): mediana, rango habitual y p90\n"]
+        for category_id, count, p25, p50, p90 in rows[:10]:
+            lines.append(f"• {self._category_name(group_id, category_id)}: ${p50:,.2f} "
+                         f"(${p25:,.2f}–${p90:,.2f}, {count} gastos)")
+        return "\n".join(lines)
+
+    def weekly_digest(self, group_id: int, now: Optional[datetime] = None) -> Optional[str]:
+        """Last 7 days against the weekly average of the previous DIGEST_WEEKS, with unusual expenses."""
+        now = now or datetime.now(timezone.utc)
+        columns = self.columns(group_id)
+        week_start = np.datetime64((now - timedelta(days=7)).replace(tzinfo=None), 's')
+        in_week = columns.times >= week_start
+        if not in_week.any():
+            return None
+
+        blocks = ["🗓 Resumen semanal"]
+        earlier = ~in_week
+        weeks_ago = (week_start - columns.times) // np.timedelta64(7, 'D')
+        for currency in sorted(set(columns.currencies[in_week]), key=lambda cur: (cur != DEFAULT_CURRENCY, cur)):
+            mask = columns.currencies == currency
+            week = in_week & mask
+            spent = float(columns.amounts[week].sum())
+            previous = earlier & mask & (weeks_ago < DIGEST_WEEKS)
+            lines = [f"Gastaste ${spent:,.2f} {currency} en los últimos 7 días."]
+            if previous.any():
+                observed = int(weeks_ago[previous].max()) + 1
+                average = float(columns.amounts[previous].sum()) / observed
+                if average:
+                    lines[0] += f" Tu promedio semanal es ${average:,.2f} ({spent / average - 1:+.0%})."
+
+            category_ids, codes = np.unique(columns.categories[week], return_inverse=True)
+            totals = np.bincount(codes, weights=columns.amounts[week])
+            for i in np.argsort(-totals)[:3]:
+                lines.append(f"• {self._category_name(group_id, int(category_ids[i]))}: ${totals[i]:,.2f}")
+
+            history = earlier & mask
+            flagged = self._score(
+                columns.categories[history], columns.currencies[history], columns.amounts[history],
+                columns.categories[week], columns.currencies[week], columns.amounts[week],
+            )
+            for position, typical in flagged:
+                category = self._category_name(group_id, int(columns.categories[week][position]))
+                lines.append(f"🧐 ${columns.amounts[week][position]:,.2f} en {category} "
+                             f"(normalmente ronda ${typical:,.2f})")
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
+
+    async def post_init(self, application) -> None:
+        at = parse_time(config.WEEKLY_DIGEST_TIME)
+        if at is None:
+            return
+        if application.job_queue is None:
+            logger.warning('Weekly digest disabled: install "python-telegram-bot[job-queue]" to enable it')
+            return
+        application.job_queue.run_daily(self.digest_job, time=at, days=(config.WEEKLY_DIGEST_DAY,),
+                                        name='weekly-digest')
+        logger.info(f"Weekly digest scheduled on day {config.WEEKLY_DIGEST_DAY} at {config.WEEKLY_DIGEST_TIME}")
+
+    async def digest_job(self, context) -> None:
+        """JobQueue callback: send the weekly digest to every group that spent something this week."""
+        sent = 0
+        for group_id in self.transaction_service.reports.active_groups(days=7):
+            try:
+                digest = self.weekly_digest(group_id)
+                if digest:
+                    await context.bot.send_message(chat_id=group_id, text=digest)
+                    sent += 1
+            except Exception as e:
+                logger.error(f"Error sending the weekly digest to group {group_id}: {e}")
+        metrics.inc('bot_weekly_digests_total', value=sent)
+        logger.info(f"Sent {sent} weekly digests")
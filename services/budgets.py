@@ -0,0 +1,61 @@
+from collections import defaultdict
+from typing import List, Tuple
+from utils.logger import logger
+
+# Share of the budget at which an alert is sent, highest first
+ALERT_THRESHOLDS = (1.0, 0.8)
+
+
+def format_amount(amount: float, currency: str) -> str:
+    return f"${amount:,.2f} {currency}"
+
+
+class BudgetService:
+    """
+    Monthly budgets per category.
+
+    Spending is never re-summed: the repository keeps month-to-date counters that are
+    updated in the same write transaction as every insert and delete, so checking a
+    budget after an expense is a single primary-key lookup however long the history is.
+    """
+
+    def __init__(self, transaction_service):
+        self.transaction_service = transaction_service
+
+    def set(self, group_id: int, category: str, amount: float, currency: str = 'ARS') -> None:
+        category_id = self.transaction_service.categories.resolve(group_id, category)
+        self.transaction_service.db_for(group_id).set_budget(group_id, category_id, amount, currency)
+
+    def list(self, group_id: int) -> List[Tuple[str, str, float, float]]:
+        return self.transaction_service.db_for(group_id).get_budgets(group_id)
+
+    def check(self, transactions) -> List[str]:
+        """Alerts for the budgets that the just-written expenses pushed past 80% or 100%."""
+        added = defaultdict(float)
+        for transaction in transactions:
+            if transaction.type == 'expense' and transaction.category_id is not None:
+                added[(transaction.group_id, transaction.category_id, transaction.currency)] -= transaction.amount
+
+        alerts = []
+        for (group_id, category_id, currency), amount in added.items():
+            db = self.transaction_service.db_for(group_id)
+            status = db.get_budget_status(group_id, category_id, currency)
+            if not status:
+                continue
+            budget, spent = status
+            before = spent - amount
+            for threshold in ALERT_THRESHOLDS:
+                if before < budget * threshold <= spent:
+                    category = db.get_category_name(category_id)
+                    logger.info(f"Budget of '{category}' in group {group_id} crossed {threshold:.0%}")
+                    alerts.append(self._alert(category, threshold, budget, spent, currency))
+                    break
+        return alerts
+
+    @staticmethod
+    def _alert(category: str, threshold: float, budget: float, spent: float, currency: str) -> str:
+        if threshold >= 1:
+            return (f"🚨 Superaste el presupuesto de {category}: "
+                    f"{format_amount(spent, currency)} de {format_amount(budget, currency)}.")
+        return (f"⚠️ Ya usaste el {spent / budget:.0%} del presupuesto de {category}: "
+                f"{format_amount(spent, currency)} de {format_amount(budget, currency)}.")
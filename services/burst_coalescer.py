@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+
+class BurstCoalescer:
+    """
+    Per-key debounce: items added within `window` seconds of each other are handed to
+    `flush(key, items)` together once the key has been quiet for `window` seconds, or as
+    soon as `max_items` have piled up.
+    """
+
+    def __init__(self, flush: Callable[[Hashable, List[Any]], Awaitable[None]], window: float,
+                 max_items: int = 10):
+        self._flush = flush
+        self.window = window
+        self.max_items = max_items
+        self._pending: Dict[Hashable, List[Any]] = {}
+        self._timers: Dict[Hashable, asyncio.Task] = {}
+
+    def add(self, key: Hashable, item: Any) -> None:
+        items = self._pending.setdefault(key, [])
+        items.append(item)
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        delay = 0 if len(items) >= self.max_items else self.window
+        self._timers[key] = asyncio.create_task(self._wait_and_flush(key, delay))
+
+    def has_pending(self, key: Hashable) -> bool:
+        return key in self._pending
+
+    async def _wait_and_flush(self, key: Hashable, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # From here on a new add() must not cancel this task: it starts a new burst
+        self._timers.pop(key, None)
+        await self.flush_now(key)
+
+    async def flush_now(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        items = self._pending.pop(key, None)
+        if items:
+            await self._flush(key, items)
+
+    async def shutdown(self) -> None:
+        for key in list(self._pending):
+            await self.flush_now(key)
@@ -0,0 +1,115 @@
+import re
+from typing import List, Optional, Sequence
+import config
+from services.intent_router import normalize
+from utils.logger import logger
+from utils.metrics import metrics
+
+# The categories the extraction prompt's rules name, offered to groups that have few of their own
+DEFAULT_CATEGORIES = ('supermercado', 'alquiler', 'transporte', 'entretenimiento', 'salud', 'educación',
+                      'ropa', 'servicios', 'tarjetas', 'delivery', 'vicios', 'otros')
+# Internal category of currency exchanges; never offered to the model
+EXCHANGE_CATEGORY = 'exchange'
+# A new name this long or longer that starts an existing one is an abbreviation of it ("super")
+MIN_PREFIX = 4
+
+_SPACES = re.compile(r'[\s_-]+')
+
+
+def fold(name: str) -> str:
+    """Case- and accent-folded form used to compare category names: 'Súper ' -> 'super'."""
+    return _SPACES.sub(' ', normalize(name)).strip()
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between a and b, or limit + 1 as soon as it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def allowed_distance(name: str) -> int:
+    """Typos tolerated for a folded name: none for short words, where one letter is another word."""
+    if len(name) >= 9:
+        return 2
+    return 1 if len(name) >= 5 else 0
+
+
+def canonicalize(name: str, vocabulary: Sequence[str]) -> Optional[str]:
+    """
+    The vocabulary entry `name` is a variant of, or None. The same name once folded wins,
+    then an entry it abbreviates, then the closest within allowed_distance(); ties go to
+    the entry listed first, which is the group's most used one.
+    """
+    folded = fold(name)
+    if not folded:
+        return None
+    candidates = [(fold(entry), entry) for entry in vocabulary]
+    for candidate, entry in candidates:
+        if candidate == folded:
+            return entry
+    if len(folded) >= MIN_PREFIX:
+        for candidate, entry in candidates:
+            if candidate.startswith(folded):
+                return entry
+    limit = allowed_distance(folded)
+    best, best_distance = None, limit + 1
+    for candidate, entry in candidates:
+        distance = edit_distance(folded, candidate, limit)
+        if distance < best_distance:
+            best, best_distance = entry, distance
+    return best
+
+
+class CategoryService:
+    """
+    Each group's category vocabulary: the categories it has used or budgeted, with use
+    counts the repository keeps in step with every write. A name coming from the model is
+    matched against that vocabulary (plus the default categories) before a new category
+    is created, so "super", "Súper" and "supermercdo" all land on "supermercado". Only the
+    PROMPT_CATEGORIES most used ones are listed in the extraction prompt.
+    """
+
+    def __init__(self, transaction_service, prompt_size: int = config.PROMPT_CATEGORIES):
+        self.transaction_service = transaction_service
+        self.prompt_size = max(prompt_size, 1)
+
+    def vocabulary(self, group_id: int, limit: Optional[int] = None) -> List[str]:
+        """The group's category names, most used first, without the internal exchange category."""
+        rows = self.transaction_service.db_for(group_id).get_group_categories(group_id, limit)
+        return [name for _, name, _ in rows if name != EXCHANGE_CATEGORY]
+
+    def resolve(self, group_id: int, name: str) -> int:
+        """Id of the category `name` means for the group, creating it only when nothing matches."""
+        db = self.transaction_service.db_for(group_id)
+        cleaned = _SPACES.sub(' ', name.lower()).strip() or 'otros'
+        if cleaned == EXCHANGE_CATEGORY:
+            canonical = cleaned
+        else:
+            vocabulary = self.vocabulary(group_id)
+            canonical = canonicalize(cleaned, vocabulary + [c for c in DEFAULT_CATEGORIES if c not in vocabulary])
+            if canonical is None:
+                canonical = cleaned
+                logger.info(f"New category '{canonical}' for group {group_id}")
+                metrics.inc('bot_categories_created_total')
+            elif canonical != cleaned:
+                logger.debug(f"Category '{name}' matched '{canonical}' in group {group_id}")
+                metrics.inc('bot_categories_merged_total')
+        category_id = db.get_or_create_category(canonical)
+        db.add_group_category(group_id, category_id)
+        return category_id
+
+    def prompt_categories(self, group_id: int) -> List[str]:
+        """The group's most used categories, topped up with the defaults while it has few."""
+        # One extra row in case the exchange category is among the most used
+        names = self.vocabulary(group_id, self.prompt_size + 1)[:self.prompt_size]
+        names.extend(c for c in DEFAULT_CATEGORIES if c not in names)
+        return names[:self.prompt_size]
@@ -0,0 +1,76 @@
+import threading
+import time
+from utils.logger import logger
+from utils.metrics import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and allow()
+    returns False. Once `reset_timeout` seconds have passed it is half-open: a single trial
+    call is let through, and its failure reopens the circuit right away while a success
+    closes it. Until that call is recorded (or released) allow() keeps returning False.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _refresh(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._refresh()
+
+    def allow(self) -> bool:
+        """Whether to make a call; a half-open circuit hands out one trial call at a time."""
+        with self._lock:
+            state = self._refresh()
+            if state == CLOSED:
+                return True
+            if state == OPEN or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release(self) -> None:
+        """Give back a trial call that ended without a verdict (cancelled, or a caller error)."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._probing = False
+            if self._state != CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._probing = False
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} failures")
+                    metrics.inc('bot_circuit_opens_total', circuit=self.name)
+                self._state = OPEN
+                self._opened_at = self._clock()
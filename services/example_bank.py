@@ -0,0 +1,87 @@
+import json
+import re
+from typing import List, Optional, Set
+from services.intent_router import INTENT_TRANSACTION, INTENT_MULTI, INTENT_EXCHANGE, normalize
+
+# Examples shown to the model, at most this many per prompt
+MAX_EXAMPLES = 2
+
+_WORD = re.compile(r'[a-z]+')
+
+
+def _expense(amount, description, money_type, category, currency='ARS', type_='expense'):
+    return {
+        'type': type_,
+        'amount': amount,
+        'description': description,
+        'money_type': money_type,
+        'category': category,
+        'should_create_category': False,
+        'category_reason': '',
+        'currency': currency,
+    }
+
+
+# (intent, message, expected JSON); transactions are always answered as a list
+EXAMPLE_BANK = [
+    (INTENT_TRANSACTION, "Gasté 10000 en fiambrería",
+     [_expense(10000.0, "Fiambreria", "cash", "supermercado")]),
+    (INTENT_TRANSACTION, "Pagué el alquiler $50000",
+     [_expense(50000.0, "Alquiler", "bank", "alquiler")]),
+    (INTENT_TRANSACTION, "Compré carne en la carnicería $15000",
+     [_expense(15000.0, "Carniceria", "cash", "supermercado")]),
+    (INTENT_TRANSACTION, "Cargué nafta 30000 con la tarjeta",
+     [_expense(30000.0, "Nafta", "bank", "transporte")]),
+    (INTENT_TRANSACTION, "Pedí por rappi 12000",
+     [_expense(12000.0, "Rappi", "bank", "delivery")]),
+    (INTENT_TRANSACTION, "Pagué 15 USD de Netflix con la tarjeta",
+     [_expense(15.0, "Netflix", "bank", "servicios", currency='USD')]),
+    (INTENT_TRANSACTION, "Cobré el sueldo 800000 por transferencia",
+     [_expense(800000.0, "Sueldo", "bank", "sueldo", type_='income')]),
+    (INTENT_MULTI, "500 en pan y 300 en leche en efectivo",
+     [_expense(500.0, "Pan", "cash", "supermercado"), _expense(300.0, "Leche", "cash", "supermercado")]),
+    (INTENT_MULTI, "Gasté 2000 en el subte y cobré 15000 por un trabajo",
+     [_expense(2000.0, "Subte", "cash", "transporte"),
+      _expense(15000.0, "Trabajo", "cash", "trabajo", type_='income')]),
+    (INTENT_EXCHANGE, "Cambié 100 USD a 120000 pesos",
+     {'type': 'exchange', 'amount': 100.0, 'target_amount': 120000.0, 'source_currency': 'USD',
+      'target_currency': 'ARS', 'money_type': 'cash', 'exchange_rate': 1200.0}),
+    (INTENT_EXCHANGE, "Compré 50 dólares a 1250 por el banco",
+     {'type': 'exchange', 'amount': 62500.0, 'target_amount': 50.0, 'source_currency': 'ARS',
+      'target_currency': 'USD', 'money_type': 'bank', 'exchange_rate': 0.0008}),
+]
+
+# Intents whose examples can stand in for one another
+_COMPATIBLE = {
+    INTENT_TRANSACTION: (INTENT_TRANSACTION,),
+    INTENT_MULTI: (INTENT_MULTI, INTENT_TRANSACTION),
+    INTENT_EXCHANGE: (INTENT_EXCHANGE,),
+}
+
+
+def words(message: str) -> Set[str]:
+    return set(_WORD.findall(normalize(message)))
+
+
+def select_examples(message: str, intent: Optional[str] = None, limit: int = MAX_EXAMPLES) -> List[tuple]:
+    """
+    The examples most similar to the message (word overlap), among those of the routed
+    intent. Ties keep the bank's order, so a message with no overlap still gets the first one.
+    """
+    allowed = _COMPATIBLE.get(intent)
+    candidates = [example for example in EXAMPLE_BANK if allowed is None or example[0] in allowed]
+    message_words = words(message)
+
+    def similarity(example) -> float:
+        example_words = words(example[1])
+        return len(message_words & example_words) / (len(message_words | example_words) or 1)
+
+    # sorted() is stable, so equal scores keep the bank's order
+    return sorted(candidates, key=similarity, reverse=True)[:limit]
+
+
+def format_examples(examples: List[tuple]) -> str:
+    return '\n\n'.join(
+        f'{n}. "{message}" →\n{json.dumps(output, ensure_ascii=False)}'
+        for n, (_, message, output) in enumerate(examples, 1)
+    )
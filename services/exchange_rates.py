@@ -0,0 +1,143 @@
+import bisect
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from processors.query_processor import DEFAULT_CURRENCY
+from services.reports import month_end
+
+_CURRENCY_ALIASES = {
+    'DOLAR': 'USD', 'DOLARES': 'USD', 'DÓLAR': 'USD', 'DÓLARES': 'USD', 'U$S': 'USD',
+    'PESO': 'ARS', 'PESOS': 'ARS', 'EURO': 'EUR', 'EUROS': 'EUR',
+}
+
+
+def parse_currency(value: str) -> Optional[str]:
+    """'usd', 'dólares' -> 'USD'; None unless it looks like a currency code."""
+    code = _CURRENCY_ALIASES.get(value.upper(), value.upper())
+    return code if len(code) == 3 and code.isalpha() else None
+
+
+class RateIndex:
+    """
+    As-of exchange rates of one group.
+
+    Every (source, target) pair keeps its timestamps and rates sorted, in both directions,
+    so the rate in force at a moment is a bisect over the pair's history. Pairs never
+    traded directly are crossed through pesos, the currency every exchange goes through.
+    """
+
+    def __init__(self, rows: List[Tuple[str, str, str, float]]):
+        self._pairs: Dict[Tuple[str, str], Tuple[List[str], List[float]]] = {}
+        for timestamp, source, target, rate in rows:
+            self._add(source, target, timestamp, rate)
+            self._add(target, source, timestamp, 1 / rate)
+
+    def _add(self, source: str, target: str, timestamp: str, rate: float) -> None:
+        times, rates = self._pairs.setdefault((source, target), ([], []))
+        position = bisect.bisect_right(times, timestamp)
+        times.insert(position, timestamp)
+        rates.insert(position, rate)
+
+    def _direct(self, source: str, target: str, when: Optional[str]) -> Optional[float]:
+        pair = self._pairs.get((source, target))
+        if pair is None:
+            return None
+        times, rates = pair
+        if when is None:
+            return rates[-1]
+        # Before the first recorded rate, the first one is the best estimate there is
+        return rates[max(bisect.bisect_right(times, when) - 1, 0)]
+
+    def rate(self, source: str, target: str, when: Optional[str] = None) -> Optional[float]:
+        """Units of target per unit of source at `when` ('YYYY-MM-DD HH:MM:SS', UTC; latest if None)."""
+        if source == target:
+            return 1.0
+        rate = self._direct(source, target, when)
+        if rate is None and DEFAULT_CURRENCY not in (source, target):
+            to_pesos = self._direct(source, DEFAULT_CURRENCY, when)
+            from_pesos = self._direct(DEFAULT_CURRENCY, target, when)
+            if to_pesos and from_pesos:
+                rate = to_pesos * from_pesos
+        return rate
+
+    def latest(self) -> List[Tuple[str, float, str]]:
+        """(currency, pesos per unit, since) for every currency quoted against pesos."""
+        return sorted(
+            (source, rates[-1], times[-1])
+            for (source, target), (times, rates) in self._pairs.items()
+            if target == DEFAULT_CURRENCY
+        )
+
+
+class ExchangeRateService:
+    """
+    Exchange rates implied by the group's exchanges plus the ones typed with /cotizacion.
+
+    The RateIndex of a group is built once and kept until an exchange is recorded, deleted
+    or undone, or a rate is typed; until then net worth queries only read balances and the
+    monthly counters and convert them against the cached index.
+    """
+
+    def __init__(self, transaction_service):
+        self.transaction_service = transaction_service
+        self._indexes: Dict[int, RateIndex] = {}
+
+    def index(self, group_id: int) -> RateIndex:
+        index = self._indexes.get(group_id)
+        if index is None:
+            index = RateIndex(self.transaction_service.db_for(group_id).get_exchange_rates(group_id))
+            self._indexes[group_id] = index
+        return index
+
+    def forget(self, group_id: int) -> None:
+        self._indexes.pop(group_id, None)
+
+    def set_rate(self, group_id: int, currency: str, rate: float) -> None:
+        """Record that one unit of `currency` is worth `rate` pesos from now on."""
+        self.transaction_service.db_for(group_id).add_exchange_rate(group_id, currency, DEFAULT_CURRENCY, rate)
+        self.forget(group_id)
+
+    def net_worth(self, group_id: int, currency: str = DEFAULT_CURRENCY) -> dict:
+        """
+        Balances and expenses by category converted to one currency. Balances use the
+        latest rate; each month's expenses use the rate in force at the end of that month.
+        """
+        db = self.transaction_service.db_for(group_id)
+        index = self.index(group_id)
+        balances = [
+            (money_type, source, None, amount)
+            for source, by_money_type in db.get_balances(group_id).items()
+            for money_type, amount in by_money_type.items()
+        ]
+        expenses = [
+            (category, source, month_end(month).strftime('%Y-%m-%d %H:%M:%S'), spent)
+            for month, source, category, spent in db.get_category_month_totals(group_id)
+        ]
+        rows = balances + expenses
+
+        # One lookup per distinct (currency, month), then every amount is converted at once
+        rates = {}
+        for _, source, when, _ in rows:
+            if (source, when) not in rates:
+                rate = index.rate(source, currency, when)
+                rates[(source, when)] = np.nan if rate is None else rate
+        amounts = np.array([amount for *_, amount in rows], dtype=float)
+        converted = amounts * np.array([rates[(source, when)] for _, source, when, _ in rows], dtype=float)
+        missing = sorted({source for (source, _), rate in rates.items() if np.isnan(rate)})
+        converted = np.nan_to_num(converted)
+
+        def totals(labels: List[str], values: np.ndarray) -> List[Tuple[str, float]]:
+            if not labels:
+                return []
+            names, positions = np.unique(labels, return_inverse=True)
+            sums = np.bincount(positions, weights=values, minlength=len(names))
+            return sorted(zip(names.tolist(), sums.tolist()), key=lambda item: -abs(item[1]))
+
+        by_money_type = totals([label for label, *_ in balances], converted[:len(balances)])
+        return {
+            'currency': currency,
+            'by_money_type': by_money_type,
+            'total': float(converted[:len(balances)].sum()),
+            'categories': totals([label for label, *_ in expenses], converted[len(balances):]),
+            'missing': missing,
+        }
+
@@ -0,0 +1,88 @@
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+import config
+from services.supervisor import chat_hash
+from utils.logger import logger
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+FAILED = 'failed'
+
+
+class Inbox:
+    """
+    Durable queue of free-text messages, stored before the LLM sees them.
+
+    Messages that could not be processed because the LLM was unavailable stay
+    pending and are drained later. Every claimed message records the worker that
+    claimed it and when: a restarted worker requeues what it left 'processing', and a
+    message whose lease ran out (its worker died) is requeued by any drain, while the
+    ones live sibling workers are handling are left alone. The inbox lives in the shared
+    repository, so a single drain job covers every group whatever the storage layout; a
+    sharded worker only claims the chats routed to it, keeping each chat's messages in order.
+    """
+
+    def __init__(self, transaction_service, batch_size: int = config.INBOX_BATCH_SIZE,
+                 max_attempts: int = config.INBOX_MAX_ATTEMPTS, worker_id: str = 'main',
+                 lease_seconds: float = config.INBOX_LEASE_SECONDS, shard: Optional[Tuple[int, int]] = None):
+        self.transaction_service = transaction_service
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        # Stable across restarts of the same worker, distinct between workers and hosts
+        self.owner = f"{socket.gethostname()}:{worker_id}"
+        self.lease = timedelta(seconds=lease_seconds)
+        # (index, worker count) when running as one of the supervisor's workers
+        self.shard = shard
+
+    @property
+    def db(self):
+        return self.transaction_service.db
+
+    def add(self, update, status: str = PROCESSING) -> Optional[int]:
+        """
+        Store the update before processing it; returns None if it was already queued (a
+        redelivery). It is added as being processed, so only release() hands it to the drain.
+        """
+        chat_id = update.message.chat.id
+        return self.db.add_inbox_message(update.update_id, chat_id, update.to_dict(), status, self.owner,
+                                         chat_hash(chat_id))
+
+    def claim(self) -> List[Tuple[int, dict, int]]:
+        return self.db.claim_inbox_messages(self.batch_size, self.owner, self.shard)
+
+    def complete(self, inbox_id: int) -> None:
+        self.db.complete_inbox_message(inbox_id)
+
+    def settle_processed(self, inbox_id: int, update, processed_updates) -> Optional[Tuple[str, dict]]:
+        """
+        Outcome recorded for a claimed update that was already applied (a crash hit before
+        it was completed), completing it so it is never applied twice; None if it was not.
+        """
+        processed = processed_updates.get(update.message.chat.id, update.update_id)
+        if processed:
+            logger.info(f"Inbox message {inbox_id} was already processed ({processed[0]}), completing it")
+            self.complete(inbox_id)
+        return processed
+
+    def release(self, inbox_id: int, attempts: int = 0) -> None:
+        """Put a message back for a later drain, or give up after max_attempts."""
+        if attempts >= self.max_attempts:
+            logger.error(f"Giving up on inbox message {inbox_id} after {attempts} attempts")
+            self.db.set_inbox_status(inbox_id, FAILED)
+        else:
+            self.db.set_inbox_status(inbox_id, PENDING)
+
+    def recover(self, own: bool = True) -> int:
+        """
+        Requeue messages whose lease ran out and, on startup (`own`), the ones this worker
+        left in progress before it restarted.
+        """
+        cutoff = (datetime.now(timezone.utc) - self.lease).strftime('%Y-%m-%d %H:%M:%S')
+        requeued = self.db.requeue_inbox_messages(cutoff, self.owner if own else None)
+        if requeued:
+            logger.info(f"Requeued {requeued} inbox messages left in progress by a stopped worker")
+        return requeued
+
+    def pending(self) -> int:
+        return self.db.count_inbox_messages(PENDING)
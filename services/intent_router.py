@@ -0,0 +1,113 @@
+import re
+import unicodedata
+from typing import Any, Dict, Optional
+
+INTENT_QUERY = 'query'
+INTENT_TRANSACTION = 'transaction'
+INTENT_MULTI = 'multi'
+INTENT_EXCHANGE = 'exchange'
+INTENTS = (INTENT_QUERY, INTENT_TRANSACTION, INTENT_MULTI, INTENT_EXCHANGE)
+
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)*')
+_QUERY_WORDS = re.compile(
+    r'\b(resumen|balance|saldo|patrimonio|es normal|(?:mas de )?lo normal|de lo habitual|tendencia|habitual|normalmente|tipico|cuanto tengo|cuanto hay|cuanto me queda|mostrame|total|gastos del mes)\b'
+)
+_EXCHANGE_VERBS = re.compile(r'\b(cambie|cambiamos|converti)\b')
+_TRADE_VERBS = re.compile(r'\b(compre|vendi)\b')
+_CURRENCY_WORDS = re.compile(r'\b(usd|u\$s|dolar|dolares|euro|euros|eur|pesos|ars)\b')
+# "Compre 200 dolares": the amount right after the verb is itself in a currency, with no
+# "de ..." or "en ..." naming something bought with it ("compre 500 pesos de pan")
+_CURRENCY_TRADE = re.compile(
+    r'\b(compre|vendi)\s+(?:\d+(?:[.,]\d+)*\s*(?:usd|u\$s|dolar|dolares|euro|euros|eur|pesos|ars)\b'
+    r'|(?:usd|u\$s|eur|ars)\s*\d+(?:[.,]\d+)*\b)(?!\s+(?:de|en)\b)'
+)
+_CURRENCY_CODES = {'usd': 'USD', 'u$s': 'USD', 'dolar': 'USD', 'dolares': 'USD',
+                   'euro': 'EUR', 'euros': 'EUR', 'eur': 'EUR', 'pesos': 'ARS', 'ars': 'ARS'}
+# A comma between two digits is a decimal separator ("1500,50"), not a list separator
+_SEPARATORS = re.compile(r'(?<!\d),|,(?!\d)|;|\n|\by\b|\be\b')
+
+ROUTER_PROMPT = '''Clasificá el mensaje financiero en una de estas intenciones y respondé en JSON:
+- "query": pide un resumen, balance, saldo, el patrimonio total o si lo que gasta es normal
+- "transaction": registra UN gasto o ingreso
+- "multi": registra VARIOS gastos o ingresos
+- "exchange": cambio de divisas (por ejemplo dólares a pesos)
+
+Formato:
+{{"intent": "query"|"transaction"|"multi"|"exchange", "query_type": "summary"|"balance"|"net_worth"|"trend"|"typical", "money_type": "cash"|"bank"|"all"}}
+("query_type" y "money_type" solo para "query")
+
+Mensaje: '{message}'
+'''
+
+
+def normalize(message: str) -> str:
+    """Lowercase and strip accents so keyword rules match 'cuánto' and 'cuanto' alike."""
+    decomposed = unicodedata.normalize('NFKD', message.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def query_data(text: str, query_type: Optional[str] = None, money_type: Optional[str] = None) -> Dict[str, Any]:
+    """Query payload in the format QueryProcessor expects, filling gaps from the message."""
+    if re.search(r'\bpatrimonio\b', text):
+        query_type = 'net_worth'
+    elif re.search(r'\b(es normal|lo normal|lo habitual|tendencia|promedio)\b', text):
+        # "¿Gasté más de lo normal?" compares the month with the usual ones
+        query_type = 'trend'
+    elif re.search(r'\b(habitual|normalmente|tipico|suelo gastar)\b', text):
+        query_type = 'typical'
+    if query_type not in ('summary', 'balance', 'net_worth', 'trend', 'typical'):
+        query_type = 'summary' if re.search(r'\b(resumen|gastos)\b', text) else 'balance'
+    if query_type in ('net_worth', 'trend', 'typical'):
+        currency = _CURRENCY_WORDS.search(text)
+        code = _CURRENCY_CODES.get(currency.group(1), 'ARS') if currency else 'ARS'
+        return {'type': 'query', 'query_type': query_type, 'currency': code}
+    if money_type not in ('cash', 'bank', 'all'):
+        if re.search(r'\b(efectivo|cash|plata)\b', text):
+            money_type = 'cash'
+        elif re.search(r'\b(banco|cuenta|tarjeta)\b', text):
+            money_type = 'bank'
+        else:
+            money_type = 'all'
+    return {'type': 'query', 'query_type': query_type, 'money_type': money_type}
+
+
+def classify_intent(message: str) -> Optional[Dict[str, Any]]:
+    """
+    Keyword classifier used before any model: {'intent': ..., 'query': {...} for queries},
+    or None when the message is ambiguous and a model has to decide.
+    """
+    text = normalize(message)
+    numbers = _NUMBER.findall(text)
+
+    if not numbers:
+        if _QUERY_WORDS.search(text) or text.rstrip().endswith('?'):
+            return {'intent': INTENT_QUERY, 'query': query_data(text)}
+        return None
+
+    # "Compre comida por 20 usd" is an expense; buying or selling currency takes both amounts
+    # or a currency amount as the thing bought
+    if _CURRENCY_WORDS.search(text) and (
+        _EXCHANGE_VERBS.search(text) or _CURRENCY_TRADE.search(text)
+        or (_TRADE_VERBS.search(text) and len(numbers) >= 2)
+    ):
+        return {'intent': INTENT_EXCHANGE}
+
+    # "500 en pan y 300 en leche" has an amount in more than one part; "1500 en 2 cafes" does not
+    parts_with_amounts = [part for part in _SEPARATORS.split(text) if _NUMBER.search(part)]
+    if len(parts_with_amounts) > 1:
+        return {'intent': INTENT_MULTI}
+    return {'intent': INTENT_TRANSACTION}
+
+
+def intent_of_response(response: Any) -> Optional[str]:
+    """Intent implied by an extraction result, to measure how often the router agreed."""
+    if isinstance(response, list):
+        return INTENT_MULTI if len(response) > 1 else INTENT_TRANSACTION
+    if isinstance(response, dict):
+        if response.get('type') == 'exchange':
+            return INTENT_EXCHANGE
+        if response.get('type') == 'query':
+            return INTENT_QUERY
+        if response.get('type') in ('expense', 'income'):
+            return INTENT_TRANSACTION
+    return None
@@ -0,0 +1,151 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import config
+from utils.logger import logger
+
+# How far back /deshacer looks for a change that has not been undone yet
+UNDO_SCAN_LIMIT = 50
+
+
+def empty_state() -> dict:
+    """
+    Folded ledger state of a group:
+    - balances:   {currency: {money_type: amount}}, same shape as get_balances()
+    - categories: {currency: {category_id: net expenses}} (a rename moves a group's total to the new id)
+    """
+    return {'balances': {}, 'categories': {}}
+
+
+def _add(totals: Dict[str, Dict[str, float]], outer: str, inner: str, amount: float, prune: bool = False) -> None:
+    bucket = totals.setdefault(outer, {})
+    bucket[inner] = bucket.get(inner, 0.0) + amount
+    # A delete that takes a total back to zero leaves no row behind in the transactions table either
+    if prune and abs(bucket[inner]) < 1e-9:
+        del bucket[inner]
+        if not bucket:
+            del totals[outer]
+
+
+def apply_event(state: dict, event_type: str, payload: dict) -> None:
+    """Fold one journal event into the state in place."""
+    if event_type == 'clear':
+        state['balances'].clear()
+        state['categories'].clear()
+        return
+
+    if event_type in ('insert', 'delete'):
+        sign = 1 if event_type == 'insert' else -1
+        prune = event_type == 'delete'
+        money_type = payload.get('money_type') or 'cash'
+        _add(state['balances'], payload['currency'], money_type, sign * payload['amount'], prune)
+        if payload.get('type') == 'expense' and payload.get('category_id') is not None:
+            _add(state['categories'], payload['currency'], str(payload['category_id']), sign * payload['amount'], prune)
+        # Restored and deleted rows carry their exchange record with them
+        exchange = payload.get('exchange')
+        if exchange:
+            _add(state['balances'], exchange['source_currency'], money_type, -sign * exchange['source_amount'], prune)
+    elif event_type == 'exchange':
+        money_type = payload.get('money_type') or 'cash'
+        _add(state['balances'], payload['source_currency'], money_type, -payload['source_amount'])
+    elif event_type == 'rename' and 'old_id' in payload:
+        # The group's transactions moved to another category id
+        old_id, new_id = str(payload['old_id']), str(payload['new_id'])
+        for totals in state['categories'].values():
+            if old_id in totals:
+                totals[new_id] = totals.get(new_id, 0.0) + totals.pop(old_id)
+
+
+class LedgerService:
+    """
+    Rebuilds a group's balances from its append-only journal.
+
+    Any point in time is the newest snapshot before it plus a short replay of
+    the events after that snapshot. A snapshot is written every `snapshot_every`
+    writes (and whenever a read had to replay that many events), so the tail stays short.
+    """
+
+    def __init__(self, transaction_service, snapshot_every: int = config.LEDGER_SNAPSHOT_EVERY):
+        self.transaction_service = transaction_service
+        self.snapshot_every = max(snapshot_every, 1)
+        self._writes_since_snapshot: Dict[int, int] = {}
+
+    def state_as_of(self, group_id: int, when: Optional[datetime] = None) -> dict:
+        """Folded state after every event recorded up to `when` (UTC, now if None)."""
+        db = self.transaction_service.db_for(group_id)
+        until_id = db.last_ledger_event_id(group_id, when.strftime('%Y-%m-%d %H:%M:%S') if when else None)
+        state, replayed = self._fold(db, group_id, until_id)
+        if when is None and replayed >= self.snapshot_every:
+            self._save(db, group_id, until_id, state)
+        return state
+
+    @staticmethod
+    def _fold(db, group_id: int, until_id: int) -> Tuple[dict, int]:
+        """Newest snapshot not past until_id plus the replayed tail; returns (state, events replayed)."""
+        snapshot = db.get_latest_snapshot(group_id, until_id)
+        last_id, state = snapshot if snapshot else (0, empty_state())
+        tail = db.get_ledger_events(group_id, after_id=last_id, until_id=until_id)
+        for _, event_type, _, payload, _, _ in tail:
+            apply_event(state, event_type, payload)
+        return state, len(tail)
+
+    def _save(self, db, group_id: int, last_event_id: int, state: dict) -> None:
+        db.save_snapshot(group_id, last_event_id, state)
+        self._writes_since_snapshot[group_id] = 0
+        logger.info(f"Saved ledger snapshot for group {group_id} at event {last_event_id}")
+
+    def balance_as_of(self, group_id: int, when: Optional[datetime] = None) -> Dict[str, Dict[str, float]]:
+        return self.state_as_of(group_id, when)['balances']
+
+    def snapshot(self, group_id: int) -> None:
+        """Write a snapshot of the group's current state, if there is anything new since the last one."""
+        db = self.transaction_service.db_for(group_id)
+        last_id = db.last_ledger_event_id(group_id)
+        state, replayed = self._fold(db, group_id, last_id)
+        if replayed:
+            self._save(db, group_id, last_id, state)
+        else:
+            self._writes_since_snapshot[group_id] = 0
+
+    def note_write(self, group_id: int) -> None:
+        """Count a journaled write and snapshot the group once enough have piled up."""
+        count = self._writes_since_snapshot.get(group_id, 0) + 1
+        self._writes_since_snapshot[group_id] = count
+        if count >= self.snapshot_every:
+            self.snapshot(group_id)
+
+    def forget(self, group_id: int) -> None:
+        self._writes_since_snapshot.pop(group_id, None)
+
+    def undo_last(self, group_id: int) -> Tuple[bool, str]:
+        """Revert the group's most recent change that has not been undone; returns (success, message)."""
+        db = self.transaction_service.db_for(group_id)
+        events = db.get_ledger_events(group_id, newest_first=True, limit=UNDO_SCAN_LIMIT)
+        undone = {undo_of for _, _, _, _, undo_of, _ in events if undo_of is not None}
+
+        for event_id, event_type, transaction_id, payload, undo_of, _ in events:
+            # Compensating events and the changes they reverted are skipped;
+            # an exchange is undone together with the insert that precedes it
+            if undo_of is not None or event_id in undone or event_type == 'exchange':
+                continue
+
+            if event_type == 'clear':
+                return False, "El último cambio fue un borrado total y no se puede deshacer"
+            if event_type == 'insert':
+                if not db.delete_transaction(transaction_id, group_id, undo_of=event_id):
+                    return False, f"La transacción {transaction_id} ya no existe"
+                message = f"Se eliminó la transacción {transaction_id}"
+            elif event_type == 'delete':
+                restored_id = db.restore_transaction(group_id, payload, undo_of=event_id)
+                message = f"Se restauró la transacción {restored_id}"
+            elif event_type == 'rename':
+                success, message = db.rename_category(payload['new'], payload['old'], group_id, undo_of=event_id)
+                if not success:
+                    return False, message
+            else:
+                continue
+
+            self.note_write(group_id)
+            logger.info(f"Undid ledger event {event_id} ({event_type}) for group {group_id}")
+            return True, message
+
+        return False, "No hay cambios para deshacer"
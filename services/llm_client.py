@@ -1,61 +1,31 @@
 import os
+import asyncio
 import json
-from typing import Dict, Any
+import hashlib
+import time
+from typing import Dict, Any, List, Optional
+import config
 from utils.logger import logger
-from ollama import Client
+from utils.metrics import metrics
+import httpx
+from ollama import ResponseError
+from services.ollama_pool import OllamaPool, parse_hosts
+from services.example_bank import EXAMPLE_BANK, format_examples, select_examples
+from services.llm_recorder import LLMRecorder
+from services.intent_router import (
+    INTENTS, INTENT_QUERY, INTENT_TRANSACTION, INTENT_MULTI, INTENT_EXCHANGE,
+    ROUTER_PROMPT, classify_intent, intent_of_response, normalize, query_data,
+)
 
-class LLMClient:
-    def __init__(self, transaction_service):
-        self.host = os.getenv('OLLAMA_HOST')
-        self.model = os.getenv('MODEL')
-        self.client = Client(host=self.host)
-        self.transaction_service = transaction_service
+SYSTEM_PROMPT = "You are a financial assistant that ONLY responds in valid JSON format."
 
-    def get_response(self, prompt: str) -> Dict[str, Any]:
-        """Get structured response from LLM using JSON mode."""
-        try:
-            response = self.client.generate(
-                model=self.model,
-                prompt=prompt + "\nRespond ONLY with valid JSON.",
-                system="You are a financial assistant that ONLY responds in valid JSON format.",
-                format="json",
-                stream=False,
-                options={
-                    'temperature': 0.7,
-                    'num_predict': 100,
-                }
-            )
-            
-            # Log the raw response
-            logger.info(f"Raw model response: {response['response']}")
-            
-            # Response will be a valid JSON string
-            try:
-                return json.loads(response['response'])
-            except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON in response: {e}")
-                logger.error(f"Problematic response: {response['response']}")
-                return None
-            
-        except Exception as e:
-            logger.error(f"Error calling Ollama API: {e}")
-            logger.error(f"Full error details: {str(e)}")
-            return None
+# Sections of the extraction prompt; each intent only gets the ones it needs.
+# Static sections come first and the group's categories and the message last, so
+# consecutive prompts share a long prefix that Ollama can reuse from its cache.
+PROMPT_HEADER = '''Analiza el mensaje financiero que aparece al final y devuelve la respuesta en JSON.
 
-    def get_structured_response(self, message: str) -> Dict[str, Any]:
-        """Get a structured response with specific format."""
-        # Get existing categories from database
-        existing_categories = self.transaction_service.db.get_all_categories()
-        categories_str = ", ".join(f'"{cat}"' for cat in existing_categories)
-        
-        # Clean up the message - replace multiple newlines with a single one
-        message = ' '.join(message.split())
-        
-        prompt = f'''Analiza el siguiente mensaje financiero y devuelve la respuesta en JSON: '{message}'
-
-Categorías existentes: [{categories_str}]
-
-REGLAS PARA CATEGORÍAS:
+'''
+CATEGORY_RULES = '''REGLAS PARA CATEGORÍAS:
 1. Para gastos en alimentos (fiambrería, carnicería, verdulería) usar "supermercado"
 2. Para gastos de alquiler usar "alquiler"
 3. Para gastos de transporte (nafta, subte, colectivo) usar "transporte"
@@ -69,51 +39,18 @@ REGLAS PARA CATEGORÍAS:
 11. Para gastos de vicios (tabaco, alcohol, drogas) usar "vicios"
 12. Si no hay una categoría apropiada, crear una nueva categoría en base a la descripción del gasto
 
-Ejemplos:
-1. "Gasté 10000 en fiambrería" →
-[{{
-    "type": "expense",
-    "amount": 10000.0,
-    "description": "Fiambreria",
-    "money_type": "cash",
-    "category": "supermercado",
-    "should_create_category": false,
-    "category_reason": "",
-    "currency": "ARS"
-}}]
-
-2. "Pagué el alquiler $50000" →
-[{{
-    "type": "expense",
-    "amount": 50000.0,
-    "description": "Alquiler",
-    "money_type": "bank",
-    "category": "alquiler",
-    "should_create_category": false,
-    "category_reason": "",
-    "currency": "ARS"
-}}]
-
-3. "Compré carne en la carnicería $15000" →
-[{{
-    "type": "expense",
-    "amount": 15000.0,
-    "description": "Carniceria",
-    "money_type": "cash",
-    "category": "supermercado",
-    "should_create_category": false,
-    "category_reason": "",
-    "currency": "ARS"
-}}]
-
-Para CONSULTAS (resumen, balance, etc) usar este formato:
+'''
+QUERY_FORMAT = '''Para CONSULTAS (resumen, balance, etc) usar este formato:
 {{
     "type": "query",
-    "query_type": "summary"|"balance",
+    "query_type": "summary"|"balance"|"net_worth"|"trend"|"typical",
     "money_type": "cash"|"bank"|"all"
 }}
+("net_worth" es el patrimonio total convertido a una sola moneda, "trend" compara el gasto
+del mes con los meses anteriores y "typical" es cuánto se gasta normalmente por categoría)
 
-Para TRANSACCIONES usar este formato (siempre en array):
+'''
+TRANSACTION_FORMAT = '''Para TRANSACCIONES usar este formato (siempre en array):
 [
     {{
         "type": "expense"|"income",  # IMPORTANTE: Solo "expense" o "income" son válidos
@@ -127,7 +64,8 @@ Para TRANSACCIONES usar este formato (siempre en array):
     }}
 ]
 
-Para CAMBIO DE DIVISAS usar este formato:
+'''
+EXCHANGE_FORMAT = '''Para CAMBIO DE DIVISAS usar este formato:
 {{
     "type": "exchange",
     "amount": float,
@@ -139,7 +77,18 @@ Para CAMBIO DE DIVISAS usar este formato:
     source_amount
 }}
 
-REGLAS:
+'''
+# The one or two examples closest to the message, picked from services/example_bank.py
+EXAMPLES_SECTION = '''Ejemplos:
+{examples}
+
+'''
+CATEGORIES_LIST = '''Categorías existentes: [{categories_str}]
+
+'''
+MESSAGE_SECTION = '''Mensaje: '{message}'
+'''
+RULES_SECTION = '''REGLAS:
 1. Si el mensaje es una consulta como "resumen", "balance", "cuánto tengo", "mostrame" → type: "query"
 2. Si el mensaje es sobre gastos → type: "expense"
 3. Si el mensaje es sobre ingresos → type: "income"
@@ -153,10 +102,265 @@ REGLAS:
 
 '''
 
+# num_predict per tier: routing needs a few tokens, a list of transactions needs many
+TOKEN_BUDGETS = {
+    'router': 40,
+    INTENT_TRANSACTION: 200,
+    INTENT_MULTI: 600,
+    INTENT_EXCHANGE: 150,
+    'full': 600,
+}
+
+
+def prompt_version() -> str:
+    """Short hash of every prompt template and the example bank; any prompt tweak changes it."""
+    templates = [SYSTEM_PROMPT, PROMPT_HEADER, CATEGORY_RULES, QUERY_FORMAT, TRANSACTION_FORMAT, EXCHANGE_FORMAT,
+                 EXAMPLES_SECTION, CATEGORIES_LIST, MESSAGE_SECTION, RULES_SECTION, ROUTER_PROMPT,
+                 json.dumps(EXAMPLE_BANK, ensure_ascii=False, sort_keys=True)]
+    return hashlib.sha1('\x00'.join(templates).encode('utf-8')).hexdigest()[:8]
+
+
+PROMPT_VERSION = prompt_version()
+
+
+class LLMUnavailableError(Exception):
+    """Ollama is down, timing out or overloaded; the message should be retried later."""
+
+
+# A generate call whose load_duration exceeds this had to load the model (a cold start)
+COLD_LOAD_SECONDS = 1.0
+
+
+class LLMClient:
+    def __init__(self, transaction_service):
+        self.host = os.getenv('OLLAMA_HOST')
+        self.hosts = parse_hosts(config.OLLAMA_HOSTS) or [self.host]
+        self.model = os.getenv('MODEL')
+        self.router_model = config.ROUTER_MODEL
+        self.keep_alive = config.OLLAMA_KEEP_ALIVE
+        # Load-balanced over every host, each with its own timeout and circuit breaker
+        self.client = OllamaPool(self.hosts)
+        self.transaction_service = transaction_service
+        # Extraction calls recorded for the golden corpus and benchmarks/bench_llm.py
+        self.recorder = LLMRecorder(config.LLM_RECORD_PATH, config.LLM_RECORD_SAMPLE_RATE) \
+            if config.LLM_RECORD_PATH else None
+
+    def get_response(self, prompt: str, model: Optional[str] = None, num_predict: int = 100,
+                     temperature: float = 0.7, tier: str = 'extract', message: Optional[str] = None,
+                     **labels) -> Dict[str, Any]:
+        """
+        Get structured response from LLM using JSON mode; latency is recorded per tier.
+        With a recorder and the user's `message`, the call is also recorded.
+        Raises LLMUnavailableError when no Ollama host can be reached, answers in time or has capacity.
+        """
         try:
-            response = self.get_response(prompt)
+            start = time.perf_counter()
+            with metrics.timer('bot_llm_request_seconds', tier=tier, **labels):
+                response = self.client.generate(
+                    model=model or self.model,
+                    prompt=prompt + "\nRespond ONLY with valid JSON.",
+                    system=SYSTEM_PROMPT,
+                    format="json",
+                    stream=False,
+                    keep_alive=self.keep_alive,
+                    options={
+                        'temperature': temperature,
+                        'num_predict': num_predict,
+                    }
+                )
+            self._record_start(model or self.model, response)
+            self._record_prompt(response, tier=tier, **labels)
+            
+            # Log the raw response
+            logger.debug(f"Raw model response: {response['response']}")
+            
+            # Response will be a valid JSON string
+            try:
+                parsed = json.loads(response['response'])
+            except json.JSONDecodeError as e:
+                logger.error(f"Invalid JSON in response: {e}")
+                logger.error(f"Problematic response: {response['response']}")
+                parsed = None
+            if self.recorder is not None and message is not None:
+                self.recorder.record(message, PROMPT_VERSION, model or self.model, response['response'], parsed,
+                                     time.perf_counter() - start, response, tier=tier, **labels)
+            return parsed
+            
+        except (ConnectionError, httpx.TransportError) as e:
+            # Connection refused, reset or timed out on every host, or all of them are ejected
+            logger.error(f"Ollama unavailable: {e!r}")
+            raise LLMUnavailableError(str(e)) from e
+        except ResponseError as e:
+            if e.status_code >= 500 or e.status_code == 429:
+                logger.error(f"Ollama overloaded or failing ({e.status_code}): {e}")
+                raise LLMUnavailableError(str(e)) from e
+            logger.error(f"Error calling Ollama API: {e}")
+            return None
+        except Exception as e:
+            # The timer has already counted the failure in bot_errors_total
+            logger.error(f"Error calling Ollama API: {e}")
+            logger.error(f"Full error details: {str(e)}")
+            return None
+
+    @staticmethod
+    def _record_start(model: str, response) -> None:
+        """Split generate latency by whether Ollama had to load the model first."""
+        load_seconds = (response.get('load_duration') or 0) / 1e9
+        start = 'cold' if load_seconds >= COLD_LOAD_SECONDS else 'warm'
+        metrics.inc('bot_llm_starts_total', model=model, start=start)
+        metrics.observe('bot_llm_load_seconds', load_seconds, model=model)
+        if response.get('total_duration'):
+            metrics.observe('bot_llm_generate_seconds', response['total_duration'] / 1e9, model=model, start=start)
+
+    @staticmethod
+    def _record_prompt(response, **labels) -> None:
+        """Prompt tokens Ollama evaluated (cached prefix tokens excluded) and how long that took."""
+        if response.get('prompt_eval_count') is None:
+            return
+        metrics.inc('bot_llm_prompts_total', **labels)
+        metrics.inc('bot_llm_prompt_tokens_total', response['prompt_eval_count'], **labels)
+        if response.get('prompt_eval_duration'):
+            metrics.observe('bot_llm_prompt_eval_seconds', response['prompt_eval_duration'] / 1e9, **labels)
+
+    def _prefixes(self) -> Dict[str, str]:
+        """Static prompt prefix of each configured model: everything before the examples and message."""
+        sections = self._sections(INTENT_TRANSACTION)
+        prefixes = {self.model: ''.join(sections[:sections.index(EXAMPLES_SECTION)]).format()}
+        if self.router_model:
+            prefixes[self.router_model] = ROUTER_PROMPT.split('Mensaje:')[0].format()
+        return prefixes
+
+    def warm_up(self) -> None:
+        """Load every configured model on every host and prime its static prompt prefix."""
+        for model, prefix in self._prefixes().items():
+            with metrics.timer('bot_llm_warmup_seconds', model=model):
+                responses = self.client.broadcast(
+                    model=model,
+                    prompt=prefix,
+                    system=SYSTEM_PROMPT,
+                    stream=False,
+                    keep_alive=self.keep_alive,
+                    options={'num_predict': 1},
+                )
+            for host, response in responses.items():
+                if isinstance(response, Exception):
+                    logger.warning(f"Could not warm up model {model} on {host}: {response}")
+                    continue
+                self._record_start(model, response)
+                logger.info(f"Warmed up model {model} on {host} in {(response.get('total_duration') or 0) / 1e9:.1f}s")
+
+    def keep_warm(self) -> None:
+        """Reset Ollama's keep_alive timer on every host; an empty prompt loads the model without generating."""
+        for model in self._prefixes():
+            for host, response in self.client.broadcast(model=model, prompt='', keep_alive=self.keep_alive).items():
+                if isinstance(response, Exception):
+                    logger.warning(f"Keep-alive for model {model} on {host} failed: {response}")
+
+    @staticmethod
+    def is_transaction(message: str) -> bool:
+        """True when keyword rules see a plain expense or income (list), the kind worth batching."""
+        decision = classify_intent(' '.join(message.split()))
+        return bool(decision) and decision['intent'] in (INTENT_TRANSACTION, INTENT_MULTI)
+
+    @staticmethod
+    def answers_without_model(message: str) -> bool:
+        """True when keyword rules alone answer the message (a query), so no model is called."""
+        decision = classify_intent(' '.join(message.split()))
+        return bool(decision) and decision['intent'] == INTENT_QUERY
+
+    def route(self, message: str) -> Optional[Dict[str, Any]]:
+        """
+        Decide the intent without the large model: keyword rules first, then ROUTER_MODEL
+        for ambiguous messages. Returns None when neither can tell.
+        """
+        decision = classify_intent(message)
+        source = 'heuristic'
+        if decision is None and self.router_model:
+            response = self.get_response(
+                ROUTER_PROMPT.format(message=message),
+                model=self.router_model,
+                num_predict=TOKEN_BUDGETS['router'],
+                temperature=0,
+                tier='router',
+            )
+            if isinstance(response, dict) and response.get('intent') in INTENTS:
+                decision = {'intent': response['intent']}
+                if decision['intent'] == INTENT_QUERY:
+                    decision['query'] = query_data(
+                        normalize(message), response.get('query_type'), response.get('money_type')
+                    )
+                source = 'model'
+        if decision is None:
+            return None
+        metrics.inc('bot_llm_routes_total', source=source, intent=decision['intent'])
+        return decision
+
+    @staticmethod
+    def _sections(intent: Optional[str]) -> list:
+        if intent == INTENT_EXCHANGE:
+            return [PROMPT_HEADER, EXCHANGE_FORMAT, RULES_SECTION, EXAMPLES_SECTION, MESSAGE_SECTION]
+        if intent in (INTENT_TRANSACTION, INTENT_MULTI):
+            return [PROMPT_HEADER, TRANSACTION_FORMAT, CATEGORY_RULES, RULES_SECTION,
+                    EXAMPLES_SECTION, CATEGORIES_LIST, MESSAGE_SECTION]
+        return [PROMPT_HEADER, TRANSACTION_FORMAT, CATEGORY_RULES, QUERY_FORMAT, EXCHANGE_FORMAT,
+                RULES_SECTION, EXAMPLES_SECTION, CATEGORIES_LIST, MESSAGE_SECTION]
+
+    def prompt_categories(self, group_id: int = None) -> List[str]:
+        """Categories offered in the prompt: only the group's most used, so it does not grow with the vocabulary."""
+        if group_id is None:
+            return self.transaction_service.db.get_all_categories()
+        return self.transaction_service.categories.prompt_categories(group_id)
+
+    def build_prompt(self, message: str, group_id: int = None, intent: Optional[str] = None,
+                     categories: Optional[List[str]] = None) -> str:
+        """
+        Extraction prompt for a routed intent, or the full prompt when the intent is unknown.
+        Only the format for the intent and the examples most similar to the message are included.
+        """
+        sections = self._sections(intent)
+        categories_str = ''
+        if CATEGORIES_LIST in sections:
+            if categories is None:
+                categories = self.prompt_categories(group_id)
+            categories_str = ", ".join(f'"{cat}"' for cat in categories)
+        examples = format_examples(select_examples(message, intent))
+        return ''.join(sections).format(message=message, categories_str=categories_str, examples=examples)
+
+    async def aget_structured_response(self, message: str, group_id: int = None,
+                                       intent: Optional[str] = None) -> Dict[str, Any]:
+        """
+        get_structured_response in a thread, so waiting for the model does not block the event
+        loop. The categories are read first, here: a SQLite connection only works in its own thread.
+        """
+        categories = self.prompt_categories(group_id)
+        return await asyncio.to_thread(self.get_structured_response, message, group_id, intent, categories)
+
+    def get_structured_response(self, message: str, group_id: int = None, intent: Optional[str] = None,
+                                categories: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get a structured response with specific format; a known intent skips the routing."""
+        # Clean up the message - replace multiple newlines with a single one
+        message = ' '.join(message.split())
+
+        decision = self.route(message) if intent is None else {'intent': intent}
+        intent = decision['intent'] if decision else None
+        if intent == INTENT_QUERY:
+            # Queries need no extraction, so the large model is skipped entirely
+            return decision['query']
+
+        prompt = self.build_prompt(message, group_id, intent, categories)
+
+        try:
+            response = self.get_response(
+                prompt, num_predict=TOKEN_BUDGETS[intent or 'full'], message=message, intent=intent or 'unrouted'
+            )
             if not response:
                 return None
+
+            if intent:
+                extracted = intent_of_response(response)
+                if extracted != intent:
+                    metrics.inc('bot_llm_router_disagreements_total', routed=intent, extracted=extracted or 'unknown')
+                    logger.debug(f"Router chose {intent} but the extraction returned {extracted}: {message}")
             
             # If response is a transaction dict, wrap it in a list
             if isinstance(response, dict):
@@ -164,6 +368,8 @@ REGLAS:
                     response = [response]
             
             return response
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error processing response: {e}")
-            return None 
\ No newline at end of file
+            return None
@@ -0,0 +1,81 @@
+import json
+import random
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from utils.logger import logger
+
+# Identifiers users paste into messages: e-mails, @handles, card numbers and runs of
+# 10+ digits (CBU/CVU, account and phone numbers). Amounts are shorter and are kept.
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_HANDLE = re.compile(r'@\w+')
+_CARD = re.compile(r'\b\d{4}(?:[ -]\d{4}){3}\b')
+_LONG_NUMBER = re.compile(r'\b\d{10,}\b')
+
+
+def anonymize(text: str) -> str:
+    """Mask e-mails, handles and account-like numbers in a message or model output."""
+    text = _EMAIL.sub('<email>', text)
+    text = _HANDLE.sub('<user>', text)
+    text = _CARD.sub('<number>', text)
+    return _LONG_NUMBER.sub('<number>', text)
+
+
+def _anonymize_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return anonymize(value)
+    if isinstance(value, list):
+        return [_anonymize_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _anonymize_value(item) for key, item in value.items()}
+    return value
+
+
+class LLMRecorder:
+    """
+    Records extraction calls as JSON lines: the message, prompt version, model, raw and
+    parsed response, latency and Ollama's token counts. No user, chat or group ids are
+    written and the text is passed through anonymize(). With no path the records are
+    kept in memory, which is how the benchmark reads them.
+    """
+
+    def __init__(self, path: Optional[str] = None, sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, message: str, prompt_version: str, model: str, raw: Optional[str], parsed: Any,
+               latency: float, response: Optional[dict] = None, **labels) -> None:
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        response = response or {}
+        record = {
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'message': anonymize(message),
+            'prompt_version': prompt_version,
+            'model': model,
+            **labels,
+            'raw': anonymize(raw) if raw is not None else None,
+            'parsed': _anonymize_value(parsed),
+            'latency': round(latency, 4),
+            'prompt_tokens': response.get('prompt_eval_count'),
+            'completion_tokens': response.get('eval_count'),
+            'completion_seconds': (response.get('eval_duration') or 0) / 1e9 or None,
+        }
+        if self.path is None:
+            self.records.append(record)
+            return
+        try:
+            line = json.dumps(record, ensure_ascii=False)
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except Exception as e:
+            # Recording is diagnostics; it must never fail a user's message
+            logger.error(f"Error recording LLM call: {e}")
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime
+from typing import Optional, Tuple
+import config
+from utils.logger import logger
+
+
+def parse_active_hours(value: str) -> Optional[Tuple[int, int]]:
+    """'8-24' -> (8, 24); a start after the end wraps past midnight ('22-6'). Empty disables."""
+    if not value:
+        return None
+    start, end = (int(part) for part in value.split('-'))
+    if not (0 <= start <= 24 and 0 <= end <= 24):
+        raise ValueError(f"Invalid active hours '{value}'")
+    return start, end
+
+
+class ModelWarmer:
+    """
+    Avoids paying Ollama's model load on the first message after an idle period.
+
+    post_init() runs before the application starts taking updates: it loads the
+    models and primes the static prompt prefix. While inside the active hours, a
+    JobQueue job then pings the models often enough that keep_alive never expires.
+    """
+
+    def __init__(self, llm, active_hours: str = config.KEEP_ALIVE_HOURS,
+                 interval: int = config.KEEP_ALIVE_INTERVAL_SECONDS):
+        self.llm = llm
+        self.active_hours = parse_active_hours(active_hours)
+        self.interval = interval
+
+    def is_active(self, now: datetime) -> bool:
+        if self.active_hours is None:
+            return False
+        start, end = self.active_hours
+        if start <= end:
+            return start <= now.hour < end
+        return now.hour >= start or now.hour < end
+
+    async def post_init(self, application) -> None:
+        await asyncio.to_thread(self.llm.warm_up)
+
+        if self.active_hours is None or self.interval <= 0:
+            return
+        if application.job_queue is None:
+            logger.warning('Model keep-alive disabled: install "python-telegram-bot[job-queue]" to enable it')
+            return
+        application.job_queue.run_repeating(self.keep_alive, interval=self.interval, name='model-keep-alive')
+        logger.info(f"Model keep-alive scheduled every {self.interval}s during hours {self.active_hours}")
+
+    async def keep_alive(self, context) -> None:
+        if self.is_active(datetime.now()):
+            await asyncio.to_thread(self.llm.keep_warm)
@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+import httpx
+from ollama import AsyncClient, ResponseError
+import config
+from services.circuit_breaker import CircuitBreaker, CLOSED
+from utils.logger import logger
+from utils.metrics import metrics
+
+# Latencies kept per (model, num_predict) to estimate when a request is slower than usual
+LATENCY_WINDOW = 200
+
+
+class NoHealthyHostError(ConnectionError):
+    """Every Ollama host is ejected."""
+
+
+def parse_hosts(value: str) -> List[str]:
+    """'http://a:11434, http://b:11434' -> ['http://a:11434', 'http://b:11434']."""
+    return [host.strip() for host in (value or '').split(',') if host.strip()]
+
+
+def is_host_failure(error: Exception) -> bool:
+    """Errors that say the host is down or overloaded, as opposed to a bad request."""
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+def default_client(url: str, timeout: float) -> AsyncClient:
+    # Connecting fails fast; a generation may take up to the read timeout
+    return AsyncClient(host=url, timeout=httpx.Timeout(timeout, connect=5.0))
+
+
+class OllamaHost:
+    def __init__(self, url: str, failure_threshold: int, reset_timeout: float):
+        self.url = url
+        self.client = None
+        self.breaker = CircuitBreaker(f"ollama:{url}", failure_threshold, reset_timeout)
+        self.outstanding = 0
+        self.last_picked = 0.0
+
+
+class OllamaPool:
+    """
+    Drop-in for ollama.Client.generate that spreads calls over several Ollama hosts.
+
+    Each call goes to the healthy host with the fewest requests in flight. Hosts that
+    time out, refuse connections or answer 5xx are ejected by their circuit breaker, and
+    the call fails over to the next host. A periodic health check re-admits them as soon
+    as they answer again. With hedging on, a request still running at the p95 latency
+    seen for its model is also sent to a second host; the first answer wins and the
+    other request is cancelled.
+
+    Requests run on a private event loop thread, so callers stay synchronous.
+    """
+
+    def __init__(self, hosts: List[str], timeout: float = config.OLLAMA_TIMEOUT_SECONDS,
+                 hedge: bool = config.OLLAMA_HEDGE, hedge_min_samples: int = config.OLLAMA_HEDGE_MIN_SAMPLES,
+                 health_interval: int = config.OLLAMA_HEALTH_INTERVAL_SECONDS,
+                 failure_threshold: int = config.LLM_BREAKER_FAILURES,
+                 reset_timeout: float = config.LLM_BREAKER_RESET_SECONDS,
+                 client_factory=default_client):
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.hosts = [OllamaHost(url, failure_threshold, reset_timeout) for url in hosts]
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.health_interval = health_interval
+        self.client_factory = client_factory
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='ollama-pool', daemon=True).start()
+                if self.health_interval > 0:
+                    asyncio.run_coroutine_threadsafe(self._health_loop(), self._loop)
+            return self._loop
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def generate(self, **kwargs) -> Any:
+        """Same arguments and result as ollama.Client.generate."""
+        return self._run(self.agenerate(**kwargs))
+
+    def broadcast(self, **kwargs) -> Dict[str, Any]:
+        """Run generate on every host (to load a model everywhere); maps host -> response or exception."""
+        return self._run(self._broadcast(kwargs))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+    def _client(self, host: OllamaHost):
+        # Created on the pool's loop, which the async HTTP client is bound to
+        if host.client is None:
+            host.client = self.client_factory(host.url, self.timeout)
+        return host.client
+
+    def _pick(self, exclude, required: bool = True) -> Optional[OllamaHost]:
+        # Least outstanding first; the least recently picked breaks ties so idle hosts share the load.
+        # allow() is only asked of the host about to be used, since on a half-open breaker it
+        # hands out the single trial call
+        candidates = sorted((host for host in self.hosts if host not in exclude),
+                            key=lambda h: (h.outstanding, h.last_picked))
+        host = next((host for host in candidates if host.breaker.allow()), None)
+        if host is None:
+            if required:
+                raise NoHealthyHostError(f"No healthy Ollama host among {[host.url for host in self.hosts]}")
+            return None
+        host.last_picked = time.monotonic()
+        return host
+
+    def hedge_delay(self, key) -> Optional[float]:
+        """p95 latency for this kind of request, or None while there are too few samples."""
+        samples = self._latencies[key]
+        if not self.hedge or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    async def _call(self, host: OllamaHost, key, kwargs) -> Any:
+        host.outstanding += 1
+        started = time.monotonic()
+        try:
+            response = await self._client(host).generate(**kwargs)
+        except asyncio.CancelledError:
+            host.breaker.release()
+            raise
+        except Exception as e:
+            if is_host_failure(e):
+                host.breaker.record_failure()
+                metrics.inc('bot_ollama_requests_total', host=host.url, outcome='error')
+            else:
+                host.breaker.release()
+            raise
+        finally:
+            host.outstanding -= 1
+        host.breaker.record_success()
+        self._latencies[key].append(time.monotonic() - started)
+        metrics.inc('bot_ollama_requests_total', host=host.url, outcome='ok')
+        return response
+
+    async def agenerate(self, **kwargs) -> Any:
+        key = (kwargs.get('model'), (kwargs.get('options') or {}).get('num_predict'))
+        primary = self._pick(())
+        tried = {primary}
+        tasks = {asyncio.create_task(self._call(primary, key, kwargs)): primary}
+        delay = self.hedge_delay(key)
+        hedged = False
+        last_error = None
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    tasks, timeout=None if hedged else delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Slower than usual: send the same request to another host as well
+                    hedged = True
+                    host = self._pick(tried, required=False)
+                    if host is not None:
+                        tried.add(host)
+                        tasks[asyncio.create_task(self._call(host, key, kwargs))] = host
+                        metrics.inc('bot_ollama_hedges_total')
+                    continue
+
+                for task in done:
+                    host = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if hedged:
+                            metrics.inc('bot_ollama_hedge_wins_total', winner='primary' if host is primary else 'hedge')
+                        return task.result()
+                    if not is_host_failure(error):
+                        raise error
+                    logger.warning(f"Ollama host {host.url} failed: {error!r}")
+                    last_error = error
+
+                if not tasks:
+                    # Every request in flight failed: fail over to a host not tried yet
+                    host = self._pick(tried, required=False)
+                    if host is None:
+                        raise last_error
+                    tried.add(host)
+                    tasks[asyncio.create_task(self._call(host, key, kwargs))] = host
+        finally:
+            # The losing request (or any left after an error) is cancelled, freeing its host
+            for task in tasks:
+                task.cancel()
+
+    async def _broadcast(self, kwargs) -> Dict[str, Any]:
+        results = await asyncio.gather(
+            *(self._client(host).generate(**kwargs) for host in self.hosts), return_exceptions=True
+        )
+        return {host.url: result for host, result in zip(self.hosts, results)}
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def check_health(self) -> None:
+        await asyncio.gather(*(self._probe(host) for host in self.hosts))
+
+    async def _probe(self, host: OllamaHost) -> None:
+        try:
+            await asyncio.wait_for(self._client(host).list(), timeout=5)
+        except Exception as e:
+            logger.warning(f"Health check of Ollama host {host.url} failed: {e!r}")
+            host.breaker.record_failure()
+            return
+        if host.breaker.state != CLOSED:
+            logger.info(f"Ollama host {host.url} is healthy again")
+        host.breaker.record_success()
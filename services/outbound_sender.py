@@ -0,0 +1,51 @@
+import asyncio
+from typing import Dict, List, Set
+from utils.logger import logger
+from utils.metrics import metrics
+
+
+def merge_confirmations(texts: List[str]) -> str:
+    if len(set(texts)) == 1 and len(texts) > 1:
+        return f"{texts[0]} (x{len(texts)})"
+    return '\n'.join(texts)
+
+
+class OutboundSender:
+    """
+    Sends confirmations without making the handler wait for the chat's rate limit.
+
+    A confirmation is queued per chat and sent as soon as the chat may send again.
+    Confirmations that arrive in the meantime join it, so a burst of messages in a
+    rate-limited chat gets one combined reply instead of a queue of them.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, List[str]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def confirm(self, bot, chat_id: int, text: str) -> None:
+        pending = self._pending.get(chat_id)
+        if pending is not None:
+            pending.append(text)
+            metrics.inc('bot_confirmations_coalesced_total')
+            return
+        self._pending[chat_id] = [text]
+        task = asyncio.create_task(self._flush(bot, chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, bot, chat_id: int) -> None:
+        limiter = getattr(bot, 'rate_limiter', None)
+        delay = limiter.chat_delay(chat_id) if hasattr(limiter, 'chat_delay') else 0.0
+        if delay:
+            await asyncio.sleep(delay)
+        text = merge_confirmations(self._pending.pop(chat_id))
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+        except Exception as e:
+            logger.error(f"Could not send confirmation to chat {chat_id}: {e}")
+
+    async def shutdown(self) -> None:
+        """Send whatever is still queued before the application stops."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
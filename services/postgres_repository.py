@@ -0,0 +1,865 @@
+from typing import Dict, List, Optional, Tuple
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
+from services.repository import ExpenseRepository
+from utils.logger import logger
+from utils.metrics import instrument_methods
+
+# Journal payload of a transaction row (with its exchange record, if any)
+TRANSACTION_PAYLOAD_SQL = '''
+    jsonb_build_object(
+        'id', t.id, 'user_id', t.user_id, 'type', t.type, 'amount', t.amount,
+        'description', t.description, 'category_id', t.category_id,
+        'money_type_id', t.money_type_id, 'money_type', m.name,
+        'currency', t.currency, 'timestamp', to_char(t.timestamp, 'YYYY-MM-DD HH24:MI:SS'),
+        'exchange', (
+            SELECT jsonb_build_object(
+                'source_currency', e.source_currency, 'target_currency', e.target_currency,
+                'exchange_rate', e.exchange_rate, 'source_amount', e.source_amount,
+                'target_amount', e.target_amount
+            )
+            FROM exchange_transactions e WHERE e.transaction_id = t.id
+        )
+    )
+'''
+
+
+@instrument_methods('bot_db_query_seconds')
+class PostgresRepository(ExpenseRepository):
+    """
+    PostgreSQL implementation of ExpenseRepository backed by a psycopg connection pool.
+
+    All groups share one database; unlike SQLite, concurrent writers from several
+    worker processes do not serialize on a single file lock.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=True)
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS categories (
+                    id SERIAL PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS money_types (
+                    id SERIAL PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id BIGSERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    group_id BIGINT NOT NULL,
+                    type TEXT NOT NULL,
+                    amount DOUBLE PRECISION NOT NULL,
+                    description TEXT,
+                    category_id INTEGER REFERENCES categories(id),
+                    money_type_id INTEGER REFERENCES money_types(id),
+                    currency TEXT NOT NULL DEFAULT 'ARS',
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS exchange_transactions (
+                    id BIGSERIAL PRIMARY KEY,
+                    transaction_id BIGINT NOT NULL REFERENCES transactions(id) ON DELETE CASCADE,
+                    source_currency TEXT NOT NULL,
+                    target_currency TEXT NOT NULL,
+                    exchange_rate DOUBLE PRECISION NOT NULL,
+                    source_amount DOUBLE PRECISION NOT NULL,
+                    target_amount DOUBLE PRECISION NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_transactions_group_timestamp
+                ON transactions (group_id, timestamp)
+            ''')
+            # Full-text search: the group is a weight-A token and the accent-stripped
+            # description weight D, so one GIN lookup matches both
+            conn.execute('''
+                ALTER TABLE transactions ADD COLUMN IF NOT EXISTS search tsvector GENERATED ALWAYS AS (
+                    setweight(to_tsvector('simple', 'g' || replace(group_id::text, '-', 'n')), 'A') ||
+                    setweight(to_tsvector('simple',
+                        translate(lower(coalesce(description, '')), 'áéíóúüñ', 'aeiouun')), 'D')
+                ) STORED
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_transactions_search
+                ON transactions USING GIN (search)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_exchange_transactions_transaction
+                ON exchange_transactions (transaction_id)
+            ''')
+            backfill = conn.execute("SELECT to_regclass('ledger_events') IS NULL").fetchone()[0]
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ledger_events (
+                    id BIGSERIAL PRIMARY KEY,
+                    group_id BIGINT NOT NULL,
+                    event_type TEXT NOT NULL,
+                    transaction_id BIGINT,
+                    payload JSONB NOT NULL,
+                    undo_of BIGINT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ledger_events_group
+                ON ledger_events (group_id, id)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_ledger_events_group_created
+                ON ledger_events (group_id, created_at)
+            ''')
+            if backfill:
+                # Seed the new journal with one insert event per existing transaction
+                seeded = conn.execute(f'''
+                    INSERT INTO ledger_events (group_id, event_type, transaction_id, payload, created_at)
+                    SELECT t.group_id, 'insert', t.id, {TRANSACTION_PAYLOAD_SQL}, t.timestamp
+                    FROM transactions t
+                    LEFT JOIN money_types m ON t.money_type_id = m.id
+                    ORDER BY t.timestamp, t.id
+                ''').rowcount
+                if seeded > 0:
+                    logger.info(f"Seeded the ledger with {seeded} existing transactions")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS balance_snapshots (
+                    id BIGSERIAL PRIMARY KEY,
+                    group_id BIGINT NOT NULL,
+                    last_event_id BIGINT NOT NULL,
+                    state JSONB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_balance_snapshots_group
+                ON balance_snapshots (group_id, last_event_id)
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS processed_updates (
+                    update_id BIGINT PRIMARY KEY,
+                    chat_id BIGINT NOT NULL,
+                    message_id BIGINT,
+                    outcome TEXT NOT NULL,
+                    result JSONB,
+                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_processed_updates_processed_at
+                ON processed_updates (processed_at)
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS inbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    update_id BIGINT NOT NULL UNIQUE,
+                    chat_id BIGINT NOT NULL,
+                    payload JSONB NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    claimed_at TIMESTAMP,
+                    shard_key BIGINT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            # Inboxes created before claims carried an owner and a lease, or a shard key
+            conn.execute('''
+                ALTER TABLE inbox ADD COLUMN IF NOT EXISTS owner TEXT,
+                ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP,
+                ADD COLUMN IF NOT EXISTS shard_key BIGINT
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_inbox_status
+                ON inbox (status, id)
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS budgets (
+                    group_id BIGINT NOT NULL,
+                    category_id INTEGER NOT NULL,
+                    currency TEXT NOT NULL DEFAULT 'ARS',
+                    amount DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (group_id, category_id, currency)
+                )
+            ''')
+            backfill = conn.execute("SELECT to_regclass('category_month_totals') IS NULL").fetchone()[0]
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS category_month_totals (
+                    group_id BIGINT NOT NULL,
+                    category_id INTEGER NOT NULL,
+                    currency TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    spent DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    PRIMARY KEY (group_id, category_id, currency, month)
+                )
+            ''')
+            if backfill:
+                self._count_spending(conn, 1, 'TRUE', ())
+            backfill = conn.execute("SELECT to_regclass('group_categories') IS NULL").fetchone()[0]
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS group_categories (
+                    group_id BIGINT NOT NULL,
+                    category_id INTEGER NOT NULL,
+                    uses INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (group_id, category_id)
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_group_categories_uses
+                ON group_categories (group_id, uses DESC)
+            ''')
+            if backfill:
+                self._count_category_uses(conn, 1, 'TRUE', ())
+                conn.execute('''
+                    INSERT INTO group_categories (group_id, category_id)
+                    SELECT DISTINCT group_id, category_id FROM budgets
+                    ON CONFLICT DO NOTHING
+                ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS manual_exchange_rates (
+                    id BIGSERIAL PRIMARY KEY,
+                    group_id BIGINT NOT NULL,
+                    source_currency TEXT NOT NULL,
+                    target_currency TEXT NOT NULL,
+                    rate DOUBLE PRECISION NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_manual_exchange_rates_group
+                ON manual_exchange_rates (group_id, timestamp)
+            ''')
+
+    def add_transaction(self, user_id, group_id, transaction_type, amount, description=None,
+                        category_id=None, money_type_id=None, currency='ARS') -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                INSERT INTO transactions (
+                    user_id, group_id, type, amount, description,
+                    category_id, money_type_id, currency
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (
+                user_id, group_id, transaction_type, amount, description,
+                category_id, money_type_id, currency
+            )).fetchone()
+            self._journal_transaction(conn, group_id, 'insert', row[0])
+            self._count_spending(conn, 1, 'id = %s', (row[0],))
+            self._count_category_uses(conn, 1, 'id = %s', (row[0],))
+        return row[0]
+
+    def add_transactions(self, rows: List[tuple]) -> List[int]:
+        ids = []
+        with self.pool.connection() as conn:
+            for row in rows:
+                transaction_id = conn.execute('''
+                    INSERT INTO transactions (
+                        user_id, group_id, type, amount, description,
+                        category_id, money_type_id, currency
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                ''', row).fetchone()[0]
+                self._journal_transaction(conn, row[1], 'insert', transaction_id)
+                ids.append(transaction_id)
+            if ids:
+                self._count_spending(conn, 1, 'id = ANY(%s)', (ids,))
+                self._count_category_uses(conn, 1, 'id = ANY(%s)', (ids,))
+        return ids
+
+    @staticmethod
+    def _count_spending(conn, sign: int, where: str, params: tuple) -> None:
+        """Add (sign=1) or remove (sign=-1) the expenses matching `where` from the month-to-date counters."""
+        conn.execute(f'''
+            INSERT INTO category_month_totals (group_id, category_id, currency, month, spent)
+            SELECT group_id, category_id, currency, to_char(timestamp, 'YYYY-MM'), -SUM(amount) * %s
+            FROM transactions
+            WHERE type = 'expense' AND category_id IS NOT NULL AND {where}
+            GROUP BY group_id, category_id, currency, to_char(timestamp, 'YYYY-MM')
+            ON CONFLICT (group_id, category_id, currency, month)
+            DO UPDATE SET spent = category_month_totals.spent + excluded.spent
+        ''', (sign, *params))
+
+    @staticmethod
+    def _count_category_uses(conn, sign: int, where: str, params: tuple) -> None:
+        """Add (sign=1) or remove (sign=-1) the transactions matching `where` from the groups' category use counts."""
+        conn.execute(f'''
+            INSERT INTO group_categories (group_id, category_id, uses)
+            SELECT group_id, category_id, COUNT(*) * %s
+            FROM transactions
+            WHERE category_id IS NOT NULL AND {where}
+            GROUP BY group_id, category_id
+            ON CONFLICT (group_id, category_id) DO UPDATE SET uses = group_categories.uses + excluded.uses
+        ''', (sign, *params))
+
+    @staticmethod
+    def _journal_transaction(conn, group_id, event_type, transaction_id, undo_of=None):
+        """Append an insert/delete event carrying the current row; call before deleting the row."""
+        conn.execute(f'''
+            INSERT INTO ledger_events (group_id, event_type, transaction_id, payload, undo_of)
+            SELECT %s, %s, t.id, {TRANSACTION_PAYLOAD_SQL}, %s
+            FROM transactions t
+            LEFT JOIN money_types m ON t.money_type_id = m.id
+            WHERE t.id = %s AND t.group_id = %s
+        ''', (group_id, event_type, undo_of, transaction_id, group_id))
+
+    @staticmethod
+    def _journal_event(conn, group_id, event_type, payload, transaction_id=None, undo_of=None) -> int:
+        row = conn.execute('''
+            INSERT INTO ledger_events (group_id, event_type, transaction_id, payload, undo_of)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING id
+        ''', (group_id, event_type, transaction_id, Jsonb(payload), undo_of)).fetchone()
+        return row[0]
+
+    def add_exchange_transaction(self, transaction_id, source_currency, target_currency,
+                                 exchange_rate, source_amount, target_amount) -> None:
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO exchange_transactions (
+                    transaction_id, source_currency, target_currency,
+                    exchange_rate, source_amount, target_amount
+                )
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', (
+                transaction_id, source_currency, target_currency,
+                exchange_rate, source_amount, target_amount
+            ))
+            conn.execute('''
+                INSERT INTO ledger_events (group_id, event_type, transaction_id, payload)
+                SELECT t.group_id, 'exchange', t.id, jsonb_build_object(
+                    'source_currency', %s::text, 'target_currency', %s::text,
+                    'exchange_rate', %s::float8, 'source_amount', %s::float8,
+                    'target_amount', %s::float8, 'money_type', m.name
+                )
+                FROM transactions t
+                LEFT JOIN money_types m ON t.money_type_id = m.id
+                WHERE t.id = %s
+            ''', (
+                source_currency, target_currency, exchange_rate,
+                source_amount, target_amount, transaction_id
+            ))
+        logger.info(f"Added exchange transaction record: {source_amount} {source_currency} → {target_amount} {target_currency}")
+
+    def delete_transaction(self, transaction_id: int, group_id: int, undo_of: Optional[int] = None) -> bool:
+        try:
+            with self.pool.connection() as conn:
+                # Journal the full row (and exchange record) first so the delete can be undone
+                self._journal_transaction(conn, group_id, 'delete', transaction_id, undo_of)
+                self._count_spending(conn, -1, 'id = %s AND group_id = %s', (transaction_id, group_id))
+                self._count_category_uses(conn, -1, 'id = %s AND group_id = %s', (transaction_id, group_id))
+                # exchange_transactions rows go away through ON DELETE CASCADE
+                cursor = conn.execute(
+                    'DELETE FROM transactions WHERE id = %s AND group_id = %s',
+                    (transaction_id, group_id)
+                )
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error deleting transaction: {e}")
+            return False
+
+    def clear_transactions(self, group_id: int, journal: bool = True) -> None:
+        # Ids come from a sequence shared by every group, so they are not reset here
+        with self.pool.connection() as conn:
+            cursor = conn.execute('DELETE FROM transactions WHERE group_id = %s', (group_id,))
+            conn.execute('DELETE FROM category_month_totals WHERE group_id = %s', (group_id,))
+            # The group keeps its vocabulary; only the counts start over
+            conn.execute('UPDATE group_categories SET uses = 0 WHERE group_id = %s', (group_id,))
+            # A clear is journaled as one event rather than one per row
+            if journal:
+                self._journal_event(conn, group_id, 'clear', {'count': cursor.rowcount})
+        logger.info(f"Cleared {cursor.rowcount} transactions and their exchange records for group {group_id}")
+
+    def delete_transactions_chunk(self, group_id: int, chunk_size: int) -> int:
+        with self.pool.connection() as conn:
+            self._count_spending(
+                conn, -1, 'id IN (SELECT id FROM transactions WHERE group_id = %s ORDER BY id LIMIT %s)',
+                (group_id, chunk_size)
+            )
+            self._count_category_uses(
+                conn, -1, 'id IN (SELECT id FROM transactions WHERE group_id = %s ORDER BY id LIMIT %s)',
+                (group_id, chunk_size)
+            )
+            cursor = conn.execute('''
+                DELETE FROM transactions
+                WHERE id IN (
+                    SELECT id FROM transactions WHERE group_id = %s ORDER BY id LIMIT %s
+                )
+            ''', (group_id, chunk_size))
+            return cursor.rowcount
+
+    def count_transactions(self, group_id: int, category: Optional[str] = None) -> int:
+        with self.pool.connection() as conn:
+            if category:
+                row = conn.execute('''
+                    SELECT COUNT(*) FROM transactions t
+                    JOIN categories c ON t.category_id = c.id
+                    WHERE t.group_id = %s AND c.name = %s
+                ''', (group_id, category)).fetchone()
+            else:
+                row = conn.execute('SELECT COUNT(*) FROM transactions WHERE group_id = %s', (group_id,)).fetchone()
+        return row[0]
+
+    def get_latest_transactions(self, group_id: int, limit: Optional[int] = 10,
+                                category: Optional[str] = None) -> List[tuple]:
+        query = '''
+            SELECT t.id, t.type, t.amount, t.description, c.name as category,
+                   to_char(t.timestamp, 'YYYY-MM-DD HH24:MI:SS')
+            FROM transactions t
+            LEFT JOIN categories c ON t.category_id = c.id
+            WHERE t.group_id = %s
+        '''
+        params = [group_id]
+
+        if category:
+            query += ' AND c.name = %s'
+            params.append(category)
+
+        query += ' ORDER BY t.timestamp DESC'
+
+        if limit:
+            query += ' LIMIT %s'
+            params.append(limit)
+
+        with self.pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def search_transactions(self, group_id: int, terms: List[str], since: Optional[str] = None,
+                            until: Optional[str] = None, limit: int = 10, offset: int = 0) -> List[tuple]:
+        if not terms:
+            return []
+        group_token = f"g{str(group_id).replace('-', 'n')}"
+        tsquery = ' & '.join([f'{group_token}:A'] + [f'{term}:*D' for term in terms])
+        query = '''
+            SELECT t.id, t.type, t.amount, t.description, c.name,
+                   to_char(t.timestamp, 'YYYY-MM-DD HH24:MI:SS')
+            FROM transactions t
+            LEFT JOIN categories c ON t.category_id = c.id
+            WHERE t.search @@ to_tsquery('simple', %s)
+        '''
+        params = [tsquery]
+        if since:
+            query += ' AND t.timestamp >= %s::timestamp'
+            params.append(since)
+        if until:
+            query += ' AND t.timestamp <= %s::timestamp'
+            params.append(until)
+        query += " ORDER BY ts_rank(t.search, to_tsquery('simple', %s)) DESC, t.timestamp DESC LIMIT %s OFFSET %s"
+        with self.pool.connection() as conn:
+            return conn.execute(query, params + [tsquery, limit, offset]).fetchall()
+
+    def get_or_create_category(self, name: str) -> int:
+        return self._get_or_create('categories', name)
+
+    def get_or_create_money_type(self, name: str) -> int:
+        return self._get_or_create('money_types', name)
+
+    def _get_or_create(self, table: str, name: str) -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute(f'SELECT id FROM {table} WHERE name = %s', (name,)).fetchone()
+            if row:
+                return row[0]
+            # The no-op update makes RETURNING work when a concurrent insert won the race
+            row = conn.execute(f'''
+                INSERT INTO {table} (name) VALUES (%s)
+                ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id
+            ''', (name,)).fetchone()
+        return row[0]
+
+    def get_all_categories(self) -> List[str]:
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute('SELECT name FROM categories').fetchall()]
+
+    def get_category_name(self, category_id: int) -> Optional[str]:
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT name FROM categories WHERE id = %s', (category_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_group_categories(self, group_id: int, limit: Optional[int] = None) -> List[Tuple[int, str, int]]:
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT c.id, c.name, g.uses
+                FROM group_categories g
+                JOIN categories c ON c.id = g.category_id
+                WHERE g.group_id = %s
+                ORDER BY g.uses DESC, c.name
+                LIMIT %s
+            ''', (group_id, limit)).fetchall()
+
+    def add_group_category(self, group_id: int, category_id: int) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                'INSERT INTO group_categories (group_id, category_id) VALUES (%s, %s) ON CONFLICT DO NOTHING',
+                (group_id, category_id)
+            )
+
+    def get_money_type_name(self, money_type_id: int) -> Optional[str]:
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT name FROM money_types WHERE id = %s', (money_type_id,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _group_category_id(conn, group_id: int, name: str) -> Optional[int]:
+        row = conn.execute('''
+            SELECT c.id FROM group_categories g
+            JOIN categories c ON c.id = g.category_id
+            WHERE g.group_id = %s AND c.name = %s
+        ''', (group_id, name)).fetchone()
+        return row[0] if row else None
+
+    def rename_category(self, old_name: str, new_name: str, group_id: int,
+                        undo_of: Optional[int] = None) -> Tuple[bool, str]:
+        try:
+            with self.pool.connection() as conn:
+                old_id = self._group_category_id(conn, group_id, old_name)
+                if old_id is None:
+                    return False, "La categoría original no existe"
+                if self._group_category_id(conn, group_id, new_name) is not None:
+                    return False, "Ya existe una categoría con ese nombre"
+                new_id = conn.execute('''
+                    INSERT INTO categories (name) VALUES (%s)
+                    ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+                    RETURNING id
+                ''', (new_name,)).fetchone()[0]
+                for table in ('transactions', 'budgets', 'category_month_totals', 'group_categories'):
+                    conn.execute(
+                        f'UPDATE {table} SET category_id = %s WHERE group_id = %s AND category_id = %s',
+                        (new_id, group_id, old_id)
+                    )
+                self._journal_event(conn, group_id, 'rename', {
+                    'old': old_name, 'new': new_name, 'old_id': old_id, 'new_id': new_id,
+                }, undo_of=undo_of)
+            return True, f"Categoría renombrada de '{old_name}' a '{new_name}'"
+        except Exception as e:
+            logger.error(f"Error renaming category: {e}")
+            return False, "Error al renombrar la categoría"
+
+    def get_balances(self, group_id: int, until: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        dated = ' AND timestamp <= %s::timestamp' if until else ''
+        params = (group_id, until, group_id, until) if until else (group_id, group_id)
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT b.currency, m.name, SUM(b.amount)
+                FROM (
+                    SELECT currency, money_type_id, amount
+                    FROM transactions
+                    WHERE group_id = %s{dated}
+                    UNION ALL
+                    SELECT e.source_currency, t.money_type_id, -e.source_amount
+                    FROM exchange_transactions e
+                    JOIN transactions t ON e.transaction_id = t.id
+                    WHERE t.group_id = %s{dated.replace('timestamp', 't.timestamp', 1)}
+                ) b
+                LEFT JOIN money_types m ON b.money_type_id = m.id
+                GROUP BY b.currency, b.money_type_id, m.name
+                ORDER BY b.currency
+            ''', params).fetchall()
+        balances: Dict[str, Dict[str, float]] = {}
+        for currency, money_type, amount in rows:
+            currency_balances = balances.setdefault(currency, {})
+            key = money_type or "cash"
+            currency_balances[key] = currency_balances.get(key, 0.0) + (amount or 0.0)
+        return balances
+
+    def get_expenses_by_currency_and_category(self, group_id: int) -> Dict[str, List[Tuple[str, float]]]:
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT t.currency, c.name, ABS(SUM(t.amount)) as total
+                FROM transactions t
+                JOIN categories c ON t.category_id = c.id
+                WHERE t.group_id = %s
+                AND t.type = 'expense'
+                GROUP BY t.currency, c.name
+                HAVING ABS(SUM(t.amount)) > 0
+                ORDER BY t.currency, total DESC
+            ''', (group_id,)).fetchall()
+        expenses: Dict[str, List[Tuple[str, float]]] = {}
+        for currency, category, total in rows:
+            expenses.setdefault(currency, []).append((category, total))
+        return expenses
+
+    def restore_transaction(self, group_id: int, payload: dict, undo_of: Optional[int] = None) -> int:
+        with self.pool.connection() as conn:
+            # Keep the original id unless the sequence has handed it out again
+            taken = conn.execute('SELECT 1 FROM transactions WHERE id = %s', (payload['id'],)).fetchone()
+            row = conn.execute('''
+                INSERT INTO transactions (
+                    id, user_id, group_id, type, amount, description,
+                    category_id, money_type_id, currency, timestamp
+                )
+                VALUES (COALESCE(%s, nextval(pg_get_serial_sequence('transactions', 'id'))),
+                        %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (
+                None if taken else payload['id'], payload['user_id'], group_id, payload['type'],
+                payload['amount'], payload['description'], payload['category_id'],
+                payload['money_type_id'], payload['currency'], payload['timestamp']
+            )).fetchone()
+            exchange = payload.get('exchange')
+            if exchange:
+                conn.execute('''
+                    INSERT INTO exchange_transactions (
+                        transaction_id, source_currency, target_currency,
+                        exchange_rate, source_amount, target_amount
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                ''', (
+                    row[0], exchange['source_currency'], exchange['target_currency'],
+                    exchange['exchange_rate'], exchange['source_amount'], exchange['target_amount']
+                ))
+            self._journal_transaction(conn, group_id, 'insert', row[0], undo_of)
+            self._count_spending(conn, 1, 'id = %s', (row[0],))
+            self._count_category_uses(conn, 1, 'id = %s', (row[0],))
+        return row[0]
+
+    def record_ledger_event(self, group_id: int, event_type: str, payload: dict,
+                            transaction_id: Optional[int] = None) -> int:
+        with self.pool.connection() as conn:
+            return self._journal_event(conn, group_id, event_type, payload, transaction_id)
+
+    def get_ledger_events(self, group_id: int, after_id: int = 0, until_id: Optional[int] = None,
+                          limit: Optional[int] = None, newest_first: bool = False) -> List[tuple]:
+        query = '''
+            SELECT id, event_type, transaction_id, payload, undo_of,
+                   to_char(created_at, 'YYYY-MM-DD HH24:MI:SS')
+            FROM ledger_events
+            WHERE group_id = %s AND id > %s
+        '''
+        params = [group_id, after_id]
+        if until_id is not None:
+            query += ' AND id <= %s'
+            params.append(until_id)
+        query += ' ORDER BY id DESC' if newest_first else ' ORDER BY id'
+        if limit:
+            query += ' LIMIT %s'
+            params.append(limit)
+        with self.pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def last_ledger_event_id(self, group_id: int, until: Optional[str] = None) -> int:
+        with self.pool.connection() as conn:
+            if until is None:
+                row = conn.execute('SELECT MAX(id) FROM ledger_events WHERE group_id = %s', (group_id,)).fetchone()
+            else:
+                row = conn.execute(
+                    'SELECT MAX(id) FROM ledger_events WHERE group_id = %s AND created_at <= %s::timestamp',
+                    (group_id, until)
+                ).fetchone()
+        return row[0] or 0
+
+    def last_dated_event_id(self, group_id: int, until: str) -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                SELECT MAX(l.id)
+                FROM ledger_events l
+                LEFT JOIN transactions t ON l.event_type = 'exchange' AND t.id = l.transaction_id
+                WHERE l.group_id = %s
+                AND (l.event_type = 'clear' OR (l.payload->>'timestamp')::timestamp <= %s::timestamp
+                     OR t.timestamp <= %s::timestamp)
+            ''', (group_id, until, until)).fetchone()
+        return row[0] or 0
+
+    def get_latest_snapshot(self, group_id: int, until_id: Optional[int] = None) -> Optional[Tuple[int, dict]]:
+        query = 'SELECT last_event_id, state FROM balance_snapshots WHERE group_id = %s'
+        params = [group_id]
+        if until_id is not None:
+            query += ' AND last_event_id <= %s'
+            params.append(until_id)
+        with self.pool.connection() as conn:
+            row = conn.execute(query + ' ORDER BY last_event_id DESC LIMIT 1', params).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save_snapshot(self, group_id: int, last_event_id: int, state: dict) -> None:
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO balance_snapshots (group_id, last_event_id, state)
+                VALUES (%s, %s, %s)
+            ''', (group_id, last_event_id, Jsonb(state)))
+
+    def set_budget(self, group_id: int, category_id: int, amount: float, currency: str = 'ARS') -> None:
+        with self.pool.connection() as conn:
+            if amount > 0:
+                conn.execute('''
+                    INSERT INTO budgets (group_id, category_id, currency, amount) VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (group_id, category_id, currency) DO UPDATE SET amount = excluded.amount
+                ''', (group_id, category_id, currency, amount))
+            else:
+                conn.execute(
+                    'DELETE FROM budgets WHERE group_id = %s AND category_id = %s AND currency = %s',
+                    (group_id, category_id, currency)
+                )
+
+    def get_budgets(self, group_id: int) -> List[Tuple[str, str, float, float]]:
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT c.name, b.currency, b.amount, COALESCE(m.spent, 0)
+                FROM budgets b
+                JOIN categories c ON c.id = b.category_id
+                LEFT JOIN category_month_totals m
+                    ON m.group_id = b.group_id AND m.category_id = b.category_id
+                    AND m.currency = b.currency AND m.month = to_char(CURRENT_TIMESTAMP, 'YYYY-MM')
+                WHERE b.group_id = %s
+                ORDER BY c.name, b.currency
+            ''', (group_id,)).fetchall()
+
+    def get_budget_status(self, group_id: int, category_id: int, currency: str) -> Optional[Tuple[float, float]]:
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT b.amount, COALESCE(m.spent, 0)
+                FROM budgets b
+                LEFT JOIN category_month_totals m
+                    ON m.group_id = b.group_id AND m.category_id = b.category_id
+                    AND m.currency = b.currency AND m.month = to_char(CURRENT_TIMESTAMP, 'YYYY-MM')
+                WHERE b.group_id = %s AND b.category_id = %s AND b.currency = %s
+            ''', (group_id, category_id, currency)).fetchone()
+
+    def get_month_expenses(self, group_id: int, month: str) -> Dict[str, List[Tuple[str, float]]]:
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT m.currency, c.name, m.spent
+                FROM category_month_totals m
+                JOIN categories c ON c.id = m.category_id
+                WHERE m.group_id = %s AND m.month = %s AND m.spent > 0
+                ORDER BY m.currency, m.spent DESC
+            ''', (group_id, month)).fetchall()
+        expenses: Dict[str, List[Tuple[str, float]]] = {}
+        for currency, category, spent in rows:
+            expenses.setdefault(currency, []).append((category, spent))
+        return expenses
+
+    def get_expense_history(self, group_id: int) -> List[Tuple[int, str, float, Optional[int], str]]:
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT id, to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS'), -amount, category_id, currency
+                FROM transactions
+                WHERE group_id = %s AND type = 'expense'
+                ORDER BY timestamp, id
+            ''', (group_id,)).fetchall()
+
+    def get_active_groups(self, since: str) -> List[int]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT DISTINCT group_id FROM ledger_events WHERE created_at >= %s::timestamp ORDER BY group_id',
+                (since,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_category_month_totals(self, group_id: int) -> List[Tuple[str, str, str, float]]:
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT m.month, m.currency, c.name, m.spent
+                FROM category_month_totals m
+                JOIN categories c ON c.id = m.category_id
+                WHERE m.group_id = %s AND m.spent > 0
+                ORDER BY m.month, m.currency
+            ''', (group_id,)).fetchall()
+
+    def add_exchange_rate(self, group_id: int, source_currency: str, target_currency: str, rate: float) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                'INSERT INTO manual_exchange_rates (group_id, source_currency, target_currency, rate) '
+                'VALUES (%s, %s, %s, %s)',
+                (group_id, source_currency, target_currency, rate)
+            )
+
+    def get_exchange_rates(self, group_id: int) -> List[Tuple[str, str, str, float]]:
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT to_char(t.timestamp, 'YYYY-MM-DD HH24:MI:SS'), e.source_currency, e.target_currency,
+                       e.target_amount / e.source_amount
+                FROM exchange_transactions e
+                JOIN transactions t ON e.transaction_id = t.id
+                WHERE t.group_id = %s AND e.source_amount > 0 AND e.target_amount > 0
+                UNION ALL
+                SELECT to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS'), source_currency, target_currency, rate
+                FROM manual_exchange_rates
+                WHERE group_id = %s AND rate > 0
+                ORDER BY 1
+            ''', (group_id, group_id)).fetchall()
+
+    def get_processed_update(self, update_id: int) -> Optional[Tuple[str, dict]]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT outcome, result FROM processed_updates WHERE update_id = %s', (update_id,)
+            ).fetchone()
+        return (row[0], row[1] or {}) if row else None
+
+    def record_processed_update(self, update_id: int, chat_id: int, message_id: Optional[int],
+                                outcome: str, result: Optional[dict] = None) -> None:
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO processed_updates (update_id, chat_id, message_id, outcome, result)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (update_id) DO UPDATE SET outcome = EXCLUDED.outcome, result = EXCLUDED.result
+            ''', (update_id, chat_id, message_id, outcome, Jsonb(result) if result is not None else None))
+
+    def prune_processed_updates(self, older_than: str) -> int:
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                'DELETE FROM processed_updates WHERE processed_at < %s::timestamp', (older_than,)
+            )
+            return cursor.rowcount
+
+    def add_inbox_message(self, update_id: int, chat_id: int, payload: dict, status: str = 'pending',
+                          owner: Optional[str] = None, shard_key: Optional[int] = None) -> Optional[int]:
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                INSERT INTO inbox (update_id, chat_id, payload, status, owner, claimed_at, shard_key)
+                VALUES (%s, %s, %s, %s, %s, CASE WHEN %s = 'processing' THEN CURRENT_TIMESTAMP END, %s)
+                ON CONFLICT (update_id) DO NOTHING
+                RETURNING id
+            ''', (update_id, chat_id, Jsonb(payload), status, owner, status, shard_key)).fetchone()
+        return row[0] if row else None
+
+    def claim_inbox_messages(self, limit: int, owner: Optional[str] = None,
+                             shard: Optional[Tuple[int, int]] = None) -> List[Tuple[int, dict, int]]:
+        shard_filter, params = '', ()
+        if shard:
+            # Only the chats routed to this worker, so one chat is never drained by two workers
+            index, worker_count = shard
+            shard_filter, params = 'AND COALESCE(shard_key, 0) %% %s = %s', (worker_count, index)
+        with self.pool.connection() as conn:
+            # SKIP LOCKED lets several workers drain the inbox without claiming the same rows
+            rows = conn.execute(f'''
+                UPDATE inbox SET status = 'processing', attempts = attempts + 1,
+                    owner = %s, claimed_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM inbox WHERE status = 'pending' {shard_filter}
+                    ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, payload, attempts
+            ''', (owner, *params, limit)).fetchall()
+        return sorted(rows)
+
+    def set_inbox_status(self, inbox_id: int, status: str) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                'UPDATE inbox SET status = %s, owner = NULL, claimed_at = NULL WHERE id = %s', (status, inbox_id)
+            )
+
+    def complete_inbox_message(self, inbox_id: int) -> None:
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM inbox WHERE id = %s', (inbox_id,))
+
+    def requeue_inbox_messages(self, claimed_before: str, owner: Optional[str] = None) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                UPDATE inbox SET status = 'pending', owner = NULL, claimed_at = NULL
+                WHERE status = 'processing'
+                AND (owner = %s OR claimed_at IS NULL OR claimed_at < %s::timestamp)
+            ''', (owner, claimed_before)).rowcount
+
+    def count_inbox_messages(self, status: str = 'pending') -> int:
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM inbox WHERE status = %s', (status,)).fetchone()[0]
+
+    def close(self) -> None:
+        self.pool.close()
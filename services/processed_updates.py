@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+import config
+from utils.logger import logger
+
+# Outcome stored right before a message's writes start; replaced once they finish
+PENDING = 'pending'
+
+
+class ProcessedUpdateStore:
+    """
+    Remembers which Telegram updates were already handled, in the chat's own repository.
+
+    Telegram redelivers updates that were not acknowledged before a crash or restart;
+    looking the update_id up first lets the bot answer those from the recorded outcome
+    instead of calling the LLM again and inserting the transactions twice. Rows older
+    than `ttl_hours` are pruned every `prune_every` recorded updates.
+    """
+
+    def __init__(self, transaction_service, ttl_hours: float = config.PROCESSED_UPDATES_TTL_HOURS,
+                 prune_every: int = 500):
+        self.transaction_service = transaction_service
+        self.ttl = timedelta(hours=ttl_hours)
+        self.prune_every = max(prune_every, 1)
+        self._recorded = 0
+
+    def get(self, chat_id: int, update_id: int) -> Optional[Tuple[str, dict]]:
+        return self.transaction_service.db_for(chat_id).get_processed_update(update_id)
+
+    def record(self, update, outcome: str, result: Optional[dict] = None) -> None:
+        chat_id = update.message.chat.id
+        db = self.transaction_service.db_for(chat_id)
+        db.record_processed_update(update.update_id, chat_id, update.message.message_id, outcome, result)
+
+        self._recorded += 1
+        if self._recorded % self.prune_every == 0:
+            cutoff = (datetime.now(timezone.utc) - self.ttl).strftime('%Y-%m-%d %H:%M:%S')
+            pruned = db.prune_processed_updates(cutoff)
+            logger.debug(f"Pruned {pruned} processed updates older than {cutoff}")
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+import config
+from utils.logger import logger
+from utils.metrics import metrics
+
+# Messages a chat may send back to back before its rate applies
+CHAT_BURST = 3
+# Idle chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `capacity`; block() pauses it (after a 429)."""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self) -> float:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def delay(self) -> float:
+        """Seconds until a token is available, without taking it."""
+        now = self._refill()
+        wait = max(self._blocked_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def try_take(self) -> float:
+        """Take a token and return 0, or return how long to wait for one."""
+        wait = self.delay()
+        if wait == 0:
+            self.tokens -= 1
+        return wait
+
+    async def take(self) -> float:
+        """Wait for a token; returns the time spent waiting."""
+        waited = 0.0
+        while (wait := self.try_take()) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+    def block(self, seconds: float) -> None:
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    # Same as PTB's own AIORateLimiter: the public attribute warns that its type will change
+    retry_after = getattr(error, '_retry_after', None) or error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """
+    Keeps Bot API calls under Telegram's flood limits.
+
+    Every request takes a token from the global bucket and, when it targets a chat,
+    from that chat's bucket (groups have a lower per-minute limit than private chats).
+    A 429 pauses the chat, or every request when it has no chat, for `retry_after`
+    and retries up to `max_retries` times. Chat actions are dropped instead of
+    waiting, and do not use up the chat's tokens: a late "typing..." is worse than none.
+    A 429 on one still pauses only its chat.
+    """
+
+    def __init__(self, global_rate: float = config.TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = config.TELEGRAM_CHAT_RATE,
+                 group_rate_per_minute: float = config.TELEGRAM_GROUP_RATE_PER_MINUTE,
+                 max_retries: int = config.TELEGRAM_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+        self._chats: Dict[Any, TokenBucket] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            try:
+                is_group = int(chat_id) < 0
+            except (TypeError, ValueError):
+                is_group = True  # '@channelusername'
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate, CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def chat_delay(self, chat_id) -> float:
+        """How long a message to this chat would wait right now."""
+        return max(self.chat_bucket(chat_id).delay(), self.global_bucket.delay())
+
+    async def process_request(self, callback, args, kwargs, endpoint: str, data: Dict[str, Any],
+                              rate_limit_args: Optional[int]):
+        chat_id = data.get('chat_id')
+        chat = self.chat_bucket(chat_id) if chat_id is not None else None
+        takes_chat_token = chat is not None
+        if endpoint == 'sendChatAction' and chat is not None:
+            if self.chat_delay(chat_id) > 0:
+                metrics.inc('bot_telegram_throttled_total', endpoint=endpoint, action='dropped')
+                return True
+            # Sent only when the chat has room, and without taking the reply's token
+            takes_chat_token = False
+
+        max_retries = rate_limit_args if rate_limit_args is not None else self.max_retries
+        for attempt in range(max_retries + 1):
+            waited = await chat.take() if takes_chat_token else 0.0
+            if endpoint != 'getUpdates':
+                waited += await self.global_bucket.take()
+            if waited:
+                metrics.inc('bot_telegram_throttled_total', endpoint=endpoint, action='delayed')
+                metrics.observe('bot_telegram_throttle_seconds', waited, endpoint=endpoint)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = retry_after_seconds(e)
+                if endpoint == 'sendChatAction' and chat is not None:
+                    # The limit is the chat's: pause its replies and drop the action
+                    chat.block(seconds)
+                    metrics.inc('bot_telegram_throttled_total', endpoint=endpoint, action='dropped')
+                    return True
+                if attempt >= max_retries:
+                    raise
+                logger.warning(f"Telegram flood limit on {endpoint} (chat {chat_id}), retrying in {seconds}s")
+                metrics.inc('bot_telegram_retries_total', endpoint=endpoint)
+                (chat or self.global_bucket).block(seconds)
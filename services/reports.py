@@ -0,0 +1,167 @@
+import asyncio
+from calendar import monthrange
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import config
+from processors.query_processor import QueryProcessor, DEFAULT_CURRENCY
+from utils.logger import logger
+from utils.metrics import metrics
+
+MONTH_NAMES = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio',
+               'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
+
+
+def current_month(now: Optional[datetime] = None) -> str:
+    """'YYYY-MM' of `now` in UTC, the clock the transactions and counters use."""
+    return (now or datetime.now(timezone.utc)).strftime('%Y-%m')
+
+
+def previous_month(month: str) -> str:
+    year, number = (int(part) for part in month.split('-'))
+    return f"{year - 1}-12" if number == 1 else f"{year}-{number - 1:02d}"
+
+
+def month_end(month: str) -> datetime:
+    """Last second of the month (UTC, naive like the stored timestamps)."""
+    year, number = (int(part) for part in month.split('-'))
+    return datetime(year, number, monthrange(year, number)[1], 23, 59, 59)
+
+
+def parse_month(value: str) -> Optional[str]:
+    """'AAAA-MM' as typed by the user, or None if it is not a month."""
+    try:
+        return datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        return None
+
+
+def parse_time(value: str) -> Optional[time]:
+    """'HH:MM' in local time for JobQueue.run_daily; empty disables."""
+    if not value:
+        return None
+    parsed = datetime.strptime(value, '%H:%M')
+    return time(parsed.hour, parsed.minute, tzinfo=datetime.now().astimezone().tzinfo)
+
+
+def format_report(month: str, expenses: Dict[str, List[Tuple[str, float]]],
+                  balances: Dict[str, Dict[str, float]], closed: bool) -> str:
+    year, number = month.split('-')
+    blocks = [f"📊 Resumen de {MONTH_NAMES[int(number) - 1]} {year}"]
+    if not expenses:
+        blocks.append("No hubo gastos este mes.")
+    for currency in sorted(expenses, key=lambda cur: (cur != DEFAULT_CURRENCY, cur)):
+        lines = [f"Gastos en {currency}:"]
+        lines.extend(f"• {category}: ${amount:,.2f}" for category, amount in expenses[currency])
+        lines.append(f"💸 Total {currency}: ${sum(amount for _, amount in expenses[currency]):,.2f}")
+        blocks.append("\n".join(lines))
+    blocks.append(("Saldos al cierre:\n" if closed else "Saldos actuales:\n") + QueryProcessor.format_balances(balances))
+    return "\n\n".join(blocks)
+
+
+class ReportService:
+    """
+    Monthly reports: expenses by category, balances at the end of the month and the pie chart.
+
+    A report is served from the cache while what it was built from is unchanged: the month's
+    expense counters and, for the running month, the id of the group's newest ledger event.
+    A closed month's balances are those of the transactions dated up to its last day, and
+    its version is the newest event that touched one of them, so new expenses do not
+    invalidate it but deleting or undoing an income or exchange from back then does. A daily job builds the reports of every recently active group ahead of
+    time, REPORT_CONCURRENCY at a time with the charts rendered off the event loop, so the
+    month-end rush reads cached PNGs instead of rendering them all at once.
+    """
+
+    def __init__(self, transaction_service, cache_size: int = config.REPORT_CACHE_SIZE,
+                 concurrency: int = config.REPORT_CONCURRENCY, active_days: int = config.REPORT_ACTIVE_DAYS):
+        self.transaction_service = transaction_service
+        self.cache_size = max(cache_size, 1)
+        self.concurrency = max(concurrency, 1)
+        self.active_days = active_days
+        self._cache: "OrderedDict[Tuple[int, str], tuple]" = OrderedDict()
+
+    async def get(self, group_id: int, month: str) -> Tuple[str, Optional[bytes]]:
+        """(text, PNG or None) of a group's month, from the cache when nothing changed since it was built."""
+        db = self.transaction_service.db_for(group_id)
+        closed = month < current_month()
+        until = month_end(month).strftime('%Y-%m-%d %H:%M:%S')
+        expenses = db.get_month_expenses(group_id, month)
+        version = (expenses, db.last_dated_event_id(group_id, until) if closed else db.last_ledger_event_id(group_id))
+        cached = self._cache.get((group_id, month))
+        if cached and cached[0] == version:
+            self._cache.move_to_end((group_id, month))
+            metrics.inc('bot_report_cache_total', result='hit')
+            return cached[1], cached[2]
+
+        metrics.inc('bot_report_cache_total', result='miss')
+        if closed:
+            balances = db.get_balances(group_id, until)
+        else:
+            balances = self.transaction_service.ledger.balance_as_of(group_id)
+        balances.setdefault(DEFAULT_CURRENCY, {})
+        text = format_report(month, expenses, balances, closed)
+        chart = None
+        if expenses:
+            chart = (await asyncio.to_thread(QueryProcessor.render_expenses_chart, expenses)).getvalue()
+
+        self._cache[(group_id, month)] = (version, text, chart)
+        self._cache.move_to_end((group_id, month))
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return text, chart
+
+    def active_groups(self, days: Optional[int] = None) -> List[int]:
+        """Groups with a ledger event in the last `days` (REPORT_ACTIVE_DAYS by default)."""
+        since = datetime.now(timezone.utc) - timedelta(days=self.active_days if days is None else days)
+        groups = set()
+        for db in self.transaction_service.router.each():
+            groups.update(db.get_active_groups(since.strftime('%Y-%m-%d %H:%M:%S')))
+        return sorted(groups)
+
+    async def precompute(self, months: List[str], bot=None) -> int:
+        """Build the reports of every active group for `months`; with a bot, send the first one to each group."""
+        groups = iter(self.active_groups())
+        built = 0
+
+        async def worker():
+            nonlocal built
+            # The workers share one iterator, so at most `concurrency` groups are in progress
+            for group_id in groups:
+                try:
+                    for month in months:
+                        await self.get(group_id, month)
+                        built += 1
+                    if bot is not None:
+                        await self._push(bot, group_id, *await self.get(group_id, months[0]))
+                except Exception as e:
+                    logger.error(f"Error precomputing the report of group {group_id}: {e}")
+
+        with metrics.timer('bot_report_precompute_seconds'):
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        metrics.inc('bot_reports_precomputed_total', value=built)
+        logger.info(f"Precomputed {built} monthly reports for {', '.join(months)}")
+        return built
+
+    @staticmethod
+    async def _push(bot, group_id: int, text: str, chart: Optional[bytes]) -> None:
+        await bot.send_message(chat_id=group_id, text=text)
+        if chart:
+            await bot.send_photo(chat_id=group_id, photo=chart)
+
+    async def post_init(self, application) -> None:
+        at = parse_time(config.REPORT_PRECOMPUTE_TIME)
+        if at is None:
+            return
+        if application.job_queue is None:
+            logger.warning('Report precompute disabled: install "python-telegram-bot[job-queue]" to enable it')
+            return
+        application.job_queue.run_daily(self.precompute_job, time=at, name='report-precompute')
+        logger.info(f"Monthly reports will be precomputed daily at {config.REPORT_PRECOMPUTE_TIME}")
+
+    async def precompute_job(self, context) -> None:
+        """JobQueue callback: this month's reports; on the 1st also the month that just ended."""
+        month = current_month()
+        if datetime.now(timezone.utc).day == 1:
+            await self.precompute([previous_month(month), month], context.bot if config.REPORT_PUSH else None)
+        else:
+            await self.precompute([month])
@@ -0,0 +1,245 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+
+class ExpenseRepository(ABC):
+    """
+    Storage operations the bot relies on, independent of the database engine.
+
+    Rows returned by listing methods are plain tuples in the documented column
+    order, and timestamps are 'YYYY-MM-DD HH:MM:SS' strings, so handlers work
+    the same with every backend.
+    """
+
+    # Transactions
+
+    @abstractmethod
+    def add_transaction(self, user_id, group_id, transaction_type, amount, description=None,
+                        category_id=None, money_type_id=None, currency='ARS') -> int:
+        """Insert a transaction and return its id."""
+
+    @abstractmethod
+    def add_transactions(self, rows: List[tuple]) -> List[int]:
+        """
+        Insert several transactions atomically; each row holds add_transaction's arguments
+        in order (user_id, group_id, type, amount, description, category_id, money_type_id,
+        currency). Returns the new ids in the same order.
+        """
+
+    @abstractmethod
+    def search_transactions(self, group_id: int, terms: List[str], since: Optional[str] = None,
+                            until: Optional[str] = None, limit: int = 10, offset: int = 0) -> List[tuple]:
+        """
+        Rows like get_latest_transactions() whose description contains every term (lowercase,
+        unaccented words) as a word prefix, best match first, optionally within [since, until].
+        """
+
+    @abstractmethod
+    def delete_transaction(self, transaction_id: int, group_id: int, undo_of: Optional[int] = None) -> bool:
+        """Delete a transaction (and its exchange record) if it belongs to the group, journaling the row."""
+
+    @abstractmethod
+    def clear_transactions(self, group_id: int, journal: bool = True) -> None:
+        """
+        Delete every transaction of the group, journaled as a single 'clear' event unless
+        `journal` is False (the caller already recorded it).
+        """
+
+    @abstractmethod
+    def delete_transactions_chunk(self, group_id: int, chunk_size: int) -> int:
+        """Delete up to chunk_size of the group's transactions in one short write; returns the count."""
+
+    @abstractmethod
+    def count_transactions(self, group_id: int, category: Optional[str] = None) -> int:
+        """Number of transactions of the group (optionally of one category)."""
+
+    @abstractmethod
+    def get_latest_transactions(self, group_id: int, limit: Optional[int] = 10,
+                                category: Optional[str] = None) -> List[tuple]:
+        """(id, type, amount, description, category, timestamp) rows, newest first."""
+
+    # Exchanges
+
+    @abstractmethod
+    def add_exchange_transaction(self, transaction_id, source_currency, target_currency,
+                                 exchange_rate, source_amount, target_amount) -> None:
+        """Record the exchange details of an already inserted transaction."""
+
+    # Categories and money types
+
+    @abstractmethod
+    def get_or_create_category(self, name: str) -> int:
+        """Return the id of the category, creating it if needed."""
+
+    @abstractmethod
+    def get_or_create_money_type(self, name: str) -> int:
+        """Return the id of the money type, creating it if needed."""
+
+    @abstractmethod
+    def get_all_categories(self) -> List[str]:
+        """Names of every known category."""
+
+    @abstractmethod
+    def get_category_name(self, category_id: int) -> Optional[str]:
+        """Category name by id."""
+
+    @abstractmethod
+    def get_group_categories(self, group_id: int, limit: Optional[int] = None) -> List[Tuple[int, str, int]]:
+        """(id, name, uses) of the categories the group has used or budgeted, most used first."""
+
+    @abstractmethod
+    def add_group_category(self, group_id: int, category_id: int) -> None:
+        """Add a category to the group's vocabulary (with no uses) if it is not there yet."""
+
+    @abstractmethod
+    def get_money_type_name(self, money_type_id: int) -> Optional[str]:
+        """Money type name by id."""
+
+    @abstractmethod
+    def rename_category(self, old_name: str, new_name: str, group_id: int,
+                        undo_of: Optional[int] = None) -> Tuple[bool, str]:
+        """
+        Rename a category in one group's vocabulary, repointing that group's transactions,
+        budgets and counters and journaling it; other groups are untouched. Returns
+        (success, user facing message).
+        """
+
+    # Balances and summaries
+
+    @abstractmethod
+    def get_balances(self, group_id: int, until: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """{currency: {money_type: balance}} with exchanges netted per source currency, of transactions dated up to `until`."""
+
+    @abstractmethod
+    def get_expenses_by_currency_and_category(self, group_id: int) -> Dict[str, List[Tuple[str, float]]]:
+        """{currency: [(category, total expenses), ...]} sorted by total, descending."""
+
+    # Ledger journal and snapshots
+
+    @abstractmethod
+    def restore_transaction(self, group_id: int, payload: dict, undo_of: Optional[int] = None) -> int:
+        """Re-insert a transaction from a journaled 'delete' payload; returns its id."""
+
+    @abstractmethod
+    def record_ledger_event(self, group_id: int, event_type: str, payload: dict,
+                            transaction_id: Optional[int] = None) -> int:
+        """Append a standalone event to the group's journal and return its id."""
+
+    @abstractmethod
+    def get_ledger_events(self, group_id: int, after_id: int = 0, until_id: Optional[int] = None,
+                          limit: Optional[int] = None, newest_first: bool = False) -> List[tuple]:
+        """(id, event_type, transaction_id, payload dict, undo_of, created_at) rows."""
+
+    @abstractmethod
+    def last_ledger_event_id(self, group_id: int, until: Optional[str] = None) -> int:
+        """Id of the newest event recorded at or before `until` ('YYYY-MM-DD HH:MM:SS'), 0 if none."""
+
+    @abstractmethod
+    def last_dated_event_id(self, group_id: int, until: str) -> int:
+        """Id of the newest event that changed a transaction dated at or before `until`, or cleared the group; 0 if none."""
+
+    @abstractmethod
+    def get_latest_snapshot(self, group_id: int, until_id: Optional[int] = None) -> Optional[Tuple[int, dict]]:
+        """(last_event_id, state) of the newest snapshot not past until_id."""
+
+    @abstractmethod
+    def save_snapshot(self, group_id: int, last_event_id: int, state: dict) -> None:
+        """Store the folded state of the group's journal up to last_event_id."""
+
+    # Budgets; spending is counted per category and month as transactions are written
+
+    @abstractmethod
+    def set_budget(self, group_id: int, category_id: int, amount: float, currency: str = 'ARS') -> None:
+        """Set a category's monthly budget; an amount of 0 or less removes it."""
+
+    @abstractmethod
+    def get_budgets(self, group_id: int) -> List[Tuple[str, str, float, float]]:
+        """(category, currency, budget, spent this month) for every budget of the group."""
+
+    @abstractmethod
+    def get_budget_status(self, group_id: int, category_id: int, currency: str) -> Optional[Tuple[float, float]]:
+        """(budget, spent this month) read from the month-to-date counters, or None without a budget."""
+
+    @abstractmethod
+    def get_month_expenses(self, group_id: int, month: str) -> Dict[str, List[Tuple[str, float]]]:
+        """Expenses of a month ('YYYY-MM', UTC) by category for every currency, read from the counters."""
+
+    @abstractmethod
+    def get_category_month_totals(self, group_id: int) -> List[Tuple[str, str, str, float]]:
+        """(month, currency, category, spent) of every month-to-date counter of the group."""
+
+    @abstractmethod
+    def get_expense_history(self, group_id: int) -> List[Tuple[int, str, float, Optional[int], str]]:
+        """(id, timestamp, amount as a positive number, category_id, currency) of every expense, oldest first."""
+
+    @abstractmethod
+    def get_active_groups(self, since: str) -> List[int]:
+        """Groups with a ledger event recorded at or after `since` (UTC, 'YYYY-MM-DD HH:MM:SS')."""
+
+    # Exchange rates
+
+    @abstractmethod
+    def add_exchange_rate(self, group_id: int, source_currency: str, target_currency: str, rate: float) -> None:
+        """Record a rate typed by the user (1 source = rate target), effective from now."""
+
+    @abstractmethod
+    def get_exchange_rates(self, group_id: int) -> List[Tuple[str, str, str, float]]:
+        """(timestamp, source, target, rate) of every recorded exchange and manual rate, oldest first."""
+
+    # Processed updates
+
+    @abstractmethod
+    def get_processed_update(self, update_id: int) -> Optional[Tuple[str, dict]]:
+        """(outcome, result) recorded for a Telegram update, or None if it was never handled."""
+
+    @abstractmethod
+    def record_processed_update(self, update_id: int, chat_id: int, message_id: Optional[int],
+                                outcome: str, result: Optional[dict] = None) -> None:
+        """Insert or overwrite the outcome of a Telegram update."""
+
+    @abstractmethod
+    def prune_processed_updates(self, older_than: str) -> int:
+        """Delete updates processed before older_than ('YYYY-MM-DD HH:MM:SS'); returns the count."""
+
+    # Inbox of messages waiting for the LLM
+
+    @abstractmethod
+    def add_inbox_message(self, update_id: int, chat_id: int, payload: dict, status: str = 'pending',
+                          owner: Optional[str] = None, shard_key: Optional[int] = None) -> Optional[int]:
+        """
+        Queue a message (the serialized update); None when the update is already queued.
+        A message being processed right away is added as 'processing', claimed by `owner`,
+        so no drain claims it. `shard_key` (the chat's hash) tells which worker owns the chat.
+        """
+
+    @abstractmethod
+    def claim_inbox_messages(self, limit: int, owner: Optional[str] = None,
+                             shard: Optional[Tuple[int, int]] = None) -> List[Tuple[int, dict, int]]:
+        """
+        Move up to limit pending messages to 'processing' for `owner`; (id, payload, attempts)
+        oldest first. With `shard` (index, worker count) only messages whose shard_key modulo
+        the worker count is index are claimed (no key counts as 0).
+        """
+
+    @abstractmethod
+    def set_inbox_status(self, inbox_id: int, status: str) -> None:
+        """Set a message's status ('pending' to retry it later, 'failed' to give up)."""
+
+    @abstractmethod
+    def complete_inbox_message(self, inbox_id: int) -> None:
+        """Remove a handled message."""
+
+    @abstractmethod
+    def requeue_inbox_messages(self, claimed_before: str, owner: Optional[str] = None) -> int:
+        """
+        Return 'processing' messages to 'pending' when they belong to `owner` (a restarted
+        worker) or their lease ran out (claimed before claimed_before); returns the count.
+        """
+
+    @abstractmethod
+    def count_inbox_messages(self, status: str = 'pending') -> int:
+        """Number of messages with the given status."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Release the underlying connection(s)."""
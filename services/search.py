@@ -0,0 +1,41 @@
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+from services.intent_router import normalize
+from services.reports import month_end
+
+# Results per /buscar page
+PAGE_SIZE = 10
+# Searches whose pager buttons still work, per chat
+MAX_SAVED_SEARCHES = 20
+
+_TERM = re.compile(r'[a-z0-9]+')
+
+
+def search_terms(text: str) -> List[str]:
+    """Lowercase, unaccented words, the form the search indexes store."""
+    return _TERM.findall(normalize(text))
+
+
+def parse_bound(value: str, end: bool = False) -> Optional[str]:
+    """'AAAA-MM-DD' or 'AAAA-MM' as the first (or, with end, last) second it covers; None otherwise."""
+    for fmt in ('%Y-%m-%d', '%Y-%m'):
+        try:
+            day = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if end:
+            day = month_end(day.strftime('%Y-%m')) if fmt == '%Y-%m' else day.replace(hour=23, minute=59, second=59)
+        return day.strftime('%Y-%m-%d %H:%M:%S')
+    return None
+
+
+def parse_search_args(args: List[str]) -> Tuple[List[str], Optional[str], Optional[str]]:
+    """/buscar texto [desde] [hasta]: up to two trailing dates, the rest is the text."""
+    args = list(args)
+    dates = []
+    while args and len(dates) < 2 and parse_bound(args[-1]):
+        dates.insert(0, args.pop())
+    since = parse_bound(dates[0]) if dates else None
+    until = parse_bound(dates[1], end=True) if len(dates) > 1 else None
+    return search_terms(' '.join(args)), since, until
@@ -0,0 +1,147 @@
+import os
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from database import DatabaseHandler
+from services.repository import ExpenseRepository
+from utils.logger import logger
+
+LAYOUT_SINGLE = 'single'
+LAYOUT_GROUP = 'group'
+LAYOUT_BUCKET = 'bucket'
+
+
+def shard_file_name(layout: str, group_id: int, buckets: int) -> str:
+    """File name (inside the shard directory) holding a group's data."""
+    if layout == LAYOUT_GROUP:
+        return f"group_{group_id}.db"
+    if layout == LAYOUT_BUCKET:
+        return f"bucket_{zlib.crc32(str(group_id).encode()) % buckets}.db"
+    raise ValueError(f"Layout '{layout}' does not use shard files")
+
+
+class ShardRouter:
+    """
+    Maps a group to the DatabaseHandler that stores it.
+
+    - single: every group lives in one database (the original layout)
+    - group:  one SQLite file per group, so clearing or archiving a group is a file operation
+    - bucket: groups are hashed into a fixed number of files
+
+    Open shard connections are kept in an LRU so a long tail of idle groups
+    does not exhaust file descriptors; a shard held through lease() is never evicted, so
+    code keeping a handler across an await can't have it closed underneath. Passing
+    `default` (e.g. a PostgresRepository) with the single layout routes every group to
+    that repository.
+    """
+
+    def __init__(self, layout: str = LAYOUT_SINGLE, db_name: str = 'expenses.db', shard_dir: str = 'shards',
+                 buckets: int = 16, cache_size: int = 64, default: Optional[ExpenseRepository] = None):
+        if layout not in (LAYOUT_SINGLE, LAYOUT_GROUP, LAYOUT_BUCKET):
+            raise ValueError(f"Unknown database layout '{layout}'")
+        self.layout = layout
+        self.db_name = db_name
+        self.shard_dir = shard_dir
+        self.buckets = buckets
+        self.cache_size = max(cache_size, 1)
+        self._default: Optional[ExpenseRepository] = default
+        self._shards: "OrderedDict[str, DatabaseHandler]" = OrderedDict()
+        self._leases: Dict[str, int] = {}
+        if layout != LAYOUT_SINGLE:
+            os.makedirs(shard_dir, exist_ok=True)
+
+    @property
+    def default(self) -> ExpenseRepository:
+        """The shared database used by the single layout."""
+        if self._default is None:
+            self._default = DatabaseHandler(self.db_name)
+        return self._default
+
+    def shard_path(self, group_id: int) -> str:
+        return os.path.join(self.shard_dir, shard_file_name(self.layout, group_id, self.buckets))
+
+    def get(self, group_id: int) -> ExpenseRepository:
+        if self.layout == LAYOUT_SINGLE:
+            return self.default
+        return self._open(self.shard_path(group_id))
+
+    def _open(self, path: str) -> DatabaseHandler:
+        db = self._shards.get(path)
+        if db is not None:
+            self._shards.move_to_end(path)
+            return db
+
+        db = DatabaseHandler(path)
+        self._shards[path] = db
+        self._evict()
+        return db
+
+    def _evict(self) -> None:
+        # Least recently used first, skipping leased shards and the one just opened;
+        # while too many are leased the cache stays over its size
+        for path in list(self._shards)[:-1]:
+            if len(self._shards) <= self.cache_size:
+                break
+            if path not in self._leases:
+                self._close(path)
+
+    @contextmanager
+    def lease(self, group_id: int) -> Iterator[ExpenseRepository]:
+        """get() for code that keeps the repository across awaits: it stays open until released."""
+        if self.layout == LAYOUT_SINGLE:
+            yield self.default
+            return
+        path = self.shard_path(group_id)
+        db = self._open(path)
+        self._leases[path] = self._leases.get(path, 0) + 1
+        try:
+            yield db
+        finally:
+            self._leases[path] -= 1
+            if not self._leases[path]:
+                del self._leases[path]
+                self._evict()
+
+    def each(self) -> Iterator[ExpenseRepository]:
+        """Every repository holding groups: the shared one, or each shard file in turn."""
+        if self.layout == LAYOUT_SINGLE:
+            yield self.default
+            return
+        for name in sorted(os.listdir(self.shard_dir)):
+            if name.endswith('.db'):
+                yield self._open(os.path.join(self.shard_dir, name))
+
+    def _close(self, path: str) -> None:
+        db = self._shards.pop(path, None)
+        if db is not None:
+            db.close()
+
+    def drop_group(self, group_id: int, archive_dir: Optional[str] = None) -> bool:
+        """
+        Remove (or move to archive_dir) a group's shard file.
+        Only possible with the per-group layout; returns False otherwise.
+        """
+        if self.layout != LAYOUT_GROUP:
+            return False
+
+        path = self.shard_path(group_id)
+        self._close(path)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+        for suffix in ('', '-wal', '-shm'):
+            if not os.path.exists(path + suffix):
+                continue
+            if archive_dir:
+                os.replace(path + suffix, os.path.join(archive_dir, os.path.basename(path) + suffix))
+            else:
+                os.remove(path + suffix)
+        logger.info(f"{'Archived' if archive_dir else 'Dropped'} shard {path} for group {group_id}")
+        return True
+
+    def close_all(self) -> None:
+        for path in list(self._shards):
+            self._close(path)
+        if self._default is not None:
+            self._default.close()
+            self._default = None
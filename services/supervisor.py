@@ -0,0 +1,148 @@
+import asyncio
+import multiprocessing
+import signal
+import time
+import zlib
+from typing import List, Optional
+from telegram import Update
+from utils.logger import logger
+from utils.metrics import metrics
+
+# Restart backoff for crashing workers, in seconds
+MIN_RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+
+
+def chat_hash(chat_id: int) -> int:
+    """Stable hash of a chat (unlike hash(), crc32 does not change between processes)."""
+    return zlib.crc32(str(chat_id).encode())
+
+
+def shard_for(chat_id: int, worker_count: int) -> int:
+    """Stable chat → worker mapping."""
+    return chat_hash(chat_id) % worker_count
+
+
+def global_job_hooks(transaction_service, worker_id: str) -> list:
+    """
+    post_init hooks scheduling the jobs that cover every group (report precompute, weekly digest).
+    Only the single process or worker 0 schedules them, or each worker would send its own copy.
+    """
+    if worker_id not in ('main', 'worker-0'):
+        return []
+    return [transaction_service.reports.post_init, transaction_service.analytics.post_init]
+
+
+class ShardSupervisor:
+    """
+    Routes updates to N worker processes by chat id.
+
+    Every chat always lands on the same worker and each worker handles its queue
+    sequentially, so messages of one chat are processed in order while different
+    chats use different cores. Workers that die are restarted with backoff and
+    keep consuming the same queue.
+    """
+
+    def __init__(self, worker_count: int):
+        self.worker_count = worker_count
+        self._ctx = multiprocessing.get_context('spawn')
+        self.queues = [self._ctx.Queue() for _ in range(worker_count)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * worker_count
+        self._restart_delay = [MIN_RESTART_DELAY] * worker_count
+        self._started_at = [0.0] * worker_count
+        self._monitor_task = None
+        self._stopping = False
+
+    async def forward(self, update: Update, context) -> None:
+        chat = update.effective_chat
+        worker = shard_for(chat.id if chat else 0, self.worker_count)
+        self.queues[worker].put(update.to_dict())
+        metrics.inc('bot_supervisor_forwarded_total', worker=worker)
+
+    def _start_worker(self, index: int) -> None:
+        process = self._ctx.Process(
+            target=worker_main, args=(index, self.worker_count, self.queues[index]), name=f'bot-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    async def start(self, application=None) -> None:
+        for index in range(self.worker_count):
+            self._start_worker(index)
+        self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def _monitor(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if process is None or process.is_alive() or self._stopping:
+                    continue
+                metrics.inc('bot_supervisor_restarts_total', worker=index)
+                # A worker that ran for a while restarts quickly; crash loops back off exponentially
+                if time.monotonic() - self._started_at[index] > MAX_RESTART_DELAY:
+                    self._restart_delay[index] = MIN_RESTART_DELAY
+                delay = self._restart_delay[index]
+                self._restart_delay[index] = min(delay * 2, MAX_RESTART_DELAY)
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting in {delay:.0f}s")
+                self.processes[index] = None
+                asyncio.get_running_loop().call_later(delay, self._restart, index)
+
+    def _restart(self, index: int) -> None:
+        if not self._stopping and self.processes[index] is None:
+            self._start_worker(index)
+
+    async def stop(self, application=None) -> None:
+        self._stopping = True
+        if self._monitor_task:
+            self._monitor_task.cancel()
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, 10)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in time, terminating")
+                process.terminate()
+        logger.info("All workers stopped")
+
+
+def worker_main(index: int, worker_count: int, queue) -> None:
+    """Entry point of a worker process."""
+    # Shutdown is driven by the supervisor through a None sentinel on the queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, worker_count, queue))
+
+
+async def _run_worker(index: int, worker_count: int, queue) -> None:
+    # Imported here: bot imports this module, and workers are started with spawn
+    import config
+    from bot import build_application, configure_profiler
+    from services.transaction_service import TransactionService
+    from utils.metrics import start_metrics_server
+
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT + 1 + index, config.METRICS_HOST)
+    configure_profiler()
+
+    application = build_application(TransactionService(), use_updater=False, worker_id=f'worker-{index}',
+                                    shard=(index, worker_count))
+    loop = asyncio.get_running_loop()
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        logger.info(f"Worker {index} ready")
+        try:
+            while True:
+                data = await loop.run_in_executor(None, queue.get)
+                if data is None:
+                    break
+                # Processing inline (not through the update queue) keeps per-chat ordering strict
+                await application.process_update(Update.de_json(data, application.bot))
+        finally:
+            await application.stop()
+    logger.info(f"Worker {index} stopped")
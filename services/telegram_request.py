@@ -0,0 +1,24 @@
+from telegram.request import HTTPXRequest
+import config
+from utils.metrics import metrics
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency of every Bot API call by endpoint."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        with metrics.timer('bot_telegram_request_seconds', endpoint=endpoint):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+def build_request() -> InstrumentedRequest:
+    """
+    Request used for Bot API calls. The pool is sized for many chats answered at once,
+    and a request waits up to TELEGRAM_POOL_TIMEOUT for a free connection instead of failing.
+    """
+    return InstrumentedRequest(
+        connection_pool_size=config.TELEGRAM_POOL_SIZE,
+        pool_timeout=config.TELEGRAM_POOL_TIMEOUT,
+        http_version=config.TELEGRAM_HTTP_VERSION,
+    )
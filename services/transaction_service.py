@@ -1,12 +1,50 @@
+import asyncio
+from typing import Tuple
 from models.transaction import Transaction, ExchangeTransaction
-from database import DatabaseHandler
+from services.analytics import AnalyticsService
+from services.budgets import BudgetService
+from services.categories import CategoryService
+from services.exchange_rates import ExchangeRateService
+from services.ledger import LedgerService
+from services.reports import ReportService
+from services.repository import ExpenseRepository
+from services.shard_router import ShardRouter
+import config
+
+
+def create_router() -> ShardRouter:
+    """Build the storage router for the configured backend and layout."""
+    if config.STORAGE_BACKEND == "postgres":
+        from services.postgres_repository import PostgresRepository
+        return ShardRouter(default=PostgresRepository(config.POSTGRES_DSN, max_size=config.POSTGRES_POOL_SIZE))
+    return ShardRouter(
+        layout=config.DB_LAYOUT,
+        shard_dir=config.DB_SHARD_DIR,
+        buckets=config.DB_SHARD_BUCKETS,
+        cache_size=config.DB_SHARD_CACHE_SIZE,
+    )
+
 
 class TransactionService:
-    def __init__(self):
-        self.db = DatabaseHandler()
+    def __init__(self, router: ShardRouter = None):
+        self.router = router or create_router()
+        self.ledger = LedgerService(self)
+        self.categories = CategoryService(self)
+        self.budgets = BudgetService(self)
+        self.reports = ReportService(self)
+        self.rates = ExchangeRateService(self)
+        self.analytics = AnalyticsService(self)
+
+    @property
+    def db(self) -> ExpenseRepository:
+        """Shared repository of the single layout; group-scoped code should use db_for()."""
+        return self.router.default
+
+    def db_for(self, group_id: int) -> ExpenseRepository:
+        return self.router.get(group_id)
 
     def add_transaction(self, transaction):
-        transaction_id = self.db.add_transaction(
+        transaction_id = self.db_for(transaction.group_id).add_transaction(
             transaction.user_id,
             transaction.group_id,
             transaction.type,
@@ -16,14 +54,101 @@ class TransactionService:
             transaction.money_type_id,
             transaction.currency
         )
+        self.ledger.note_write(transaction.group_id)
         return transaction_id
 
-    def add_exchange_transaction(self, exchange_transaction):
-        self.db.add_exchange_transaction(
+    def add_transactions(self, transactions) -> list:
+        """Insert transactions of one group in a single database transaction."""
+        if not transactions:
+            return []
+        group_id = transactions[0].group_id
+        ids = self.db_for(group_id).add_transactions([
+            (t.user_id, t.group_id, t.type, t.amount, t.description, t.category_id, t.money_type_id, t.currency)
+            for t in transactions
+        ])
+        self.ledger.note_write(group_id)
+        return ids
+
+    def add_exchange_transaction(self, exchange_transaction, group_id: int = None):
+        db = self.db if group_id is None else self.db_for(group_id)
+        db.add_exchange_transaction(
             exchange_transaction.transaction_id,
             exchange_transaction.source_currency,
             exchange_transaction.target_currency,
             exchange_transaction.exchange_rate,
             exchange_transaction.source_amount,
             exchange_transaction.target_amount
-        ) 
\ No newline at end of file
+        )
+        if group_id is not None:
+            self.ledger.note_write(group_id)
+            self.rates.forget(group_id)
+
+    def delete_transaction(self, group_id: int, transaction_id: int) -> bool:
+        deleted = self.db_for(group_id).delete_transaction(transaction_id, group_id)
+        if deleted:
+            self.ledger.note_write(group_id)
+            # It may have been an exchange
+            self.rates.forget(group_id)
+        return deleted
+
+    def undo_last(self, group_id: int) -> Tuple[bool, str]:
+        """Revert the group's last insert, delete or rename through its ledger."""
+        success, message = self.ledger.undo_last(group_id)
+        if success:
+            self.rates.forget(group_id)
+        return success, message
+
+    def rename_category(self, group_id: int, old_name: str, new_name: str) -> Tuple[bool, str]:
+        """Rename a category for this group only, journaling the change in its ledger."""
+        success, message = self.db_for(group_id).rename_category(old_name, new_name, group_id)
+        if success:
+            self.ledger.note_write(group_id)
+        return success, message
+
+    def clear_group(self, group_id: int) -> None:
+        """Delete all of a group's transactions; with per-group files this just removes the file."""
+        self.rates.forget(group_id)
+        self.analytics.forget(group_id)
+        if not self.router.drop_group(group_id):
+            self.db_for(group_id).clear_transactions(group_id)
+            self.ledger.note_write(group_id)
+        else:
+            # The journal lived in the dropped file
+            self.ledger.forget(group_id)
+
+    def archive_group(self, group_id: int, archive_dir: str) -> bool:
+        """Move a group's shard file into archive_dir (per-group layout only)."""
+        self.ledger.forget(group_id)
+        self.rates.forget(group_id)
+        self.analytics.forget(group_id)
+        return self.router.drop_group(group_id, archive_dir=archive_dir)
+
+    def clear_is_instant(self) -> bool:
+        """True when clearing a group is a file operation rather than row deletes."""
+        return self.router.layout == 'group'
+
+    async def clear_group_in_chunks(self, group_id: int, chunk_size: int = 500, pause: float = 0.05):
+        """
+        Delete a group's transactions in short write transactions, yielding the running total.
+        Pausing between chunks releases the write lock so other chats keep writing.
+        """
+        self.rates.forget(group_id)
+        self.analytics.forget(group_id)
+        if self.router.drop_group(group_id):
+            self.ledger.forget(group_id)
+            return
+        # Leased so other groups opening shards while this one sleeps can't evict (close) it
+        with self.router.lease(group_id) as db:
+            # Journal the clear up front so balances read while chunks are deleted already see it
+            db.record_ledger_event(group_id, 'clear', {'chunked': True})
+            deleted = 0
+            while True:
+                count = db.delete_transactions_chunk(group_id, chunk_size)
+                if not count:
+                    break
+                deleted += count
+                yield deleted
+                await asyncio.sleep(pause)
+            # Nothing is left to delete; this only resets the id sequences (the clear is already journaled)
+            db.clear_transactions(group_id, journal=False)
+        self.ledger.note_write(group_id)
@@ -0,0 +1,81 @@
+import asyncio
+import hmac
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from utils.logger import logger
+from utils.metrics import metrics
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """
+    Minimal aiohttp app that receives Telegram webhooks and feeds the PTB update queue.
+
+    It speaks plain HTTP and is meant to sit behind a TLS-terminating reverse proxy
+    (nginx, Caddy, ...). Requests without the configured secret token are rejected,
+    and a full update queue answers 503 so Telegram retries the delivery later.
+    """
+
+    def __init__(self, application: Application, secret_token: str, path: str = '/telegram',
+                 host: str = '127.0.0.1', port: int = 8080):
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/health', self.handle_health)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        received = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(received, self.secret_token):
+            logger.warning(f"Rejected webhook call with invalid secret token from {request.remote}")
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            metrics.inc('bot_webhook_rejected_total', reason='queue_full')
+            logger.warning(f"Update queue full, asking Telegram to retry update {update.update_id}")
+            return web.Response(status=503)
+
+        metrics.inc('bot_webhook_updates_total')
+        return web.Response(status=200)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        queue = self.application.update_queue
+        healthy = self.application.running
+        return web.json_response(
+            {
+                'status': 'ok' if healthy else 'starting',
+                'queue_size': queue.qsize(),
+                'queue_max_size': queue.maxsize,
+            },
+            status=200 if healthy else 503,
+        )
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"Webhook server listening on http://{self.host}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
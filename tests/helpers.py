@@ -0,0 +1,21 @@
+from database import DatabaseHandler
+from services.categories import CategoryService
+from services.ledger import LedgerService
+from services.shard_router import ShardRouter
+
+
+class DummyTransactionService:
+    """
+    Stand-in for TransactionService in service tests: every group lives in one repository
+    (a new in-memory database unless `db` is given), with the ledger and category services
+    on top. Tests that need more (reports, analytics) set those attributes themselves.
+    """
+
+    def __init__(self, db: DatabaseHandler = None):
+        self.router = ShardRouter(db_name=':memory:', default=db)
+        self.db = self.router.default
+        self.ledger = LedgerService(self)
+        self.categories = CategoryService(self)
+
+    def db_for(self, group_id):
+        return self.db
@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from services.analytics import AnalyticsService, ExpenseColumns
+from helpers import DummyTransactionService
+
+
+def expense(amount, category_id, currency='ARS', group_id=10):
+    return SimpleNamespace(type='expense', group_id=group_id, amount=-amount, category_id=category_id,
+                           currency=currency)
+
+
+class TestAnalyticsService(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.service.reports = MagicMock()
+        self.db = self.service.db
+        self.analytics = AnalyticsService(self.service, history_months=3, z_threshold=3.0, min_samples=5)
+        self.food = self.db.get_or_create_category('comida')
+        self.travel = self.db.get_or_create_category('viajes')
+        self.cash = self.db.get_or_create_money_type('cash')
+
+    def tearDown(self):
+        self.db.close()
+
+    def spend(self, amount, category_id, when=None, currency='ARS'):
+        tx_id = self.db.add_transaction(1, 10, 'expense', -amount, 'tx', category_id, self.cash, currency)
+        if when is not None:
+            self.db.cursor.execute('UPDATE transactions SET timestamp = ? WHERE id = ?',
+                                   (when.strftime('%Y-%m-%d %H:%M:%S'), tx_id))
+            self.db.conn.commit()
+        return tx_id
+
+    def test_new_expenses_are_appended_from_the_ledger(self):
+        self.spend(100.0, self.food)
+        self.assertEqual(len(self.analytics.columns(10)), 1)
+        self.spend(200.0, self.food)
+        self.spend(5.0, self.food, currency='USD')
+        columns = self.analytics.columns(10)
+        self.assertEqual(columns.amounts.tolist(), [100.0, 200.0, 5.0])
+        self.assertEqual(columns.currencies.tolist(), ['ARS', 'ARS', 'USD'])
+        self.assertEqual(columns.event_id, self.db.last_ledger_event_id(10))
+
+        # A delete cannot be appended: the group is reloaded
+        self.db.delete_transaction(int(columns.ids[0]), 10)
+        self.assertEqual(self.analytics.columns(10).amounts.tolist(), [200.0, 5.0])
+
+    def test_unusual_expense_is_flagged(self):
+        for amount in (900, 1000, 1100, 950, 1050, 1000, 980, 1020):
+            self.spend(float(amount), self.food)
+        self.spend(20000.0, self.food)
+        alerts = self.analytics.anomalies([expense(20000.0, self.food)])
+        self.assertEqual(len(alerts), 1)
+        self.assertIn("$20,000.00 ARS en comida", alerts[0])
+
+        # A usual amount, a category without enough history and another currency are not
+        self.spend(1000.0, self.food)
+        self.spend(50000.0, self.travel)
+        self.spend(400.0, self.food, currency='USD')
+        self.assertEqual(self.analytics.anomalies([
+            expense(1000.0, self.food), expense(50000.0, self.travel), expense(400.0, self.food, 'USD'),
+        ]), [])
+        self.assertEqual(self.analytics.anomalies([SimpleNamespace(type='income')]), [])
+
+    def test_month_comparison_is_prorated(self):
+        now = datetime(2024, 6, 16, tzinfo=timezone.utc)
+        for month in (3, 4, 5):
+            self.spend(3000.0, self.food, datetime(2024, month, 10))
+        self.spend(9000.0, self.travel, datetime(2024, 2, 10))
+        self.spend(2000.0, self.food, datetime(2024, 6, 2))
+        comparison = self.analytics.month_comparison(10, now=now)
+        self.assertEqual(comparison['observed_months'], 3)
+        self.assertEqual(comparison['spent'], 2000.0)
+        # Half of June has passed: half of the 3000 usually spent by now
+        self.assertAlmostEqual(comparison['expected'], 1500.0)
+        self.assertEqual([row[0] for row in comparison['categories']], [self.food])
+        # February to May, three months at a time
+        self.assertEqual(comparison['rolling'], [5000.0, 3000.0])
+        self.assertIsNone(self.analytics.month_comparison(10, currency='EUR', now=now))
+
+    def test_category_percentiles(self):
+        for amount in range(100, 1100, 100):
+            self.spend(float(amount), self.food)
+        self.spend(70.0, self.travel)
+        rows = self.analytics.category_percentiles(10)
+        self.assertEqual(rows[0][:2], (self.food, 10))
+        self.assertAlmostEqual(rows[0][3], 550.0)
+        self.assertEqual(rows[1], (self.travel, 1, 70.0, 70.0, 70.0))
+        self.assertIn("• comida: $550.00", self.analytics.typical_report(10))
+        self.assertEqual(self.analytics.typical_report(10, 'EUR'), "No hay gastos en EUR todavía.")
+
+    def test_weekly_digest(self):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for weeks in range(1, 5):
+            self.spend(1000.0, self.food, now - timedelta(days=7 * weeks + 1))
+        self.spend(1500.0, self.food, now - timedelta(days=1))
+        digest = self.analytics.weekly_digest(10)
+        self.assertIn("Gastaste $1,500.00 ARS en los últimos 7 días.", digest)
+        self.assertIn("Tu promedio semanal es $1,000.00 (+50%)", digest)
+        self.assertIn("• comida: $1,500.00", digest)
+        self.assertIsNone(self.analytics.weekly_digest(11))
+
+        self.service.reports.active_groups.return_value = [10, 11]
+        context = SimpleNamespace(bot=SimpleNamespace(send_message=AsyncMock()))
+        asyncio.run(self.analytics.digest_job(context))
+        context.bot.send_message.assert_awaited_once()
+        self.service.reports.active_groups.assert_called_with(days=7)
+
+
+class TestExpenseColumns(unittest.TestCase):
+    def test_append(self):
+        columns = ExpenseColumns([(1, '2024-01-01 10:00:00', 5.0, None, 'ARS')], 3)
+        columns = columns.append([(2, '2024-01-02 10:00:00', 7.0, 4, 'USD')], 5)
+        self.assertEqual(columns.categories.tolist(), [-1, 4])
+        self.assertEqual(columns.currencies.tolist(), ['ARS', 'USD'])
+        self.assertEqual(columns.event_id, 5)
+        self.assertEqual(len(ExpenseColumns([], 0)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
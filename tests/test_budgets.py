@@ -0,0 +1,53 @@
+import unittest
+from types import SimpleNamespace
+from services.budgets import BudgetService
+from helpers import DummyTransactionService
+
+
+class TestBudgetService(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.db = self.service.db
+        self.budgets = BudgetService(self.service)
+        self.budgets.set(10, 'comida', 1000.0)
+        self.food = self.db.get_or_create_category('comida')
+        self.cash = self.db.get_or_create_money_type('cash')
+
+    def tearDown(self):
+        self.db.close()
+
+    def spend(self, *amounts, category_id=None, currency='ARS'):
+        written = []
+        for amount in amounts:
+            category_id = category_id or self.food
+            self.db.add_transaction(1, 10, 'expense', -amount, 'tx', category_id, self.cash, currency)
+            written.append(SimpleNamespace(group_id=10, type='expense', amount=-amount,
+                                           category_id=category_id, currency=currency))
+        return self.budgets.check(written)
+
+    def test_alerts_once_per_threshold(self):
+        self.assertEqual(self.spend(500.0), [])
+        alerts = self.spend(350.0)
+        self.assertEqual(len(alerts), 1)
+        self.assertIn('85%', alerts[0])
+        self.assertEqual(self.spend(100.0), [])
+        self.assertIn('Superaste', self.spend(100.0)[0])
+        self.assertEqual(self.spend(100.0), [])
+
+    def test_batch_crossing_both_thresholds_alerts_once(self):
+        alerts = self.spend(600.0, 600.0)
+        self.assertEqual(len(alerts), 1)
+        self.assertIn('Superaste', alerts[0])
+
+    def test_other_categories_and_currencies_are_ignored(self):
+        salud = self.db.get_or_create_category('salud')
+        self.assertEqual(self.spend(2000.0, category_id=salud), [])
+        self.assertEqual(self.spend(2000.0, currency='USD'), [])
+
+    def test_list(self):
+        self.spend(250.0)
+        self.assertEqual(self.budgets.list(10), [('comida', 'ARS', 1000.0, 250.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+from services.burst_coalescer import BurstCoalescer
+
+
+class TestBurstCoalescer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.flushed = []
+
+        async def flush(key, items):
+            self.flushed.append((key, items))
+
+        self.coalescer = BurstCoalescer(flush, window=0.05, max_items=3)
+
+    async def test_items_within_the_window_are_flushed_together(self):
+        self.coalescer.add('a', 1)
+        await asyncio.sleep(0.02)
+        self.coalescer.add('a', 2)
+        self.coalescer.add('b', 3)
+        self.assertEqual(self.flushed, [])
+        await asyncio.sleep(0.1)
+        self.assertEqual(sorted(self.flushed), [('a', [1, 2]), ('b', [3])])
+        self.assertFalse(self.coalescer.has_pending('a'))
+
+    async def test_flushes_early_at_max_items(self):
+        for n in range(3):
+            self.coalescer.add('a', n)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(self.flushed, [('a', [0, 1, 2])])
+
+    async def test_flush_now_and_shutdown(self):
+        self.coalescer.add('a', 1)
+        await self.coalescer.flush_now('a')
+        self.coalescer.add('b', 2)
+        await self.coalescer.shutdown()
+        self.assertEqual(self.flushed, [('a', [1]), ('b', [2])])
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(self.flushed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
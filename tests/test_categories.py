@@ -0,0 +1,62 @@
+import unittest
+from services.categories import CategoryService, DEFAULT_CATEGORIES, canonicalize, edit_distance, fold
+from helpers import DummyTransactionService
+
+
+class TestCanonicalize(unittest.TestCase):
+    def test_fold_and_distance(self):
+        self.assertEqual(fold('  Súper_Mercado '), 'super mercado')
+        self.assertEqual(edit_distance('supermercdo', 'supermercado', 2), 1)
+        self.assertEqual(edit_distance('ropa', 'entretenimiento', 2), 3)
+
+    def test_variants_land_on_the_existing_name(self):
+        vocabulary = ['supermercado', 'educación', 'servicios', 'gas']
+        self.assertEqual(canonicalize('Súper', vocabulary), 'supermercado')
+        self.assertEqual(canonicalize('supermercdo', vocabulary), 'supermercado')
+        self.assertEqual(canonicalize('EDUCACION', vocabulary), 'educación')
+        self.assertEqual(canonicalize('servicio', vocabulary), 'servicios')
+        # Short words need an exact match: one letter makes another word
+        self.assertIsNone(canonicalize('gym', vocabulary))
+        self.assertIsNone(canonicalize('mascotas', vocabulary))
+
+    def test_most_used_entry_wins_ties(self):
+        self.assertEqual(canonicalize('cafes', ['cafe', 'cafés']), 'cafés')
+        self.assertEqual(canonicalize('cafess', ['cafe', 'cafes']), 'cafes')
+
+
+class TestCategoryService(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.db = self.service.db
+        self.categories = CategoryService(self.service, prompt_size=3)
+        self.cash = self.db.get_or_create_money_type('cash')
+
+    def tearDown(self):
+        self.db.close()
+
+    def spend(self, group_id, category_id, times=1):
+        for _ in range(times):
+            self.db.add_transaction(1, group_id, 'expense', -100.0, 'tx', category_id, self.cash)
+
+    def test_resolve_reuses_before_creating(self):
+        mascotas = self.categories.resolve(10, 'Mascotas')
+        self.assertEqual(self.db.get_category_name(mascotas), 'mascotas')
+        self.assertEqual(self.categories.resolve(10, 'mascota'), mascotas)
+        self.assertEqual(self.db.get_category_name(self.categories.resolve(10, 'Súper')), 'supermercado')
+        self.assertEqual(self.categories.vocabulary(10), ['mascotas', 'supermercado'])
+        # Another group's vocabulary is not matched against
+        self.assertEqual(self.db.get_category_name(self.categories.resolve(11, 'mascota')), 'mascota')
+
+    def test_prompt_lists_the_most_used_categories(self):
+        self.assertEqual(self.categories.prompt_categories(10), list(DEFAULT_CATEGORIES[:3]))
+        self.spend(10, self.categories.resolve(10, 'mascotas'), times=3)
+        self.spend(10, self.categories.resolve(10, 'exchange'), times=5)
+        self.spend(10, self.categories.resolve(10, 'viajes'), times=2)
+        self.spend(10, self.categories.resolve(10, 'regalos'))
+        self.spend(10, self.categories.resolve(10, 'libros'))
+        self.assertEqual(self.categories.prompt_categories(10), ['mascotas', 'viajes', 'libros'])
+        self.assertEqual(self.categories.prompt_categories(11), list(DEFAULT_CATEGORIES[:3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,5 +17,50 @@ class TestDatabaseHandler(unittest.TestCase):
         money_type_id = self.db.get_or_create_money_type('Test Money Type')
         self.assertIsNotNone(money_type_id)
 
+    def test_get_balances_nets_exchanges_per_currency(self):
+        cash = self.db.get_or_create_money_type('cash')
+        bank = self.db.get_or_create_money_type('bank')
+        self.db.add_transaction(1, 1, 'income', 1000.0, 'Sueldo', 1, bank, 'USD')
+        self.db.add_transaction(1, 1, 'expense', -200.0, 'Super', 1, cash, 'ARS')
+        self.db.add_transaction(1, 1, 'income', 50.0, 'Regalo', 1, cash, 'EUR')
+        # 100 USD sold for 90000 ARS into the bank account
+        tx_id = self.db.add_transaction(1, 1, 'income', 90000.0, 'Exchange', 1, bank, 'ARS')
+        self.db.add_exchange_transaction(tx_id, 'USD', 'ARS', 900.0, 100.0, 90000.0)
+        # Another group must not leak into the result
+        self.db.add_transaction(1, 2, 'income', 5.0, 'Otro grupo', 1, cash, 'ARS')
+
+        balances = self.db.get_balances(1)
+        self.assertEqual(balances['ARS'], {'cash': -200.0, 'bank': 90000.0})
+        self.assertEqual(balances['USD'], {'bank': 900.0})
+        self.assertEqual(balances['EUR'], {'cash': 50.0})
+        self.assertEqual(self.db.get_balance_by_money_type_and_currency(1, None, 'USD'), 900.0)
+        self.assertEqual(self.db.get_balance_by_money_type_and_currency(1, bank, 'ARS'), 90000.0)
+
+    def test_get_balances_empty_group(self):
+        self.assertEqual(self.db.get_balances(99), {})
+
+    def test_clear_transactions_beyond_parameter_limit(self):
+        # More rows than SQLite's bound-parameter limit used to break the IN (?, ?, ...) delete
+        rows = [(1, 1, 'expense', -1.0, 'x', 1, 1, 'ARS')] * 40000
+        self.db.cursor.executemany(
+            'INSERT INTO transactions (user_id, group_id, type, amount, description, '
+            'category_id, money_type_id, currency) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+        )
+        self.db.conn.commit()
+        self.db.add_exchange_transaction(1, 'USD', 'ARS', 1.0, 1.0, 1.0)
+        self.db.add_transaction(1, 2, 'income', 10.0, 'otro grupo', 1, 1)
+
+        self.assertEqual(self.db.count_transactions(1), 40000)
+        self.db.clear_transactions(1)
+        self.assertEqual(self.db.count_transactions(1), 0)
+        self.assertEqual(self.db.count_transactions(2), 1)
+        self.db.cursor.execute('SELECT COUNT(*) FROM exchange_transactions')
+        self.assertEqual(self.db.cursor.fetchone()[0], 0)
+
+    def test_count_uses_group_index(self):
+        self.db.cursor.execute('EXPLAIN QUERY PLAN SELECT COUNT(*) FROM transactions WHERE group_id = ?', (1,))
+        plan = " ".join(str(row[-1]) for row in self.db.cursor.fetchall())
+        self.assertIn('idx_transactions_group_timestamp', plan)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
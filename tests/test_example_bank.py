@@ -0,0 +1,26 @@
+import unittest
+from services.example_bank import EXAMPLE_BANK, format_examples, select_examples
+
+
+class TestExampleBank(unittest.TestCase):
+    def test_picks_the_most_similar_examples_of_the_intent(self):
+        examples = select_examples("Cargué nafta 20000 con tarjeta", 'transaction')
+        self.assertEqual(len(examples), 2)
+        self.assertEqual(examples[0][1], "Cargué nafta 30000 con la tarjeta")
+        self.assertTrue(all(intent == 'transaction' for intent, _, _ in examples))
+
+    def test_exchange_gets_only_exchange_examples(self):
+        examples = select_examples("Cambié 300 dólares", 'exchange', limit=1)
+        self.assertEqual([intent for intent, _, _ in examples], ['exchange'])
+
+    def test_no_overlap_falls_back_to_the_bank_order(self):
+        self.assertEqual(select_examples("xyz", 'transaction', limit=1)[0], EXAMPLE_BANK[0])
+
+    def test_format(self):
+        text = format_examples(select_examples("500 en pan y 300 en leche", 'multi', limit=1))
+        self.assertTrue(text.startswith('1. "500 en pan y 300 en leche en efectivo" →\n['))
+        self.assertIn('"description": "Leche"', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
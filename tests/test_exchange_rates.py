@@ -0,0 +1,76 @@
+import unittest
+from processors.query_processor import QueryProcessor
+from services.exchange_rates import ExchangeRateService, RateIndex, parse_currency
+from helpers import DummyTransactionService
+
+
+class TestRateIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = RateIndex([
+            ('2024-01-10 12:00:00', 'USD', 'ARS', 800.0),
+            ('2024-03-05 12:00:00', 'ARS', 'USD', 1 / 1000.0),
+            ('2024-02-01 12:00:00', 'EUR', 'ARS', 900.0),
+        ])
+
+    def test_as_of_lookup(self):
+        self.assertEqual(self.index.rate('USD', 'ARS', '2024-02-29 23:59:59'), 800.0)
+        self.assertAlmostEqual(self.index.rate('USD', 'ARS', '2024-03-31 23:59:59'), 1000.0)
+        self.assertAlmostEqual(self.index.rate('USD', 'ARS'), 1000.0)
+        # Before the first rate, the first one is used
+        self.assertEqual(self.index.rate('USD', 'ARS', '2023-12-31 23:59:59'), 800.0)
+        self.assertAlmostEqual(self.index.rate('ARS', 'USD', '2024-02-01 00:00:00'), 1 / 800.0)
+
+    def test_cross_rate_through_pesos(self):
+        self.assertAlmostEqual(self.index.rate('EUR', 'USD'), 0.9)
+        self.assertIsNone(self.index.rate('BRL', 'USD'))
+        self.assertEqual(self.index.rate('BRL', 'BRL'), 1.0)
+
+    def test_latest(self):
+        self.assertEqual([(currency, round(rate)) for currency, rate, _ in self.index.latest()],
+                         [('EUR', 900), ('USD', 1000)])
+
+    def test_parse_currency(self):
+        self.assertEqual(parse_currency('dólares'), 'USD')
+        self.assertEqual(parse_currency('eur'), 'EUR')
+        self.assertIsNone(parse_currency('plata'))
+
+
+class TestExchangeRateService(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.db = self.service.db
+        self.rates = ExchangeRateService(self.service)
+        self.cash = self.db.get_or_create_money_type('cash')
+        self.bank = self.db.get_or_create_money_type('bank')
+        self.food = self.db.get_or_create_category('comida')
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_net_worth_in_one_currency(self):
+        exchange = self.db.get_or_create_category('exchange')
+        self.db.add_transaction(1, 10, 'income', 200000.0, 'Sueldo', self.food, self.bank)
+        tx_id = self.db.add_transaction(1, 10, 'income', 100.0, 'Exchange', exchange, self.cash, 'USD')
+        self.db.add_exchange_transaction(tx_id, 'ARS', 'USD', 0.0, 100000.0, 100.0)
+        self.db.add_transaction(1, 10, 'expense', -10.0, 'Taxi', self.food, self.cash, 'USD')
+
+        result = self.rates.net_worth(10, 'ARS')
+        self.assertEqual(result['missing'], [])
+        self.assertAlmostEqual(result['total'], 200000.0 - 10 * 1000.0)
+        self.assertEqual([(category, round(amount)) for category, amount in result['categories']],
+                         [('comida', 10000)])
+        self.assertAlmostEqual(self.rates.net_worth(10, 'USD')['total'], 190.0)
+        self.assertIn("💰 Total: $190.00 USD", QueryProcessor.format_net_worth(self.rates.net_worth(10, 'USD')))
+
+    def test_index_is_cached_until_a_rate_changes(self):
+        self.db.add_transaction(1, 10, 'income', 50.0, 'Regalo', self.food, self.cash, 'EUR')
+        self.assertEqual(self.rates.net_worth(10)['missing'], ['EUR'])
+        index = self.rates.index(10)
+        self.assertIs(self.rates.index(10), index)
+        self.rates.set_rate(10, 'EUR', 1100.0)
+        self.assertIsNot(self.rates.index(10), index)
+        self.assertAlmostEqual(self.rates.net_worth(10)['total'], 55000.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from datetime import timedelta
+from types import SimpleNamespace
+from services.inbox import Inbox, PENDING, PROCESSING, FAILED
+from services.processed_updates import ProcessedUpdateStore, PENDING as WRITING
+from services.supervisor import shard_for
+from helpers import DummyTransactionService
+
+
+def make_update(update_id, chat_id=10, text='Gasté 500 en comida'):
+    payload = {'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': text}}
+    return SimpleNamespace(
+        update_id=update_id,
+        message=SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=update_id),
+        to_dict=lambda: payload,
+    )
+
+
+class TestInbox(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.inbox = Inbox(self.service, batch_size=2, max_attempts=2)
+
+    def tearDown(self):
+        self.service.db.close()
+
+    def test_messages_being_processed_are_not_claimed(self):
+        inbox_id = self.inbox.add(make_update(1))
+        self.assertIsNone(self.inbox.add(make_update(1)))
+        self.assertEqual(self.inbox.claim(), [])
+
+        self.inbox.release(inbox_id)
+        (claimed_id, payload, attempts), = self.inbox.claim()
+        self.assertEqual((claimed_id, payload['update_id'], attempts), (inbox_id, 1, 1))
+
+        self.inbox.complete(inbox_id)
+        self.assertEqual(self.inbox.pending(), 0)
+
+    def test_claims_in_arrival_order_by_batch(self):
+        ids = [self.inbox.add(make_update(n), PENDING) for n in (1, 2, 3)]
+        self.assertEqual([item[0] for item in self.inbox.claim()], ids[:2])
+        self.assertEqual([item[0] for item in self.inbox.claim()], ids[2:])
+
+    def test_recover_requeues_interrupted_messages(self):
+        self.inbox.add(make_update(1))
+        self.inbox.add(make_update(2), PENDING)
+        self.assertEqual(self.inbox.recover(), 1)
+        self.assertEqual(self.inbox.pending(), 2)
+
+    def test_recover_leaves_live_siblings_alone(self):
+        sibling = Inbox(self.service, worker_id='worker-1')
+        sibling.add(make_update(1))
+        self.inbox.add(make_update(2))
+        self.assertEqual(self.inbox.recover(), 1)
+        self.assertEqual(self.inbox.recover(own=False), 0)
+        self.assertEqual(self.service.db.count_inbox_messages(PROCESSING), 1)
+
+        # Once the sibling's lease runs out its message is requeued by whoever drains next
+        self.inbox.lease = timedelta(seconds=-1)
+        self.assertEqual(self.inbox.recover(own=False), 1)
+        self.assertEqual(self.inbox.pending(), 2)
+
+    def test_sharded_workers_only_claim_their_chats(self):
+        workers = [Inbox(self.service, batch_size=10, worker_id=f'worker-{index}', shard=(index, 2))
+                   for index in range(2)]
+        chats = range(-5, 5)
+        for update_id, chat_id in enumerate(chats):
+            workers[0].add(make_update(update_id, chat_id), PENDING)
+
+        for index, worker in enumerate(workers):
+            claimed = [payload['message']['chat']['id'] for _, payload, _ in worker.claim()]
+            self.assertEqual(claimed, [chat_id for chat_id in chats if shard_for(chat_id, 2) == index])
+        self.assertEqual(self.inbox.pending(), 0)
+
+    def test_crash_between_apply_and_complete_is_not_applied_again(self):
+        processed = ProcessedUpdateStore(self.service)
+        applied = make_update(1)
+        self.inbox.add(applied)
+        processed.record(applied, 'transaction', {'reply': 'ok'})
+        interrupted = make_update(2)
+        self.inbox.add(interrupted)
+        processed.record(interrupted, WRITING)
+        fresh = make_update(3)
+        self.inbox.add(fresh)
+
+        # The process dies here: nothing was completed
+        self.inbox.recover()
+        outcomes = [self.inbox.settle_processed(inbox_id, make_update(payload['update_id']), processed)
+                    for inbox_id, payload, _ in self.inbox.claim() + self.inbox.claim()]
+        self.assertEqual(outcomes, [('transaction', {'reply': 'ok'}), (WRITING, {}), None])
+        self.assertEqual(self.service.db.count_inbox_messages(PROCESSING), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        inbox_id = self.inbox.add(make_update(1))
+        self.inbox.release(inbox_id, attempts=2)
+        self.assertEqual(self.service.db.count_inbox_messages(FAILED), 1)
+        self.assertEqual(self.service.db.count_inbox_messages(PROCESSING), 0)
+        self.assertEqual(self.inbox.claim(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from services.intent_router import (
+    INTENT_QUERY, INTENT_TRANSACTION, INTENT_MULTI, INTENT_EXCHANGE,
+    classify_intent, intent_of_response,
+)
+
+
+class TestClassifyIntent(unittest.TestCase):
+    def intent(self, message):
+        decision = classify_intent(message)
+        return decision['intent'] if decision else None
+
+    def test_queries(self):
+        self.assertEqual(classify_intent("Resumen"), {
+            'intent': INTENT_QUERY,
+            'query': {'type': 'query', 'query_type': 'summary', 'money_type': 'all'},
+        })
+        self.assertEqual(classify_intent("Cuánto tengo en efectivo?")['query']['money_type'], 'cash')
+        self.assertEqual(classify_intent("Banco?")['query'], {'type': 'query', 'query_type': 'balance', 'money_type': 'bank'})
+        self.assertEqual(classify_intent("¿Cuál es mi patrimonio en dólares?")['query'],
+                         {'type': 'query', 'query_type': 'net_worth', 'currency': 'USD'})
+        self.assertEqual(classify_intent("¿Es normal lo que gasto?")['query'],
+                         {'type': 'query', 'query_type': 'trend', 'currency': 'ARS'})
+        self.assertEqual(classify_intent("¿Cuánto gasto normalmente en dólares?")['query']['query_type'], 'typical')
+        self.assertEqual(classify_intent("¿Gasté más de lo normal este mes?")['query'],
+                         {'type': 'query', 'query_type': 'trend', 'currency': 'ARS'})
+        self.assertEqual(classify_intent("Gasté más de lo habitual")['query']['query_type'], 'trend')
+
+    def test_transactions(self):
+        self.assertEqual(self.intent("Gasté $500 en comida"), INTENT_TRANSACTION)
+        self.assertEqual(self.intent("Gasté 1500 en 2 cafés"), INTENT_TRANSACTION)
+        self.assertEqual(self.intent("Compré comida por 20 USD"), INTENT_TRANSACTION)
+        self.assertEqual(self.intent("Gasté 500 en pan y 300 en leche"), INTENT_MULTI)
+        self.assertEqual(self.intent("nafta 20000, peaje 3000"), INTENT_MULTI)
+        self.assertEqual(self.intent("gaste 1500,50 en pan"), INTENT_TRANSACTION)
+        self.assertEqual(self.intent("pague 2,5 usd de cafe"), INTENT_TRANSACTION)
+
+    def test_exchanges(self):
+        self.assertEqual(self.intent("Cambié 100 USD a 90000 pesos"), INTENT_EXCHANGE)
+        self.assertEqual(self.intent("Compré 200 dólares a 1100"), INTENT_EXCHANGE)
+        self.assertEqual(self.intent("Compré 200 dólares"), INTENT_EXCHANGE)
+        self.assertEqual(self.intent("Vendí USD 300"), INTENT_EXCHANGE)
+        self.assertEqual(self.intent("Compré 500 pesos de pan"), INTENT_TRANSACTION)
+
+    def test_ambiguous_messages_are_left_to_a_model(self):
+        self.assertIsNone(classify_intent("lo del super de ayer"))
+
+    def test_intent_of_response(self):
+        self.assertEqual(intent_of_response([{'type': 'expense'}]), INTENT_TRANSACTION)
+        self.assertEqual(intent_of_response([{'type': 'expense'}, {'type': 'income'}]), INTENT_MULTI)
+        self.assertEqual(intent_of_response({'type': 'exchange'}), INTENT_EXCHANGE)
+        self.assertIsNone(intent_of_response("texto"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from database import DatabaseHandler
+from services.ledger import LedgerService, apply_event, empty_state
+from helpers import DummyTransactionService
+
+# The schema and data of a database created before the journal existed
+BASELINE_SCHEMA = '''
+    CREATE TABLE categories (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE money_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, group_id INTEGER NOT NULL,
+        type TEXT NOT NULL, amount REAL NOT NULL, description TEXT, category_id INTEGER,
+        money_type_id INTEGER, currency TEXT NOT NULL DEFAULT 'ARS',
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE exchange_transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, transaction_id INTEGER NOT NULL,
+        source_currency TEXT NOT NULL, target_currency TEXT NOT NULL, exchange_rate REAL NOT NULL,
+        source_amount REAL NOT NULL, target_amount REAL NOT NULL
+    );
+    INSERT INTO categories (name) VALUES ('comida'), ('exchange');
+    INSERT INTO money_types (name) VALUES ('cash');
+    INSERT INTO transactions (user_id, group_id, type, amount, description, category_id, money_type_id,
+                              currency, timestamp)
+    VALUES (1, 10, 'income', 90000, 'Exchange', 2, 1, 'ARS', '2024-03-05 10:00:00'),
+           (1, 10, 'expense', -300, 'Pan', 1, 1, 'ARS', '2024-03-10 10:00:00'),
+           (1, 10, 'expense', -200, 'Leche', 1, 1, 'ARS', '2024-04-02 10:00:00');
+    INSERT INTO exchange_transactions (transaction_id, source_currency, target_currency, exchange_rate,
+                                       source_amount, target_amount)
+    VALUES (1, 'USD', 'ARS', 900, 100, 90000);
+'''
+
+
+
+class TestApplyEvent(unittest.TestCase):
+    def test_insert_delete_and_exchange(self):
+        state = empty_state()
+        expense = {'type': 'expense', 'amount': -300.0, 'currency': 'ARS', 'money_type': 'cash', 'category_id': 1}
+        apply_event(state, 'insert', expense)
+        apply_event(state, 'exchange', {'source_currency': 'USD', 'source_amount': 10.0, 'money_type': 'bank'})
+        self.assertEqual(state['balances'], {'ARS': {'cash': -300.0}, 'USD': {'bank': -10.0}})
+        self.assertEqual(state['categories'], {'ARS': {'1': -300.0}})
+        apply_event(state, 'rename', {'old': 'comida', 'new': 'alimentos', 'old_id': 1, 'new_id': 2})
+        self.assertEqual(state['categories'], {'ARS': {'2': -300.0}})
+        expense = {**expense, 'category_id': 2}
+
+        apply_event(state, 'delete', expense)
+        self.assertEqual(state['balances'], {'USD': {'bank': -10.0}})
+        apply_event(state, 'clear', {})
+        self.assertEqual(state, empty_state())
+
+
+class TestLedgerService(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.db = self.service.db
+        self.ledger = LedgerService(self.service, snapshot_every=3)
+        self.food = self.db.get_or_create_category('comida')
+        self.cash = self.db.get_or_create_money_type('cash')
+
+    def tearDown(self):
+        self.db.close()
+
+    def add(self, amount, group_id=10):
+        tx_id = self.db.add_transaction(1, group_id, 'income' if amount > 0 else 'expense', amount,
+                                        'tx', self.food, self.cash)
+        self.ledger.note_write(group_id)
+        return tx_id
+
+    def test_balance_matches_transactions_table(self):
+        tx_id = self.add(1000.0)
+        self.db.add_exchange_transaction(tx_id, 'USD', 'ARS', 1000.0, 1.0, 1000.0)
+        self.add(-250.0)
+        self.add(-50.0)
+        self.db.delete_transaction(tx_id, 10)
+        self.add(-10.0, group_id=11)
+        self.assertEqual(self.ledger.balance_as_of(10), self.db.get_balances(10))
+
+    def test_snapshots_are_written_and_used(self):
+        for _ in range(4):
+            self.add(100.0)
+        snapshot = self.db.get_latest_snapshot(10)
+        self.assertEqual(snapshot[0], 3)
+        self.assertEqual(snapshot[1]['balances'], {'ARS': {'cash': 300.0}})
+        # Only the tail after the snapshot is replayed
+        self.assertEqual(len(self.db.get_ledger_events(10, after_id=snapshot[0])), 1)
+        self.assertEqual(self.ledger.balance_as_of(10), {'ARS': {'cash': 400.0}})
+
+    def test_balance_as_of_past_date(self):
+        self.add(100.0)
+        self.db.cursor.execute("UPDATE ledger_events SET created_at = '2024-01-15 12:00:00'")
+        self.db.conn.commit()
+        self.add(50.0)
+        self.assertEqual(self.ledger.balance_as_of(10, datetime(2024, 1, 31)), {'ARS': {'cash': 100.0}})
+        self.assertEqual(self.ledger.balance_as_of(10, datetime(2023, 12, 31)), {})
+        self.assertEqual(self.ledger.balance_as_of(10), {'ARS': {'cash': 150.0}})
+
+    def test_undo_chain(self):
+        first = self.add(100.0)
+        second = self.add(-30.0)
+        self.db.rename_category('comida', 'alimentos', group_id=10)
+        self.db.delete_transaction(first, 10)
+
+        self.assertEqual(self.ledger.undo_last(10), (True, f"Se restauró la transacción {first}"))
+        success, _ = self.ledger.undo_last(10)
+        self.assertTrue(success)
+        self.assertIn('comida', self.db.get_all_categories())
+        self.assertEqual(self.ledger.undo_last(10), (True, f"Se eliminó la transacción {second}"))
+        self.assertEqual(self.db.get_balances(10), {'ARS': {'cash': 100.0}})
+        self.assertEqual(self.ledger.balance_as_of(10), {'ARS': {'cash': 100.0}})
+
+    def test_undo_stops_at_clear(self):
+        self.add(100.0)
+        self.db.clear_transactions(10)
+        success, _ = self.ledger.undo_last(10)
+        self.assertFalse(success)
+        self.assertEqual(self.ledger.undo_last(11), (False, "No hay cambios para deshacer"))
+
+
+class TestLedgerMigration(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'expenses.db')
+        conn = sqlite3.connect(self.path)
+        conn.executescript(BASELINE_SCHEMA)
+        conn.close()
+
+    def test_existing_transactions_are_journaled(self):
+        db = DatabaseHandler(db_name=self.path)
+        ledger = DummyTransactionService(db).ledger
+        self.assertEqual(ledger.balance_as_of(10), db.get_balances(10))
+        self.assertEqual(ledger.balance_as_of(10, datetime(2024, 3, 31)),
+                         {'ARS': {'cash': 89700.0}, 'USD': {'cash': -100.0}})
+        self.assertEqual(ledger.undo_last(10), (True, "Se eliminó la transacción 3"))
+        db.close()
+
+        # The journal is seeded once, when it is created
+        db = DatabaseHandler(db_name=self.path)
+        self.assertEqual([event[2] for event in db.get_ledger_events(10)], [1, 2, 3, 3])
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import time
+import unittest
+from types import SimpleNamespace
+from ollama import ResponseError
+from services.llm_client import LLMClient, LLMUnavailableError, TOKEN_BUDGETS
+from services.ollama_pool import OllamaPool
+from utils.metrics import metrics
+from helpers import DummyTransactionService
+
+
+class RecordingClient:
+    """Stands in for ollama.Client, returning canned JSON per model."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def generate(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'response': json.dumps(self.responses[kwargs['model']])}
+
+    def broadcast(self, **kwargs):
+        return {'http://ollama': self.generate(**kwargs)}
+
+
+class TestLLMClientRouting(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.service.categories.resolve(10, 'comida')
+        self.llm = LLMClient(self.service)
+        self.llm.model = 'large'
+        self.llm.router_model = 'small'
+
+    def tearDown(self):
+        self.service.db.close()
+
+    def test_queries_skip_every_model(self):
+        self.llm.client = RecordingClient({})
+        self.assertEqual(self.llm.get_structured_response("Resumen", 10)['query_type'], 'summary')
+        self.assertEqual(self.llm.client.calls, [])
+
+    def test_transaction_uses_intent_prompt_and_budget(self):
+        expense = {'type': 'expense', 'amount': 500.0, 'category': 'comida'}
+        self.llm.client = RecordingClient({'large': expense})
+        self.assertEqual(self.llm.get_structured_response("Gasté 500 en comida", 10), [expense])
+
+        call, = self.llm.client.calls
+        self.assertEqual(call['model'], 'large')
+        self.assertEqual(call['options']['num_predict'], TOKEN_BUDGETS['transaction'])
+        self.assertIn('"comida"', call['prompt'])
+        self.assertNotIn('Para CAMBIO DE DIVISAS', call['prompt'])
+
+    def test_ambiguous_message_goes_through_small_model(self):
+        self.llm.client = RecordingClient({'small': {'intent': 'query', 'query_type': 'balance'}})
+        result = self.llm.get_structured_response("lo que queda en el banco", 10)
+        self.assertEqual(result, {'type': 'query', 'query_type': 'balance', 'money_type': 'bank'})
+        self.assertEqual([call['model'] for call in self.llm.client.calls], ['small'])
+
+    def test_known_intent_skips_the_router(self):
+        items = [{'type': 'expense', 'amount': 500.0}, {'type': 'expense', 'amount': 800.0}]
+        self.llm.client = RecordingClient({'large': items})
+        self.assertEqual(self.llm.get_structured_response("pan 500; leche", 10, intent='multi'), items)
+        call, = self.llm.client.calls
+        self.assertEqual(call['options']['num_predict'], TOKEN_BUDGETS['multi'])
+
+    def test_unclassified_message_gets_full_prompt(self):
+        self.llm.router_model = ''
+        self.llm.client = RecordingClient({'large': {'type': 'exchange'}})
+        self.llm.get_structured_response("lo del super de ayer", 10)
+        call, = self.llm.client.calls
+        self.assertIn('Para CAMBIO DE DIVISAS', call['prompt'])
+        self.assertIn('Para CONSULTAS', call['prompt'])
+
+    def test_message_comes_after_the_static_prefix(self):
+        prompt = self.llm.build_prompt("Gasté 500 en comida", 10, 'transaction')
+        self.assertTrue(prompt.endswith("Mensaje: 'Gasté 500 en comida'\n"))
+        self.assertLess(prompt.index('REGLAS:'), prompt.index('Categorías existentes'))
+
+    def test_prompt_carries_only_similar_examples(self):
+        prompt = self.llm.build_prompt("Cargué nafta 20000", 10, 'transaction')
+        self.assertIn('"Cargué nafta 30000 con la tarjeta"', prompt)
+        self.assertNotIn('Cambié 100 USD', prompt)
+        self.assertEqual(prompt.count(' →\n'), 2)
+        self.assertLess(len(prompt), len(self.llm.build_prompt("Cargué nafta 20000", 10)))
+
+    def test_prompt_tokens_are_recorded(self):
+        self.llm.client = RecordingClient({})
+        self.llm.client.generate = lambda **kwargs: {
+            'response': '{}', 'prompt_eval_count': 300, 'prompt_eval_duration': 2e9}
+        before = metrics.counters().get('bot_llm_prompt_tokens_total', {}).get('intent=exchange,tier=extract', 0)
+        self.llm.get_response("hola", intent='exchange')
+        after = metrics.counters()['bot_llm_prompt_tokens_total']['intent=exchange,tier=extract']
+        self.assertEqual(after, before + 300)
+
+    def test_warm_up_primes_each_model_prefix(self):
+        self.llm.client = RecordingClient({'large': {}, 'small': {}})
+        self.llm.warm_up()
+        large, small = self.llm.client.calls
+        self.assertEqual((large['model'], small['model']), ('large', 'small'))
+        self.assertEqual(large['options'], {'num_predict': 1})
+        self.assertTrue(self.llm.build_prompt("x", 10, 'transaction').startswith(large['prompt']))
+        self.assertNotIn('{{', large['prompt'])
+        self.assertEqual(large['keep_alive'], self.llm.keep_alive)
+
+    def test_cold_start_is_recorded(self):
+        self.llm.client = RecordingClient({})
+        self.llm.client.generate = lambda **kwargs: {'response': '{}', 'load_duration': 5e9, 'total_duration': 6e9}
+        before = metrics.counters().get('bot_llm_starts_total', {}).get('model=large,start=cold', 0)
+        self.llm.get_response("hola")
+        self.assertEqual(metrics.counters()['bot_llm_starts_total']['model=large,start=cold'], before + 1)
+
+    def test_disagreement_is_counted(self):
+        before = metrics.counters().get('bot_llm_router_disagreements_total', {}).get(
+            'extracted=exchange,routed=transaction', 0)
+        self.llm.client = RecordingClient({'large': {'type': 'exchange'}})
+        self.llm.get_structured_response("Gasté 500 en comida", 10)
+        after = metrics.counters()['bot_llm_router_disagreements_total']['extracted=exchange,routed=transaction']
+        self.assertEqual(after, before + 1)
+
+
+class UnreachableHost:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, **kwargs):
+        self.calls += 1
+        raise ConnectionError('refused')
+
+
+class TestLLMClientAvailability(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.service.categories.resolve(10, 'comida')
+        self.llm = LLMClient(self.service)
+        self.llm.model = 'large'
+        self.llm.router_model = ''
+
+    def tearDown(self):
+        self.llm.client.close()
+        self.service.db.close()
+
+    def test_unreachable_hosts_raise_and_get_ejected(self):
+        host = UnreachableHost()
+        self.llm.client = OllamaPool(['http://a'], failure_threshold=2, health_interval=0,
+                                     client_factory=lambda url, timeout: host)
+        for _ in range(2):
+            with self.assertRaises(LLMUnavailableError):
+                self.llm.get_structured_response("Gasté 500 en comida", 10)
+
+        # Once ejected, nothing reaches the host
+        with self.assertRaises(LLMUnavailableError):
+            self.llm.get_structured_response("Gasté 500 en comida", 10)
+        self.assertEqual(host.calls, 2)
+
+    def test_overload_is_unavailable_but_bad_requests_are_not(self):
+        for status, unavailable in ((503, True), (404, False)):
+            async def generate(**kwargs):
+                raise ResponseError('error', status)
+            self.llm.client = OllamaPool(['http://a'], health_interval=0,
+                                         client_factory=lambda url, timeout: SimpleNamespace(generate=generate))
+            if unavailable:
+                with self.assertRaises(LLMUnavailableError):
+                    self.llm.get_response("hola")
+            else:
+                self.assertIsNone(self.llm.get_response("hola"))
+            self.llm.client.close()
+
+class SlowClient(RecordingClient):
+    def generate(self, **kwargs):
+        time.sleep(0.3)
+        return super().generate(**kwargs)
+
+
+class TestLLMClientAsync(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.service.categories.resolve(10, 'comida')
+        self.llm = LLMClient(self.service)
+        self.llm.model = 'large'
+
+    def tearDown(self):
+        self.service.db.close()
+
+    def test_slow_model_does_not_block_other_handlers(self):
+        expense = {'type': 'expense', 'amount': 500.0, 'category': 'comida'}
+        self.llm.client = SlowClient({'large': expense})
+
+        async def other_handler():
+            # Answers while the model is still thinking
+            await asyncio.sleep(0.05)
+            return time.monotonic()
+
+        async def run():
+            return await asyncio.gather(
+                self.llm.aget_structured_response("Gasté 500 en comida", 10), other_handler()
+            )
+
+        started = time.monotonic()
+        result, answered_at = asyncio.run(run())
+        self.assertEqual(result, [expense])
+        self.assertLess(answered_at - started, 0.2)
+        # The group's categories were read on the loop thread, where the SQLite connection lives
+        self.assertIn('"comida"', self.llm.client.calls[0]['prompt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
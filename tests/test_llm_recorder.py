@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import unittest
+from benchmarks.bench_llm import corpus_from_recording, load_corpus, run, score
+from benchmarks.fake_ollama import FakeOllamaServer
+from services.llm_client import LLMClient, PROMPT_VERSION
+from services.llm_recorder import LLMRecorder, anonymize, load_records
+from helpers import DummyTransactionService
+
+
+class StubClient:
+    def __init__(self, answer):
+        self.answer = answer
+
+    def generate(self, **kwargs):
+        return {'response': json.dumps(self.answer), 'prompt_eval_count': 120, 'eval_count': 30,
+                'eval_duration': 6e8}
+
+
+class TestLLMRecorder(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.llm = LLMClient(self.service)
+        self.llm.model = 'large'
+        self.llm.router_model = ''
+        self.path = os.path.join(tempfile.mkdtemp(), 'llm.jsonl')
+        self.llm.recorder = LLMRecorder(self.path)
+
+    def tearDown(self):
+        self.service.db.close()
+
+    def test_anonymize(self):
+        self.assertEqual(anonymize("le pasé 15000 a juan@mail.com, cbu 0170099220000067797370 @pepe"),
+                         "le pasé 15000 a <email>, cbu <number> <user>")
+        self.assertEqual(anonymize("tarjeta 4509 1234 5678 9012 por 25000000"), "tarjeta <number> por 25000000")
+
+    def test_extraction_calls_are_recorded(self):
+        answer = {'type': 'expense', 'amount': 500.0, 'category': 'comida', 'description': 'a juan@mail.com'}
+        self.llm.client = StubClient(answer)
+        self.llm.get_structured_response("Gasté 500 en comida con juan@mail.com", 10)
+        record, = load_records(self.path)
+        self.assertEqual(record['message'], "Gasté 500 en comida con <email>")
+        self.assertEqual((record['prompt_version'], record['model'], record['intent']),
+                         (PROMPT_VERSION, 'large', 'transaction'))
+        self.assertEqual(record['parsed']['description'], 'a <email>')
+        self.assertIn('<email>', record['raw'])
+        self.assertEqual((record['prompt_tokens'], record['completion_tokens'], record['completion_seconds']),
+                         (120, 30, 0.6))
+        self.assertNotIn('group_id', record)
+
+    def test_calls_without_a_message_are_not_recorded(self):
+        self.llm.client = StubClient({})
+        self.llm.get_response("hola")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_sampling(self):
+        recorder = LLMRecorder(sample_rate=0.0)
+        recorder.record("x", PROMPT_VERSION, 'large', '{}', {}, 0.1)
+        self.assertEqual(recorder.records, [])
+
+
+class TestBenchLLM(unittest.TestCase):
+    def test_score_fields(self):
+        expected = [{'type': 'expense', 'amount': 500.0, 'category': 'educación', 'money_type': 'cash',
+                     'currency': 'ARS'},
+                    {'type': 'expense', 'amount': 300.0, 'category': 'comida', 'money_type': 'cash',
+                     'currency': 'ARS'}]
+        answer = {'type': 'expense', 'amount': '500', 'category': 'Educacion', 'money_type': 'bank'}
+        self.assertEqual(score(expected, answer), {
+            'type': [1, 2], 'amount': [1, 2], 'category': [1, 2], 'money_type': [0, 2], 'currency': [1, 2],
+        })
+        self.assertEqual(score([{'type': 'query'}], {'type': 'query', 'query_type': 'balance'}), {'type': [1, 1]})
+
+    def test_replay_against_fake_server(self):
+        corpus = load_corpus()
+        server = FakeOllamaServer(corpus, port=11499, latency=0, tokens_per_second=1e5)
+        server.start_in_thread()
+        try:
+            summary = run('fake', corpus, [server.url])
+        finally:
+            server.stop_thread()
+        self.assertEqual(summary['accuracy'], {field: 1.0 for field in summary['accuracy']})
+        self.assertEqual(summary['exact'], 1.0)
+        # Queries are answered by the keyword router without a model
+        self.assertEqual(summary['model_calls'], len(corpus) - 2)
+        self.assertGreater(summary['tokens_per_second'], 0)
+
+    def test_corpus_from_recording(self):
+        path = os.path.join(tempfile.mkdtemp(), 'llm.jsonl')
+        recorder = LLMRecorder(path)
+        parsed = [{'type': 'expense', 'amount': 700.0, 'category': 'transporte', 'money_type': 'cash'}]
+        recorder.record("Colectivo 700", PROMPT_VERSION, 'large', json.dumps(parsed), parsed, 0.4)
+        recorder.record("Colectivo 700", PROMPT_VERSION, 'other', '{}', {}, 0.4)
+        self.assertEqual(corpus_from_recording(path), [{'message': "Colectivo 700", 'expected': [
+            {'type': 'expense', 'amount': 700.0, 'money_type': 'cash', 'currency': 'ARS', 'category': 'transporte'},
+        ]}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import json
+import logging
+import unittest
+from utils.logger import JsonFormatter, DebugSamplingFilter
+
+class TestJsonFormatter(unittest.TestCase):
+    def test_includes_extra_fields(self):
+        record = logging.makeLogRecord({
+            'name': 'bot', 'levelno': logging.INFO, 'levelname': 'INFO',
+            'msg': 'Received message from %s', 'args': ('user',), 'group_id': 456,
+        })
+        payload = json.loads(JsonFormatter().format(record))
+        self.assertEqual(payload['message'], 'Received message from user')
+        self.assertEqual(payload['level'], 'INFO')
+        self.assertEqual(payload['group_id'], 456)
+        self.assertNotIn('args', payload)
+
+class TestDebugSamplingFilter(unittest.TestCase):
+    def test_info_always_passes(self):
+        sampler = DebugSamplingFilter(1000)
+        record = logging.makeLogRecord({'levelno': logging.INFO})
+        self.assertTrue(all(sampler.filter(record) for _ in range(100)))
+
+    def test_debug_is_sampled(self):
+        sampler = DebugSamplingFilter(10)
+        record = logging.makeLogRecord({'levelno': logging.DEBUG})
+        kept = sum(sampler.filter(record) for _ in range(10000))
+        self.assertGreater(kept, 500)
+        self.assertLess(kept, 1500)
+
+if __name__ == '__main__':
+    unittest.main()
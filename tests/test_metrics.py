@@ -0,0 +1,57 @@
+import unittest
+import urllib.request
+from utils.metrics import MetricsRegistry, start_metrics_server
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+
+    def test_render_histogram_prometheus_format(self):
+        self.metrics.observe('bot_llm_request_seconds', 0.2)
+        self.metrics.observe('bot_llm_request_seconds', 3.0)
+        text = self.metrics.render()
+        self.assertIn('# TYPE bot_llm_request_seconds histogram', text)
+        self.assertIn('bot_llm_request_seconds_bucket{le="0.25"} 1', text)
+        self.assertIn('bot_llm_request_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('bot_llm_request_seconds_count 2', text)
+
+    def test_counter_labels(self):
+        self.metrics.inc('bot_updates_total', outcome='query')
+        self.metrics.inc('bot_updates_total', outcome='query')
+        self.assertIn('bot_updates_total{outcome="query"} 2', self.metrics.render())
+
+    def test_timer_counts_errors(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.timer('bot_db_query_seconds', method='add_transaction'):
+                raise ValueError("boom")
+        counters = self.metrics.counters()['bot_errors_total']
+        self.assertEqual(counters['method=add_transaction,metric=bot_db_query_seconds'], 1)
+        self.assertEqual(self.metrics.summary()['bot_db_query_seconds']['method=add_transaction']['count'], 1)
+
+    def test_timed_decorator_sync(self):
+        @self.metrics.timed('bot_chart_render_seconds')
+        def render():
+            return 42
+
+        self.assertEqual(render(), 42)
+        self.assertEqual(self.metrics.summary()['bot_chart_render_seconds']['-']['count'], 1)
+
+    def test_quantile_estimate(self):
+        for _ in range(100):
+            self.metrics.observe('latency', 0.03)
+        stats = self.metrics.summary()['latency']['-']
+        self.assertGreater(stats['p95'], 0.025)
+        self.assertLessEqual(stats['p95'], 0.05)
+
+    def test_metrics_server(self):
+        server = start_metrics_server(0)
+        try:
+            port = server.server_address[1]
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn('text/plain', response.headers['Content-Type'])
+        finally:
+            server.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from services.model_warmer import ModelWarmer, parse_active_hours
+
+
+class RecordingLLM:
+    def __init__(self):
+        self.calls = []
+
+    def warm_up(self):
+        self.calls.append('warm_up')
+
+    def keep_warm(self):
+        self.calls.append('keep_warm')
+
+
+class RecordingJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def run_repeating(self, callback, interval, name=None):
+        self.jobs.append((callback, interval, name))
+
+
+class TestModelWarmer(unittest.IsolatedAsyncioTestCase):
+    def test_parse_active_hours(self):
+        self.assertEqual(parse_active_hours('8-24'), (8, 24))
+        self.assertIsNone(parse_active_hours(''))
+        with self.assertRaises(ValueError):
+            parse_active_hours('8-30')
+
+    def test_is_active(self):
+        day = ModelWarmer(RecordingLLM(), '8-24')
+        self.assertTrue(day.is_active(datetime(2024, 1, 1, 8)))
+        self.assertFalse(day.is_active(datetime(2024, 1, 1, 3)))
+        night = ModelWarmer(RecordingLLM(), '22-6')
+        self.assertTrue(night.is_active(datetime(2024, 1, 1, 23)))
+        self.assertTrue(night.is_active(datetime(2024, 1, 1, 5)))
+        self.assertFalse(night.is_active(datetime(2024, 1, 1, 12)))
+        self.assertFalse(ModelWarmer(RecordingLLM(), '').is_active(datetime(2024, 1, 1, 12)))
+
+    async def test_post_init_warms_up_and_schedules_keep_alive(self):
+        llm = RecordingLLM()
+        warmer = ModelWarmer(llm, '0-24', interval=60)
+        job_queue = RecordingJobQueue()
+        await warmer.post_init(SimpleNamespace(job_queue=job_queue))
+        self.assertEqual(llm.calls, ['warm_up'])
+        self.assertEqual(job_queue.jobs, [(warmer.keep_alive, 60, 'model-keep-alive')])
+
+        await warmer.keep_alive(None)
+        self.assertEqual(llm.calls, ['warm_up', 'keep_warm'])
+
+    async def test_keep_alive_is_skipped_without_job_queue_or_hours(self):
+        llm = RecordingLLM()
+        await ModelWarmer(llm, '0-24').post_init(SimpleNamespace(job_queue=None))
+        await ModelWarmer(llm, '').post_init(SimpleNamespace(job_queue=RecordingJobQueue()))
+        self.assertEqual(llm.calls, ['warm_up', 'warm_up'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import unittest
+from ollama import ResponseError
+from services.ollama_pool import OllamaPool, NoHealthyHostError, parse_hosts
+
+
+class FakeHost:
+    """Stands in for ollama.AsyncClient: answers after `delay` seconds or raises `error`."""
+
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+        self.healthy = True
+
+    async def generate(self, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return {'response': '{}', 'host': self.name}
+
+    async def list(self):
+        if not self.healthy:
+            raise ConnectionError('down')
+        return {'models': []}
+
+
+def make_pool(hosts, **kwargs):
+    kwargs.setdefault('health_interval', 0)
+    return OllamaPool(list(hosts), client_factory=lambda url, timeout: hosts[url], **kwargs)
+
+
+class TestOllamaPool(unittest.IsolatedAsyncioTestCase):
+    def test_parse_hosts(self):
+        self.assertEqual(parse_hosts(' http://a:11434, ,http://b:11434'), ['http://a:11434', 'http://b:11434'])
+        self.assertEqual(parse_hosts(''), [])
+
+    async def test_least_outstanding_host_gets_the_request(self):
+        hosts = {'a': FakeHost('a', delay=0.05), 'b': FakeHost('b', delay=0.05)}
+        pool = make_pool(hosts)
+        results = await asyncio.gather(*(pool.agenerate(model='m') for _ in range(4)))
+        self.assertEqual(sorted(r['host'] for r in results), ['a', 'a', 'b', 'b'])
+
+    async def test_fails_over_and_ejects_a_broken_host(self):
+        hosts = {'a': FakeHost('a', error=ConnectionError('refused')), 'b': FakeHost('b')}
+        pool = make_pool(hosts, failure_threshold=1)
+        self.assertEqual((await pool.agenerate(model='m'))['host'], 'b')
+        self.assertEqual((await pool.agenerate(model='m'))['host'], 'b')
+        self.assertEqual(hosts['a'].calls, 1)
+
+    async def test_bad_requests_are_not_retried(self):
+        hosts = {'a': FakeHost('a', error=ResponseError('model not found', 404)), 'b': FakeHost('b')}
+        pool = make_pool(hosts)
+        with self.assertRaises(ResponseError):
+            await pool.agenerate(model='m')
+        self.assertEqual(hosts['b'].calls, 0)
+
+    async def test_no_healthy_host(self):
+        hosts = {'a': FakeHost('a', error=ResponseError('busy', 503))}
+        pool = make_pool(hosts, failure_threshold=1)
+        with self.assertRaises(ResponseError):
+            await pool.agenerate(model='m')
+        with self.assertRaises(NoHealthyHostError):
+            await pool.agenerate(model='m')
+
+    async def test_slow_request_is_hedged_and_the_loser_cancelled(self):
+        hosts = {'a': FakeHost('a', delay=0.01), 'b': FakeHost('b', delay=0.01)}
+        pool = make_pool(hosts, hedge=True, hedge_min_samples=4)
+        for _ in range(4):
+            await pool.agenerate(model='m', options={'num_predict': 10})
+        self.assertIsNotNone(pool.hedge_delay(('m', 10)))
+
+        hosts['a'].delay = 5
+        pool.hosts[1].last_picked = float('inf')  # make 'a' the primary
+        result = await pool.agenerate(model='m', options={'num_predict': 10})
+        self.assertEqual(result['host'], 'b')
+        await asyncio.sleep(0)
+        self.assertEqual(hosts['a'].cancelled, 1)
+        self.assertEqual([host.outstanding for host in pool.hosts], [0, 0])
+
+    async def test_health_check_readmits_hosts(self):
+        hosts = {'a': FakeHost('a', error=ConnectionError('refused'))}
+        pool = make_pool(hosts, failure_threshold=1, reset_timeout=3600)
+        with self.assertRaises(ConnectionError):
+            await pool.agenerate(model='m')
+        self.assertFalse(pool.hosts[0].breaker.allow())
+
+        hosts['a'].error = None
+        await pool.check_health()
+        self.assertEqual((await pool.agenerate(model='m'))['host'], 'a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+from services.outbound_sender import OutboundSender, merge_confirmations
+
+
+class FakeLimiter:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def chat_delay(self, chat_id):
+        return self.delay
+
+
+class FakeBot:
+    def __init__(self, delay=0.0):
+        self.rate_limiter = FakeLimiter(delay)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+class TestOutboundSender(unittest.IsolatedAsyncioTestCase):
+    def test_merge(self):
+        self.assertEqual(merge_confirmations(['✅ a']), '✅ a')
+        self.assertEqual(merge_confirmations(['✅ a', '✅ a']), '✅ a (x2)')
+        self.assertEqual(merge_confirmations(['✅ a', '✅ b']), '✅ a\n✅ b')
+
+    async def test_confirmations_waiting_for_the_chat_are_merged(self):
+        bot = FakeBot(delay=0.05)
+        sender = OutboundSender()
+        sender.confirm(bot, 1, '✅ a')
+        sender.confirm(bot, 1, '✅ a')
+        sender.confirm(bot, 2, '✅ b')
+        await sender.shutdown()
+        self.assertEqual(sorted(bot.sent), [(1, '✅ a (x2)'), (2, '✅ b')])
+
+        sender.confirm(bot, 1, '✅ c')
+        await sender.shutdown()
+        self.assertEqual(bot.sent[-1], (1, '✅ c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
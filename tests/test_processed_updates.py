@@ -0,0 +1,41 @@
+import unittest
+from types import SimpleNamespace
+from services.processed_updates import ProcessedUpdateStore, PENDING
+from helpers import DummyTransactionService
+
+
+def make_update(update_id, chat_id=10, message_id=1):
+    return SimpleNamespace(
+        update_id=update_id,
+        message=SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id)
+    )
+
+
+class TestProcessedUpdateStore(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.store = ProcessedUpdateStore(self.service, ttl_hours=1, prune_every=2)
+
+    def tearDown(self):
+        self.service.db.close()
+
+    def test_record_and_get(self):
+        update = make_update(1)
+        self.assertIsNone(self.store.get(10, 1))
+        self.store.record(update, PENDING)
+        self.assertEqual(self.store.get(10, 1), (PENDING, {}))
+        self.store.record(update, 'transaction', {'reply': '✅ Transacción registrada correctamente.'})
+        self.assertEqual(self.store.get(10, 1), ('transaction', {'reply': '✅ Transacción registrada correctamente.'}))
+
+    def test_old_updates_are_pruned(self):
+        self.store.record(make_update(1), 'query', {'query': {'type': 'query'}})
+        self.service.db.cursor.execute("UPDATE processed_updates SET processed_at = '2000-01-01 00:00:00'")
+        self.service.db.conn.commit()
+        # The second record triggers a prune of everything older than the TTL
+        self.store.record(make_update(2), 'transaction', {'reply': 'ok'})
+        self.assertIsNone(self.store.get(10, 1))
+        self.assertIsNotNone(self.store.get(10, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import glob
+import json
+import os
+import tempfile
+import unittest
+from utils.metrics import metrics
+from utils.profiler import UpdateProfiler
+
+class TestUpdateProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.profiler = UpdateProfiler(output_dir=self.tmpdir.name)
+
+    def tearDown(self):
+        self.profiler.disable()
+        self.tmpdir.cleanup()
+
+    def _run_updates(self, count, work=lambda: None):
+        async def run():
+            for update_id in range(1, count + 1):
+                async with self.profiler.profile(update_id):
+                    with metrics.timer('bot_llm_request_seconds'):
+                        work()
+        asyncio.run(run())
+
+    def test_disabled_by_default(self):
+        self.assertFalse(self.profiler.enabled)
+        self.assertEqual(self.profiler.status(), "desactivado")
+
+    def test_every_nth_update_is_dumped_with_stage_timings(self):
+        self.profiler.configure(True, every_n=2)
+        self._run_updates(4)
+        dumps = sorted(glob.glob(os.path.join(self.tmpdir.name, 'profile_*.json')))
+        self.assertEqual(len(dumps), 2)
+        with open(dumps[0]) as f:
+            data = json.load(f)
+        self.assertEqual(data['reason'], 'sampled')
+        self.assertIn(data['update_id'], (2, 4))
+        self.assertEqual(data['stages'][0]['stage'], 'bot_llm_request_seconds')
+        self.assertTrue(os.path.exists(dumps[0].replace('.json', '.prof')))
+
+    def test_slow_threshold(self):
+        self.profiler.configure(True, every_n=0, slow_threshold=0.05)
+        self._run_updates(1, work=lambda: sum(range(10)))
+        self.assertEqual(glob.glob(os.path.join(self.tmpdir.name, 'profile_*.json')), [])
+        self._run_updates(1, work=lambda: __import__('time').sleep(0.06))
+        self.assertEqual(len(glob.glob(os.path.join(self.tmpdir.name, 'profile_*.json'))), 1)
+
+    def test_tracemalloc_snapshot(self):
+        self.profiler.configure(True, every_n=0, tracemalloc_interval=0.001)
+        self._run_updates(1, work=lambda: __import__('time').sleep(0.01))
+        self.assertEqual(len(glob.glob(os.path.join(self.tmpdir.name, 'tracemalloc_*.txt'))), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from processors.query_processor import QueryProcessor
+from helpers import DummyTransactionService
+
+
+class TestQueryProcessor(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.service.db.initialize_defaults()
+        self.processor = QueryProcessor(self.service)
+
+    def test_format_balances_renders_every_currency(self):
+        text = QueryProcessor.format_balances({
+            'USD': {'cash': 100.0},
+            'ARS': {'cash': 1500.0, 'bank': 2500.0},
+            'EUR': {'bank': 20.0},
+        })
+        self.assertTrue(text.startswith("🏦 Banco ARS: $2,500.00"))
+        self.assertIn("💰 Total ARS: $4,000.00", text)
+        self.assertIn("💰 Total EUR: $20.00", text)
+        self.assertIn("💵 Efectivo USD: $100.00", text)
+
+    def test_balance_reply_for_new_group_shows_default_currency(self):
+        text, chart = self.processor.build_reply(1, {'type': 'query', 'query_type': 'balance'})
+        self.assertIn("💰 Total ARS: $0.00", text)
+        self.assertIsNone(chart)
+
+    def test_summary_reply_includes_chart(self):
+        db = self.service.db
+        cash = db.get_or_create_money_type('cash')
+        db.add_transaction(1, 1, 'expense', -300.0, 'Pan', db.get_or_create_category('comida'), cash, 'ARS')
+        db.add_transaction(1, 1, 'expense', -10.0, 'Taxi', db.get_or_create_category('transporte'), cash, 'USD')
+        text, chart = self.processor.build_reply(1, {'type': 'query', 'query_type': 'summary'})
+        self.assertIn("Total USD: $-10.00", text)
+        self.assertTrue(chart.getvalue().startswith(b'\x89PNG'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from datetime import timedelta
+from telegram.error import RetryAfter
+from services.rate_limiter import TokenBucket, TelegramRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refills_at_rate_up_to_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+        self.assertEqual(bucket.try_take(), 0)
+        self.assertEqual(bucket.try_take(), 0)
+        self.assertAlmostEqual(bucket.try_take(), 0.5)
+        clock.now = 10
+        self.assertEqual(bucket.tokens, 0)
+        self.assertEqual(bucket.delay(), 0)
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_block(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=1, clock=clock)
+        bucket.block(5)
+        self.assertEqual(bucket.delay(), 5)
+        clock.now = 5
+        self.assertEqual(bucket.try_take(), 0)
+
+
+class TestTelegramRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_after_flood_limit(self):
+        limiter = TelegramRateLimiter(global_rate=100, chat_rate=100, max_retries=2)
+        calls = []
+
+        async def send(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise RetryAfter(timedelta(milliseconds=20))
+            return {'message_id': 1}
+
+        result = await limiter.process_request(send, (), {'text': 'hola'}, 'sendMessage', {'chat_id': 5}, None)
+        self.assertEqual(result, {'message_id': 1})
+        self.assertEqual(len(calls), 2)
+
+    async def test_gives_up_after_max_retries(self):
+        limiter = TelegramRateLimiter(global_rate=100, chat_rate=100, max_retries=1)
+
+        async def send(**kwargs):
+            raise RetryAfter(timedelta(milliseconds=1))
+
+        with self.assertRaises(RetryAfter):
+            await limiter.process_request(send, (), {}, 'sendMessage', {'chat_id': 5}, None)
+
+    async def test_chat_action_is_dropped_when_the_chat_is_throttled(self):
+        limiter = TelegramRateLimiter(global_rate=100, chat_rate=0.01)
+        sent = []
+
+        async def send(**kwargs):
+            sent.append(kwargs)
+            return True
+
+        # The chat action does not use the reply's token
+        await limiter.process_request(send, (), {'action': 'typing'}, 'sendChatAction', {'chat_id': 5}, None)
+        for _ in range(3):
+            await limiter.process_request(send, (), {'text': 'ok'}, 'sendMessage', {'chat_id': 5}, None)
+        await limiter.process_request(send, (), {'action': 'typing'}, 'sendChatAction', {'chat_id': 5}, None)
+        self.assertEqual([list(kwargs) for kwargs in sent], [['action'], ['text'], ['text'], ['text']])
+
+    async def test_flood_limit_on_a_chat_action_pauses_only_that_chat(self):
+        limiter = TelegramRateLimiter(global_rate=100, chat_rate=100)
+
+        async def flooded(**kwargs):
+            raise RetryAfter(timedelta(seconds=30))
+
+        result = await limiter.process_request(flooded, (), {'action': 'typing'}, 'sendChatAction',
+                                               {'chat_id': 5}, None)
+        self.assertTrue(result)
+        self.assertGreater(limiter.chat_delay(5), 20)
+        self.assertEqual(limiter.chat_delay(6), 0)
+        self.assertEqual(limiter.global_bucket.delay(), 0)
+
+    def test_groups_get_the_group_rate(self):
+        limiter = TelegramRateLimiter(chat_rate=1, group_rate_per_minute=20)
+        self.assertAlmostEqual(limiter.chat_bucket(-100).rate, 20 / 60)
+        self.assertEqual(limiter.chat_bucket(100).rate, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+from services.reports import ReportService, current_month, month_end, parse_month, previous_month
+from helpers import DummyTransactionService
+
+
+class TestMonths(unittest.TestCase):
+    def test_helpers(self):
+        self.assertEqual(previous_month('2024-01'), '2023-12')
+        self.assertEqual(previous_month('2024-10'), '2024-09')
+        self.assertEqual(month_end('2024-02').day, 29)
+        self.assertEqual(parse_month('2024-5'), '2024-05')
+        self.assertIsNone(parse_month('mayo'))
+
+
+class TestReportService(unittest.TestCase):
+    def setUp(self):
+        self.service = DummyTransactionService()
+        self.db = self.service.db
+        self.reports = ReportService(self.service, cache_size=4, concurrency=2)
+        self.food = self.db.get_or_create_category('comida')
+        self.cash = self.db.get_or_create_money_type('cash')
+        self.month = current_month()
+
+    def tearDown(self):
+        self.service.router.close_all()
+
+    def spend(self, amount, group_id=10):
+        return self.db.add_transaction(1, group_id, 'expense', -amount, 'tx', self.food, self.cash)
+
+    def test_report_is_cached_until_the_group_writes(self):
+        self.spend(300.0)
+        text, chart = asyncio.run(self.reports.get(10, self.month))
+        self.assertIn("• comida: $300.00", text)
+        self.assertTrue(chart.startswith(b'\x89PNG'))
+        self.assertIs(asyncio.run(self.reports.get(10, self.month))[1], chart)
+
+        self.spend(200.0)
+        text, second = asyncio.run(self.reports.get(10, self.month))
+        self.assertIn("• comida: $500.00", text)
+        self.assertIsNot(second, chart)
+
+    def test_closed_month_survives_new_expenses(self):
+        last_month = previous_month(self.month)
+        text, chart = asyncio.run(self.reports.get(10, last_month))
+        self.assertIn("No hubo gastos", text)
+        self.assertIsNone(chart)
+        self.spend(100.0)
+        self.assertIs(asyncio.run(self.reports.get(10, last_month))[0], text)
+
+    def test_closed_month_follows_changes_to_its_transactions(self):
+        last_month = previous_month(self.month)
+        dated = month_end(last_month).strftime('%Y-%m-%d 12:00:00')
+        income = self.db.add_transaction(1, 10, 'income', 1000.0, 'sueldo', None, self.cash)
+        self.db.cursor.execute('UPDATE transactions SET timestamp = ? WHERE id = ?', (dated, income))
+        self.db.conn.commit()
+        self.assertIn("1,000.00", asyncio.run(self.reports.get(10, last_month))[0])
+
+        self.db.delete_transaction(income, 10)
+        text = asyncio.run(self.reports.get(10, last_month))[0]
+        self.assertNotIn("1,000.00", text)
+
+    def test_precompute_active_groups_and_push(self):
+        self.spend(100.0, group_id=10)
+        self.spend(100.0, group_id=11)
+        bot = AsyncMock()
+        self.assertEqual(asyncio.run(self.reports.precompute([self.month], bot)), 2)
+        self.assertEqual(sorted(call.kwargs['chat_id'] for call in bot.send_message.await_args_list), [10, 11])
+        self.assertEqual(bot.send_photo.await_count, 2)
+        self.assertEqual(set(self.reports._cache), {(10, self.month), (11, self.month)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,304 @@
+import os
+import unittest
+from database import DatabaseHandler
+from services.repository import ExpenseRepository
+
+POSTGRES_TEST_DSN = os.getenv('POSTGRES_TEST_DSN')
+
+
+class RepositoryContract:
+    """Behaviour every ExpenseRepository must share; subclasses provide make_repository()."""
+
+    def setUp(self):
+        self.repo = self.make_repository()
+
+    def tearDown(self):
+        self.repo.close()
+
+    def test_is_repository(self):
+        self.assertIsInstance(self.repo, ExpenseRepository)
+
+    def test_add_list_and_delete(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        tx_id = self.repo.add_transaction(1, 10, 'expense', -300.0, 'Pan', food, cash)
+        rows = self.repo.get_latest_transactions(10)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][:5], (tx_id, 'expense', -300.0, 'Pan', 'comida'))
+        self.assertRegex(rows[0][5], r'^\d{4}-\d{2}-\d{2} ')
+        self.assertFalse(self.repo.delete_transaction(tx_id, 11))
+        self.assertTrue(self.repo.delete_transaction(tx_id, 10))
+        self.assertEqual(self.repo.get_latest_transactions(10), [])
+
+    def test_add_transactions_in_one_batch(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        ids = self.repo.add_transactions([
+            (1, 10, 'expense', -500.0, 'Pan', food, cash, 'ARS'),
+            (1, 10, 'expense', -800.0, 'Leche', food, cash, 'ARS'),
+        ])
+        self.assertEqual(len(ids), 2)
+        self.assertEqual({row[0] for row in self.repo.get_latest_transactions(10)}, set(ids))
+        self.assertEqual([e[2] for e in self.repo.get_ledger_events(10)], ids)
+
+    def test_search_transactions(self):
+        health = self.repo.get_or_create_category('salud')
+        cash = self.repo.get_or_create_money_type('cash')
+        first = self.repo.add_transaction(1, -10, 'expense', -300.0, 'Farmacia del centro', health, cash)
+        second = self.repo.add_transaction(1, -10, 'expense', -200.0, 'Farmacia', health, cash)
+        self.repo.add_transaction(1, -10, 'expense', -100.0, 'Panadería', health, cash)
+        self.repo.add_transaction(1, 11, 'expense', -100.0, 'Farmacia', health, cash)
+
+        self.assertEqual({row[0] for row in self.repo.search_transactions(-10, ['farm'])}, {first, second})
+        self.assertEqual([row[0] for row in self.repo.search_transactions(-10, ['farmacia', 'centro'])], [first])
+        self.assertEqual([row[3] for row in self.repo.search_transactions(-10, ['panaderia'])], ['Panadería'])
+        self.assertEqual(len(self.repo.search_transactions(-10, ['farmacia'], limit=1, offset=1)), 1)
+        self.assertEqual(self.repo.search_transactions(-10, ['farmacia'], until='2000-01-01 00:00:00'), [])
+        self.assertEqual(self.repo.search_transactions(-10, []), [])
+
+        self.repo.delete_transaction(first, -10)
+        self.assertEqual([row[0] for row in self.repo.search_transactions(-10, ['farmacia'])], [second])
+
+    def test_get_or_create_is_idempotent(self):
+        self.assertEqual(self.repo.get_or_create_category('salud'), self.repo.get_or_create_category('salud'))
+        self.assertIn('salud', self.repo.get_all_categories())
+
+    def test_balances_and_clear(self):
+        bank = self.repo.get_or_create_money_type('bank')
+        exchange = self.repo.get_or_create_category('exchange')
+        tx_id = self.repo.add_transaction(1, 10, 'income', 90000.0, 'Exchange', exchange, bank, 'ARS')
+        self.repo.add_exchange_transaction(tx_id, 'USD', 'ARS', 900.0, 100.0, 90000.0)
+        self.assertEqual(self.repo.get_balances(10), {'ARS': {'bank': 90000.0}, 'USD': {'bank': -100.0}})
+        self.repo.clear_transactions(10)
+        self.assertEqual(self.repo.get_balances(10), {})
+
+    def test_dated_balances_and_changes(self):
+        cash = self.repo.get_or_create_money_type('cash')
+        self.repo.add_transaction(1, 10, 'income', 500.0, 'Sueldo', None, cash)
+        self.assertEqual(self.repo.get_balances(10, '2999-01-01 00:00:00'), {'ARS': {'cash': 500.0}})
+        self.assertEqual(self.repo.get_balances(10, '2000-01-01 00:00:00'), {})
+        self.assertEqual(self.repo.last_dated_event_id(10, '2000-01-01 00:00:00'), 0)
+        self.assertEqual(self.repo.last_dated_event_id(10, '2999-01-01 00:00:00'),
+                         self.repo.last_ledger_event_id(10))
+
+    def test_count_and_chunked_delete(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        for i in range(7):
+            tx_id = self.repo.add_transaction(1, 10, 'income', 1.0, f'tx {i}', food, cash)
+        self.repo.add_exchange_transaction(tx_id, 'USD', 'ARS', 1.0, 1.0, 1.0)
+        self.repo.add_transaction(1, 11, 'income', 1.0, 'otro grupo', food, cash)
+
+        self.assertEqual(self.repo.count_transactions(10), 7)
+        self.assertEqual(self.repo.count_transactions(10, category='comida'), 7)
+        self.assertEqual(self.repo.count_transactions(10, category='salud'), 0)
+        self.assertEqual(self.repo.delete_transactions_chunk(10, 5), 5)
+        self.assertEqual(self.repo.delete_transactions_chunk(10, 5), 2)
+        self.assertEqual(self.repo.delete_transactions_chunk(10, 5), 0)
+        self.assertEqual(self.repo.count_transactions(10), 0)
+        self.assertEqual(self.repo.count_transactions(11), 1)
+
+    def test_chunked_clear_is_journaled_once(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        for i in range(3):
+            self.repo.add_transaction(1, 10, 'income', 1.0, f'tx {i}', food, cash)
+        # What TransactionService.clear_group_in_chunks does
+        self.repo.record_ledger_event(10, 'clear', {'chunked': True})
+        while self.repo.delete_transactions_chunk(10, 2):
+            pass
+        self.repo.clear_transactions(10, journal=False)
+
+        events = [event[1] for event in self.repo.get_ledger_events(10)]
+        self.assertEqual(events.count('clear'), 1)
+
+    def test_rename_category_in_one_group(self):
+        cash = self.repo.get_or_create_money_type('cash')
+        food = self.repo.get_or_create_category('super')
+        self.repo.add_transaction(1, 10, 'expense', -300.0, 'Pan', food, cash)
+        self.repo.add_transaction(1, 11, 'expense', -50.0, 'Pan', food, cash)
+        self.repo.set_budget(10, food, 1000.0)
+        self.assertEqual(self.repo.rename_category('super', 'supermercado', 10)[0], True)
+        self.assertEqual(self.repo.rename_category('super', 'otra', 10)[0], False)
+        self.assertEqual(self.repo.rename_category('pan', 'supermercado', 10)[0], False)
+
+        renamed = self.repo.get_or_create_category('supermercado')
+        self.assertEqual(self.repo.get_group_categories(10), [(renamed, 'supermercado', 1)])
+        self.assertEqual(self.repo.get_group_categories(11), [(food, 'super', 1)])
+        self.assertEqual(self.repo.get_latest_transactions(10)[0][4], 'supermercado')
+        month = self.repo.get_latest_transactions(10)[0][5][:7]
+        self.assertEqual(self.repo.get_month_expenses(10, month), {'ARS': [('supermercado', 300.0)]})
+        self.assertEqual(self.repo.get_month_expenses(11, month), {'ARS': [('super', 50.0)]})
+        self.assertEqual(self.repo.get_budgets(10), [('supermercado', 'ARS', 1000.0, 300.0)])
+
+    def test_ledger_journals_changes(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        tx_id = self.repo.add_transaction(1, 10, 'income', 900.0, 'Cambio', food, cash)
+        self.repo.add_exchange_transaction(tx_id, 'USD', 'ARS', 900.0, 1.0, 900.0)
+        self.repo.rename_category('comida', 'alimentos', 10)
+        self.repo.delete_transaction(tx_id, 10)
+        self.repo.add_transaction(1, 11, 'income', 1.0, 'otro grupo', food, cash)
+
+        events = self.repo.get_ledger_events(10)
+        self.assertEqual([event[1] for event in events], ['insert', 'exchange', 'rename', 'delete'])
+        self.assertEqual(events[0][3]['money_type'], 'cash')
+        self.assertEqual(events[1][3]['source_amount'], 1.0)
+        self.assertEqual(events[3][3]['exchange']['source_currency'], 'USD')
+
+        restored = self.repo.restore_transaction(10, events[3][3], undo_of=events[3][0])
+        self.assertEqual(restored, tx_id)
+        self.assertEqual(self.repo.get_balances(10), {'ARS': {'cash': 900.0}, 'USD': {'cash': -1.0}})
+        newest = self.repo.get_ledger_events(10, newest_first=True, limit=1)[0]
+        self.assertEqual((newest[1], newest[4]), ('insert', events[3][0]))
+
+        self.repo.clear_transactions(10)
+        self.assertEqual(self.repo.get_ledger_events(10, newest_first=True, limit=1)[0][1], 'clear')
+
+    def test_snapshots(self):
+        self.assertEqual(self.repo.last_ledger_event_id(10), 0)
+        self.assertIsNone(self.repo.get_latest_snapshot(10))
+        first = self.repo.record_ledger_event(10, 'clear', {})
+        second = self.repo.record_ledger_event(10, 'clear', {})
+        self.repo.save_snapshot(10, first, {'balances': {'ARS': {'cash': 1.0}}})
+        self.repo.save_snapshot(10, second, {'balances': {}})
+        self.assertEqual(self.repo.last_ledger_event_id(10), second)
+        self.assertEqual(self.repo.last_ledger_event_id(10, until='2000-01-01 00:00:00'), 0)
+        self.assertEqual(self.repo.get_latest_snapshot(10), (second, {'balances': {}}))
+        self.assertEqual(self.repo.get_latest_snapshot(10, until_id=first)[1], {'balances': {'ARS': {'cash': 1.0}}})
+        self.assertEqual([e[0] for e in self.repo.get_ledger_events(10, after_id=first)], [second])
+
+    def test_processed_updates(self):
+        self.assertIsNone(self.repo.get_processed_update(500))
+        self.repo.record_processed_update(500, 10, 7, 'pending')
+        self.assertEqual(self.repo.get_processed_update(500), ('pending', {}))
+        self.repo.record_processed_update(500, 10, 7, 'transaction', {'reply': 'ok'})
+        self.assertEqual(self.repo.get_processed_update(500), ('transaction', {'reply': 'ok'}))
+        self.assertEqual(self.repo.prune_processed_updates('2000-01-01 00:00:00'), 0)
+        self.assertEqual(self.repo.prune_processed_updates('2999-01-01 00:00:00'), 1)
+        self.assertIsNone(self.repo.get_processed_update(500))
+
+    def test_budgets_follow_writes(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        self.repo.set_budget(10, food, 1000.0)
+        self.assertEqual(self.repo.get_budget_status(10, food, 'ARS'), (1000.0, 0.0))
+        tx_id = self.repo.add_transaction(1, 10, 'expense', -300.0, 'Pan', food, cash)
+        self.repo.add_transactions([(1, 10, 'expense', -200.0, 'Leche', food, cash, 'ARS'),
+                                    (1, 10, 'income', 50.0, 'Vuelto', food, cash, 'ARS')])
+        self.repo.add_transaction(1, 11, 'expense', -999.0, 'Otro grupo', food, cash)
+        self.assertEqual(self.repo.get_budget_status(10, food, 'ARS'), (1000.0, 500.0))
+        self.assertIsNone(self.repo.get_budget_status(10, food, 'USD'))
+
+        self.repo.delete_transaction(tx_id, 10)
+        self.assertEqual(self.repo.get_budgets(10), [('comida', 'ARS', 1000.0, 200.0)])
+        self.repo.delete_transactions_chunk(10, 5)
+        self.assertEqual(self.repo.get_budget_status(10, food, 'ARS'), (1000.0, 0.0))
+
+        self.repo.set_budget(10, food, 0)
+        self.assertEqual(self.repo.get_budgets(10), [])
+
+    def test_group_categories_follow_writes(self):
+        food = self.repo.get_or_create_category('comida')
+        taxi = self.repo.get_or_create_category('taxi')
+        cash = self.repo.get_or_create_money_type('cash')
+        tx_id = self.repo.add_transaction(1, 10, 'expense', -300.0, 'Pan', food, cash)
+        self.repo.add_transactions([(1, 10, 'expense', -200.0, 'Leche', food, cash, 'ARS'),
+                                    (1, 10, 'expense', -50.0, 'Viaje', taxi, cash, 'ARS')])
+        self.repo.add_transaction(1, 11, 'expense', -999.0, 'Otro grupo', taxi, cash)
+        self.assertEqual(self.repo.get_group_categories(10), [(food, 'comida', 2), (taxi, 'taxi', 1)])
+        self.assertEqual(self.repo.get_group_categories(10, limit=1), [(food, 'comida', 2)])
+
+        self.repo.delete_transaction(tx_id, 10)
+        self.repo.add_group_category(10, self.repo.get_or_create_category('viajes'))
+        self.repo.add_group_category(10, taxi)
+        self.assertEqual([row[1:] for row in self.repo.get_group_categories(10)],
+                         [('comida', 1), ('taxi', 1), ('viajes', 0)])
+        self.repo.delete_transactions_chunk(10, 5)
+        self.assertEqual([row[2] for row in self.repo.get_group_categories(10)], [0, 0, 0])
+        self.assertEqual(self.repo.get_group_categories(11), [(taxi, 'taxi', 1)])
+
+    def test_expense_history(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        first = self.repo.add_transaction(1, 10, 'expense', -300.0, 'Pan', food, cash)
+        self.repo.add_transaction(1, 10, 'income', 100.0, 'Sueldo', food, cash)
+        second = self.repo.add_transaction(1, 10, 'expense', -5.0, 'Taxi', None, cash, 'USD')
+        self.repo.add_transaction(1, 11, 'expense', -999.0, 'Otro grupo', food, cash)
+        history = self.repo.get_expense_history(10)
+        self.assertEqual([(row[0], row[2], row[3], row[4]) for row in history],
+                         [(first, 300.0, food, 'ARS'), (second, 5.0, None, 'USD')])
+        self.assertRegex(history[0][1], r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+    def test_month_expenses_and_active_groups(self):
+        food = self.repo.get_or_create_category('comida')
+        cash = self.repo.get_or_create_money_type('cash')
+        self.repo.add_transaction(1, 10, 'expense', -300.0, 'Pan', food, cash)
+        self.repo.add_transaction(1, 10, 'expense', -5.0, 'Taxi', food, cash, 'USD')
+        self.repo.add_transaction(1, 11, 'income', 100.0, 'Sueldo', food, cash)
+        month = self.repo.get_latest_transactions(10)[0][5][:7]
+        self.assertEqual(self.repo.get_month_expenses(10, month), {'ARS': [('comida', 300.0)], 'USD': [('comida', 5.0)]})
+        self.assertEqual(self.repo.get_month_expenses(10, '2000-01'), {})
+        self.assertEqual(self.repo.get_active_groups('2000-01-01 00:00:00'), [10, 11])
+        self.assertEqual(self.repo.get_active_groups('2999-01-01 00:00:00'), [])
+
+    def test_exchange_rates(self):
+        cash = self.repo.get_or_create_money_type('cash')
+        exchange = self.repo.get_or_create_category('exchange')
+        tx_id = self.repo.add_transaction(1, 10, 'income', 100.0, 'Exchange', exchange, cash, 'USD')
+        self.repo.add_exchange_transaction(tx_id, 'ARS', 'USD', 0.0, 120000.0, 100.0)
+        self.repo.add_exchange_rate(10, 'EUR', 'ARS', 1300.0)
+        self.repo.add_exchange_rate(11, 'EUR', 'ARS', 1.0)
+        rates = self.repo.get_exchange_rates(10)
+        self.assertEqual([(source, target) for _, source, target, _ in rates], [('ARS', 'USD'), ('EUR', 'ARS')])
+        self.assertAlmostEqual(rates[0][3], 100.0 / 120000.0)
+        self.assertRegex(rates[0][0], r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+        self.assertEqual(self.repo.get_category_month_totals(10), [])
+
+    def test_inbox(self):
+        first = self.repo.add_inbox_message(1, 10, {'update_id': 1})
+        self.assertIsNone(self.repo.add_inbox_message(1, 10, {'update_id': 1}))
+        second = self.repo.add_inbox_message(2, 10, {'update_id': 2}, status='processing', owner='b')
+        self.assertEqual(self.repo.claim_inbox_messages(5, owner='a'), [(first, {'update_id': 1}, 1)])
+        self.assertEqual(self.repo.claim_inbox_messages(5), [])
+        self.assertEqual(self.repo.count_inbox_messages('processing'), 2)
+
+        # Only the owner's messages, or the ones whose lease ran out, are requeued
+        self.assertEqual(self.repo.requeue_inbox_messages('2000-01-01 00:00:00', owner='a'), 1)
+        self.assertEqual(self.repo.requeue_inbox_messages('2000-01-01 00:00:00'), 0)
+        self.assertEqual(self.repo.requeue_inbox_messages('2999-01-01 00:00:00'), 1)
+        self.repo.set_inbox_status(second, 'failed')
+        self.repo.complete_inbox_message(first)
+        self.assertEqual(self.repo.count_inbox_messages(), 0)
+        self.assertEqual(self.repo.count_inbox_messages('failed'), 1)
+
+    def test_inbox_claims_by_shard(self):
+        odd = self.repo.add_inbox_message(1, 10, {'update_id': 1}, shard_key=7)
+        even = self.repo.add_inbox_message(2, 11, {'update_id': 2}, shard_key=4)
+        # Messages queued without a key belong to the first worker
+        unkeyed = self.repo.add_inbox_message(3, 12, {'update_id': 3})
+        self.assertEqual([row[0] for row in self.repo.claim_inbox_messages(5, 'b', shard=(1, 2))], [odd])
+        self.assertEqual([row[0] for row in self.repo.claim_inbox_messages(5, 'a', shard=(0, 2))], [even, unkeyed])
+
+
+class TestSqliteRepository(RepositoryContract, unittest.TestCase):
+    def make_repository(self):
+        return DatabaseHandler(db_name=':memory:')
+
+
+@unittest.skipUnless(POSTGRES_TEST_DSN, "set POSTGRES_TEST_DSN to run against a local PostgreSQL")
+class TestPostgresRepository(RepositoryContract, unittest.TestCase):
+    def make_repository(self):
+        from services.postgres_repository import PostgresRepository
+        repo = PostgresRepository(POSTGRES_TEST_DSN, max_size=2)
+        with repo.pool.connection() as conn:
+            conn.execute(
+                'TRUNCATE exchange_transactions, transactions, categories, money_types, '
+                'ledger_events, balance_snapshots, processed_updates, inbox, '
+                'budgets, category_month_totals, manual_exchange_rates, group_categories RESTART IDENTITY CASCADE'
+            )
+        return repo
+
+
+if __name__ == '__main__':
+    unittest.main()
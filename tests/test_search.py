@@ -0,0 +1,25 @@
+import unittest
+from services.search import parse_bound, parse_search_args, search_terms
+
+
+class TestSearchArgs(unittest.TestCase):
+    def test_terms_are_normalized(self):
+        self.assertEqual(search_terms('Farmacia "Del" Día!'), ['farmacia', 'del', 'dia'])
+
+    def test_bounds(self):
+        self.assertEqual(parse_bound('2024-03'), '2024-03-01 00:00:00')
+        self.assertEqual(parse_bound('2024-02', end=True), '2024-02-29 23:59:59')
+        self.assertEqual(parse_bound('2024-03-15', end=True), '2024-03-15 23:59:59')
+        self.assertIsNone(parse_bound('marzo'))
+
+    def test_trailing_dates(self):
+        self.assertEqual(parse_search_args(['farmacia', '2024-03']), (['farmacia'], '2024-03-01 00:00:00', None))
+        self.assertEqual(
+            parse_search_args(['nafta', 'ypf', '2024-01-01', '2024-03']),
+            (['nafta', 'ypf'], '2024-01-01 00:00:00', '2024-03-31 23:59:59')
+        )
+        self.assertEqual(parse_search_args([]), ([], None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from database import DatabaseHandler
+from migrations.split_by_group import migrate
+from services.shard_router import ShardRouter
+
+class TestShardRouter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.shard_dir = os.path.join(self.tmpdir.name, 'shards')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_single_layout_shares_one_database(self):
+        router = ShardRouter(db_name=':memory:')
+        self.assertIs(router.get(1), router.get(2))
+        router.close_all()
+
+    def test_group_layout_isolates_groups(self):
+        router = ShardRouter('group', shard_dir=self.shard_dir)
+        router.get(1).add_transaction(1, 1, 'income', 100.0, 'Sueldo', 1, 1)
+        self.assertIsNot(router.get(1), router.get(-2))
+        self.assertEqual(router.get(-2).get_latest_transactions(1), [])
+        self.assertTrue(os.path.exists(os.path.join(self.shard_dir, 'group_-2.db')))
+        router.close_all()
+
+    def test_lru_closes_least_recently_used(self):
+        router = ShardRouter('group', shard_dir=self.shard_dir, cache_size=2)
+        first = router.get(1)
+        router.get(2)
+        router.get(1)
+        router.get(3)
+        self.assertIs(router.get(1), first)
+        self.assertEqual(len(router._shards), 2)
+        router.close_all()
+
+    def test_leased_shard_is_not_evicted(self):
+        router = ShardRouter('group', shard_dir=self.shard_dir, cache_size=1)
+        with router.lease(1) as db:
+            router.get(2)
+            router.get(3)
+            # Still open: other groups were opened while it was held
+            db.add_transaction(1, 1, 'income', 1.0, 'tx', 1, 1)
+            self.assertIs(router.get(1), db)
+        router.get(2)
+        self.assertEqual(list(router._shards), [os.path.join(self.shard_dir, 'group_2.db')])
+        router.close_all()
+
+    def test_bucket_layout_groups_share_files(self):
+        router = ShardRouter('bucket', shard_dir=self.shard_dir, buckets=2)
+        for group_id in range(10):
+            router.get(group_id)
+        self.assertLessEqual(len(os.listdir(self.shard_dir)), 2 * 3)  # db plus wal/shm files
+        self.assertFalse(router.drop_group(1))
+        router.close_all()
+
+    def test_each_visits_every_shard(self):
+        router = ShardRouter('group', shard_dir=self.shard_dir, cache_size=1)
+        for group_id in (1, 2, 3):
+            router.get(group_id).add_transaction(1, group_id, 'income', 1.0, 'tx', 1, 1)
+        groups = [group for db in router.each() for group in db.get_active_groups('2000-01-01 00:00:00')]
+        self.assertEqual(groups, [1, 2, 3])
+        router.close_all()
+
+    def test_drop_and_archive_group(self):
+        router = ShardRouter('group', shard_dir=self.shard_dir)
+        router.get(1).add_transaction(1, 1, 'income', 100.0, 'Sueldo', 1, 1)
+        archive = os.path.join(self.tmpdir.name, 'archive')
+        self.assertTrue(router.drop_group(1, archive_dir=archive))
+        self.assertIn('group_1.db', os.listdir(archive))
+        self.assertEqual(router.get(1).get_latest_transactions(1), [])
+        router.close_all()
+
+    def test_split_migration(self):
+        source_path = os.path.join(self.tmpdir.name, 'expenses.db')
+        source = DatabaseHandler(source_path)
+        cash = source.get_or_create_money_type('cash')
+        food = source.get_or_create_category('comida')
+        source.add_transaction(1, 10, 'expense', -50.0, 'Pan', food, cash)
+        tx_id = source.add_transaction(1, 20, 'income', 9000.0, 'Exchange', food, cash, 'ARS')
+        source.add_exchange_transaction(tx_id, 'USD', 'ARS', 900.0, 10.0, 9000.0)
+        source.close()
+
+        migrate(source_path, 'group', self.shard_dir)
+
+        router = ShardRouter('group', shard_dir=self.shard_dir)
+        self.assertEqual(router.get(10).get_balances(10), {'ARS': {'cash': -50.0}})
+        self.assertEqual(router.get(20).get_balances(20), {'ARS': {'cash': 9000.0}, 'USD': {'cash': -10.0}})
+        self.assertEqual(router.get(20).get_latest_transactions(10), [])
+        router.close_all()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+from unittest.mock import Mock, patch
+from telegram.ext import Application
+import config
+from services.analytics import AnalyticsService
+from services.reports import ReportService
+from services.supervisor import ShardSupervisor, global_job_hooks, shard_for
+from helpers import DummyTransactionService
+
+class TestShardFor(unittest.TestCase):
+    def test_stable_and_in_range(self):
+        for chat_id in (-1001234567890, -42, 0, 7, 123456789):
+            shard = shard_for(chat_id, 4)
+            self.assertIn(shard, range(4))
+            self.assertEqual(shard, shard_for(chat_id, 4))
+
+    def test_spreads_chats(self):
+        shards = {shard_for(chat_id, 4) for chat_id in range(-100, 100)}
+        self.assertEqual(shards, {0, 1, 2, 3})
+
+class TestShardSupervisor(unittest.TestCase):
+    def test_forward_routes_by_chat(self):
+        supervisor = ShardSupervisor(3)
+        update = Mock()
+        update.effective_chat.id = -1009876
+        update.to_dict.return_value = {'update_id': 1}
+        asyncio.run(supervisor.forward(update, None))
+
+        target = shard_for(-1009876, 3)
+        self.assertEqual(supervisor.queues[target].get(timeout=1), {'update_id': 1})
+        for index, queue in enumerate(supervisor.queues):
+            if index != target:
+                self.assertTrue(queue.empty())
+
+
+class TestGlobalJobs(unittest.TestCase):
+    def scheduled(self, worker_count):
+        """Names of the jobs scheduled by each of `worker_count` worker applications."""
+        service = DummyTransactionService()
+        service.reports = ReportService(service)
+        service.analytics = AnalyticsService(service)
+
+        async def build(index):
+            application = Application.builder().token('1:TEST').build()
+            for hook in global_job_hooks(service, f'worker-{index}'):
+                await hook(application)
+            return [job.name for job in application.job_queue.jobs()]
+
+        async def run():
+            return [await build(index) for index in range(worker_count)]
+
+        try:
+            return asyncio.run(run())
+        finally:
+            service.router.close_all()
+
+    @patch.object(config, 'REPORT_PRECOMPUTE_TIME', '04:00')
+    @patch.object(config, 'WEEKLY_DIGEST_TIME', '09:00')
+    def test_only_the_first_worker_schedules_them(self):
+        self.assertEqual(self.scheduled(2), [['report-precompute', 'weekly-digest'], []])
+
+    def test_single_process_schedules_them(self):
+        service = Mock()
+        self.assertEqual(global_job_hooks(service, 'main'),
+                         [service.reports.post_init, service.analytics.post_init])
+
+if __name__ == '__main__':
+    unittest.main()
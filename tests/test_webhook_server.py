@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from aiohttp.test_utils import TestClient, TestServer
+from telegram.ext import Application
+from services.webhook_server import WebhookServer, SECRET_HEADER
+
+UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1, 'date': 0, 'text': 'resumen',
+        'chat': {'id': 456, 'type': 'group', 'title': 'Casa'},
+        'from': {'id': 123, 'is_bot': False, 'first_name': 'User'},
+    },
+}
+
+class TestWebhookServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.application = (
+            Application.builder().token('123:TEST').updater(None)
+            .update_queue(asyncio.Queue(maxsize=1)).build()
+        )
+        server = WebhookServer(self.application, secret_token='s3cret')
+        self.client = TestClient(TestServer(server.build_app()))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def test_rejects_invalid_secret(self):
+        response = await self.client.post('/telegram', json=UPDATE, headers={SECRET_HEADER: 'wrong'})
+        self.assertEqual(response.status, 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_enqueues_update(self):
+        response = await self.client.post('/telegram', json=UPDATE, headers={SECRET_HEADER: 's3cret'})
+        self.assertEqual(response.status, 200)
+        update = self.application.update_queue.get_nowait()
+        self.assertEqual(update.message.chat.id, 456)
+
+    async def test_full_queue_asks_telegram_to_retry(self):
+        headers = {SECRET_HEADER: 's3cret'}
+        await self.client.post('/telegram', json=UPDATE, headers=headers)
+        response = await self.client.post('/telegram', json=UPDATE, headers=headers)
+        self.assertEqual(response.status, 503)
+
+    async def test_health_reports_queue(self):
+        response = await self.client.get('/health')
+        body = await response.json()
+        # The application was never started
+        self.assertEqual(response.status, 503)
+        self.assertEqual(body['queue_max_size'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,55 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
+import config
 
 # Create logs directory if it doesn't exist
 if not os.path.exists('logs'):
     os.makedirs('logs')
 
+# Attributes every LogRecord has; anything else was passed through `extra=` and is kept as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keep roughly 1 in `rate` DEBUG records so high-volume debug lines stay cheap."""
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(rate, 1)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        return random.random() < 1 / self.rate
+
+
 # Set up logger
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(config.LOG_LEVEL)
 
 # Create formatter
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -20,20 +60,25 @@ file_handler = RotatingFileHandler(
     maxBytes=1024*1024,  # 1MB
     backupCount=5
 )
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
+file_handler.setFormatter(JsonFormatter())
 
 # Create console handler
 console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(formatter)
 
+# The event loop only enqueues records; file and console I/O happen on the listener thread
+log_queue = queue.SimpleQueue()
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(DebugSamplingFilter(config.LOG_DEBUG_SAMPLE_RATE))
+listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
 # Add handlers to logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+logger.addHandler(queue_handler)
 
 # Filter out httpx polling logs
 logging.getLogger('httpx').setLevel(logging.WARNING)
 # Filter out telegram polling logs
 logging.getLogger('telegram.ext._application').setLevel(logging.WARNING)
-logging.getLogger('telegram.ext._updater').setLevel(logging.WARNING) 
\ No newline at end of file
+logging.getLogger('telegram.ext._updater').setLevel(logging.WARNING)
@@ -0,0 +1,226 @@
+import asyncio
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from utils.logger import logger
+
+# Latency buckets in seconds, wide enough to cover SQLite lookups and slow LLM generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# When set, every finished timer also appends (stage, seconds) here; used to attach stage timings to profiles
+_stage_collector: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('stage_collector', default=None)
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the matching bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Thread-safe registry of counters and latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block; failures are also counted in errors_total."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("bot_errors_total", metric=name, **labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(name, elapsed, **labels)
+            stages = _stage_collector.get()
+            if stages is not None:
+                stages.append((name + _format_labels(_label_key(labels)), elapsed))
+
+    def timed(self, name: str, **labels):
+        """Decorator version of timer() that works for both sync and async functions."""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(hist.buckets, hist.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, dict]]:
+        """Return count/avg/p50/p95 per histogram series, for human-readable reports."""
+        result = {}
+        with self._lock:
+            for name, series in self._histograms.items():
+                result[name] = {
+                    ",".join(f"{k}={v}" for k, v in key) or "-": {
+                        'count': hist.count,
+                        'avg': hist.sum / hist.count if hist.count else 0.0,
+                        'p50': hist.quantile(0.5),
+                        'p95': hist.quantile(0.95),
+                    }
+                    for key, hist in series.items()
+                }
+        return result
+
+    def counters(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {",".join(f"{k}={v}" for k, v in key) or "-": value for key, value in series.items()}
+                for name, series in self._counters.items()
+            }
+
+
+@contextmanager
+def collect_stages():
+    """Collect the timings of every metrics timer that finishes inside the block."""
+    stages: List[Tuple[str, float]] = []
+    token = _stage_collector.set(stages)
+    try:
+        yield stages
+    finally:
+        _stage_collector.reset(token)
+
+
+def instrument_methods(metric_name: str):
+    """Class decorator that times every public method under `metric_name{method=...}`."""
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') or not callable(value):
+                continue
+            setattr(cls, attr, metrics.timed(metric_name, method=attr)(value))
+        return cls
+    return decorator
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; keep them out of the bot log
+        pass
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread so scrapes never touch the event loop."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Metrics server listening on http://{host}:{port}/metrics")
+    return server
+
+
+metrics = MetricsRegistry()
+metrics.describe('bot_update_seconds', 'Time spent handling an incoming update')
+metrics.describe('bot_updates_total', 'Handled updates by outcome')
+metrics.describe('bot_llm_request_seconds', 'Latency of Ollama generate calls')
+metrics.describe('bot_db_query_seconds', 'Latency of DatabaseHandler methods')
+metrics.describe('bot_chart_render_seconds', 'Time spent rendering summary charts')
+metrics.describe('bot_telegram_request_seconds', 'Latency of Telegram Bot API calls')
+metrics.describe('bot_errors_total', 'Failures inside timed sections')
@@ -0,0 +1,153 @@
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+from utils.logger import logger
+from utils.metrics import collect_stages
+
+
+class UpdateProfiler:
+    """
+    Opt-in cProfile/tracemalloc hook around update processing.
+
+    Callers must check `enabled` before entering `profile()`, so a disabled
+    profiler costs a single attribute lookup per update.
+    """
+
+    def __init__(self, output_dir: str = 'logs'):
+        self.output_dir = output_dir
+        self.enabled = False
+        self.every_n = 0
+        self.slow_threshold = 0.0
+        self.tracemalloc_interval = 0.0
+        self._seen = 0
+        self._active = False
+        self._last_snapshot_at = 0.0
+        self._previous_snapshot = None
+
+    def configure(self, enabled: bool, every_n: int = 100, slow_threshold: float = 0.0,
+                  tracemalloc_interval: float = 0.0) -> None:
+        self.every_n = max(every_n, 0)
+        self.slow_threshold = max(slow_threshold, 0.0)
+        self.tracemalloc_interval = max(tracemalloc_interval, 0.0)
+        if enabled:
+            self.enable()
+        else:
+            self.disable()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._seen = 0
+        if self.tracemalloc_interval and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._last_snapshot_at = time.monotonic()
+        logger.info(
+            f"Profiler enabled (every_n={self.every_n}, slow_threshold={self.slow_threshold}s, "
+            f"tracemalloc_interval={self.tracemalloc_interval}s)"
+        )
+
+    def disable(self) -> None:
+        was_enabled = self.enabled
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._previous_snapshot = None
+        if was_enabled:
+            logger.info("Profiler disabled")
+
+    def status(self) -> str:
+        if not self.enabled:
+            return "desactivado"
+        parts = []
+        if self.every_n:
+            parts.append(f"1 de cada {self.every_n} updates")
+        if self.slow_threshold:
+            parts.append(f"updates de más de {self.slow_threshold:g}s")
+        if self.tracemalloc_interval:
+            parts.append(f"snapshot de memoria cada {self.tracemalloc_interval:g}s")
+        return "activado (" + ", ".join(parts or ["sin criterios"]) + ")"
+
+    @asynccontextmanager
+    async def profile(self, update_id: int):
+        self._seen += 1
+        sampled = bool(self.every_n) and self._seen % self.every_n == 0
+        # A slow update can only be detected after the fact, so that mode profiles every update
+        wants_profile = (sampled or self.slow_threshold > 0) and not self._active
+        profile = cProfile.Profile() if wants_profile else None
+
+        start = time.perf_counter()
+        with collect_stages() as stages:
+            if profile:
+                self._active = True
+                profile.enable()
+            try:
+                yield
+            finally:
+                if profile:
+                    profile.disable()
+                    self._active = False
+                elapsed = time.perf_counter() - start
+
+                reason = None
+                if sampled:
+                    reason = 'sampled'
+                elif self.slow_threshold and elapsed >= self.slow_threshold:
+                    reason = 'slow'
+                if profile and reason:
+                    await asyncio.to_thread(self._dump_profile, update_id, profile, elapsed, reason, list(stages))
+
+        if self.tracemalloc_interval and time.monotonic() - self._last_snapshot_at >= self.tracemalloc_interval:
+            self._last_snapshot_at = time.monotonic()
+            await asyncio.to_thread(self._dump_tracemalloc, update_id)
+
+    def _base_path(self, kind: str, update_id: int) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return os.path.join(self.output_dir, f"{kind}_{timestamp}_update{update_id}")
+
+    def _dump_profile(self, update_id: int, profile: cProfile.Profile, elapsed: float,
+                      reason: str, stages: List[Tuple[str, float]]) -> None:
+        base = self._base_path('profile', update_id)
+        profile.dump_stats(base + '.prof')
+
+        top = io.StringIO()
+        pstats.Stats(profile, stream=top).sort_stats('cumulative').print_stats(25)
+        with open(base + '.json', 'w') as f:
+            json.dump({
+                'update_id': update_id,
+                'reason': reason,
+                'elapsed_seconds': elapsed,
+                'stages': [{'stage': name, 'seconds': seconds} for name, seconds in stages],
+                'top_functions': top.getvalue(),
+            }, f, indent=2)
+        logger.info(f"Profiled update {update_id} ({reason}, {elapsed:.3f}s) → {base}.prof")
+
+    def _dump_tracemalloc(self, update_id: int) -> None:
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        path = self._base_path('tracemalloc', update_id) + '.txt'
+        with open(path, 'w') as f:
+            f.write(f"update_id={update_id} current={current} peak={peak}\n\nTop allocations:\n")
+            for stat in snapshot.statistics('lineno')[:30]:
+                f.write(f"{stat}\n")
+            if self._previous_snapshot is not None:
+                f.write("\nGrowth since previous snapshot:\n")
+                for stat in snapshot.compare_to(self._previous_snapshot, 'lineno')[:30]:
+                    f.write(f"{stat}\n")
+        self._previous_snapshot = snapshot
+        logger.info(f"Wrote tracemalloc snapshot → {path}")
+
+
+profiler = UpdateProfiler()